@@ -1,13 +1,21 @@
+import logging
 import sys
 import os
-from flask import Flask, render_template
+import time
+from flask import Flask, render_template, request, g, Response
 
 # Ajouter les chemins nécessaires au PYTHONPATH
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "backend")))
 
 # Importer le Blueprint des routes
+from backend.config.constants import LOG_LEVEL, CATALOGUE_REFRESH_INTERVAL
 from backend.routes.api_routes import api_bp
+from backend.services.catalogue_refresher import start_catalogue_refresher
+from backend.utils.metrics import get_metrics_text, http_requests, http_request_duration
+
+# Les messages DEBUG (données reçues, réponses du système expert, timings) ne sont formatés qu'avec LOG_LEVEL=DEBUG
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s")
 
 # Création de l'application Flask
 app = Flask(__name__, template_folder='frontend/templates')
@@ -15,6 +23,23 @@ app = Flask(__name__, template_folder='frontend/templates')
 # Enregistrer le Blueprint pour les routes API
 app.register_blueprint(api_bp, url_prefix='/api')
 
+# Rafraîchir le catalogue en arrière-plan : les requêtes gardent l'ancienne version jusqu'à ce que la nouvelle soit prête
+if CATALOGUE_REFRESH_INTERVAL > 0:
+    start_catalogue_refresher()
+
+# Compte et chronomètre chaque requête, par route (et non par URL, pour borner le nombre de séries)
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    http_requests.inc(endpoint, str(response.status_code))
+    if "request_start" in g:
+        http_request_duration.observe(time.perf_counter() - g.request_start, endpoint)
+    return response
+
 # Route pour le frontend
 @app.route('/')
 def home():
@@ -24,6 +49,11 @@ def home():
 def health_check():
     return {"status": "ok"}, 200
 
+@app.route('/metrics')
+def metrics():
+    # Compteurs et histogrammes du worker, au format texte de Prometheus
+    return Response(get_metrics_text(), mimetype="text/plain; version=0.0.4")
+
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -6,13 +6,16 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # .env file path
 ENV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), ".env"))
 
-# Path to the cache directory and cache file
-CACHE_DIR = os.path.join(BASE_DIR, "data")
+# Path to the cache directory and cache file (the directory can be moved, e.g. for benchmarks)
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "data"))
 CACHE_FILE = "movies_cache.json"
 CACHE_PATH = os.path.join(CACHE_DIR, CACHE_FILE)
+# Binary snapshot of the cache, memory-mapped by the workers (python -m backend.utils.catalogue_snapshot)
+CATALOGUE_SNAPSHOT_PATH = os.path.join(CACHE_DIR, "movies_cache.snapshot")
+CATALOGUE_SNAPSHOT_ENABLED = os.getenv("CATALOGUE_SNAPSHOT_ENABLED", "1") == "1"
 
-# API base URL and endpoint for popular movies
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
+# API base URL and endpoint for popular movies (the base URL can point to a local stub server)
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
 POPULAR_MOVIES_URL = f"{TMDB_BASE_URL}/movie/popular"
 SEARCH_MOVIE_URL = f"{TMDB_BASE_URL}/search/movie"
 DISCOVER_MOVIES_URL = f"{TMDB_BASE_URL}/discover/movie"
@@ -21,6 +24,105 @@ DISCOVER_MOVIES_URL = f"{TMDB_BASE_URL}/discover/movie"
 DEFAULT_LANGUAGE = "fr-FR"  # French
 DEFAULT_REGION = "FR"       # France
 
+# TMDB client: shared keep-alive session, rate limit (token bucket) and retries
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", "40"))  # Requests per second
+TMDB_RATE_BURST = int(os.getenv("TMDB_RATE_BURST", "20"))  # Requests allowed at once
+TMDB_MAX_CONCURRENCY = int(os.getenv("TMDB_MAX_CONCURRENCY", "8"))  # Parallel requests
+TMDB_MAX_RETRIES = int(os.getenv("TMDB_MAX_RETRIES", "5"))  # Retries on 429, 5xx and connection errors
+TMDB_TIMEOUT = float(os.getenv("TMDB_TIMEOUT", "10"))  # Seconds per request
+TMDB_RESULTS_PER_PAGE = 20
+POPULAR_CHECKPOINT_PATH = os.path.join(CACHE_DIR, "popular_checkpoint.jsonl")
+# TMDB responses shared by the workers and kept across restarts (SQLite): served fresh for the TTL (or less if the
+# response's Cache-Control asks for it), then served stale for TMDB_RESPONSE_CACHE_STALE seconds while they are
+# revalidated in the background with conditional requests (ETag / Last-Modified)
+TMDB_RESPONSE_CACHE_ENABLED = os.getenv("TMDB_RESPONSE_CACHE_ENABLED", "1") == "1"
+TMDB_RESPONSE_CACHE_PATH = os.path.join(CACHE_DIR, "tmdb_responses.sqlite3")
+TMDB_RESPONSE_CACHE_SIZE = int(os.getenv("TMDB_RESPONSE_CACHE_SIZE", "20000"))  # Cached responses
+TMDB_RESPONSE_CACHE_TTL = float(os.getenv("TMDB_RESPONSE_CACHE_TTL", "3600"))  # Seconds
+TMDB_RESPONSE_CACHE_STALE = float(os.getenv("TMDB_RESPONSE_CACHE_STALE", "86400"))  # Seconds
+
+# Background catalogue refresh (0 disables it): every interval, one worker fetches the popular movies, writes the
+# new and changed ones to the cache and recompiles the snapshot; every worker reloads the new version off the
+# request path (they check the cache version every CATALOGUE_WATCH_INTERVAL seconds)
+CATALOGUE_REFRESH_INTERVAL = float(os.getenv("CATALOGUE_REFRESH_INTERVAL", "0"))  # Seconds
+CATALOGUE_REFRESH_MOVIES = int(os.getenv("CATALOGUE_REFRESH_MOVIES", "1000"))  # Popular movies fetched
+CATALOGUE_WATCH_INTERVAL = float(os.getenv("CATALOGUE_WATCH_INTERVAL", "5"))  # Seconds
+CATALOGUE_REFRESH_LOCK_PATH = os.path.join(CACHE_DIR, "catalogue_refresh.lock")
+CATALOGUE_REFRESH_STATE_PATH = os.path.join(CACHE_DIR, "catalogue_refresh.json")
+REFRESH_CHECKPOINT_PATH = os.path.join(CACHE_DIR, "refresh_checkpoint.jsonl")
+
+# Catalogue growth from /discover/movie, by release year and genre (python -m backend.services.discover_crawler)
+DISCOVER_GENRE_IDS = [28, 12, 16, 35, 80, 99, 18, 10751, 14, 36, 27, 10402, 9648, 10749, 878, 10770, 53, 10752, 37]
+DISCOVER_MAX_PAGES = 500  # TMDB returns at most 500 pages per query; larger shards are split by date range
+DISCOVER_FLUSH_SIZE = int(os.getenv("DISCOVER_FLUSH_SIZE", "5000"))  # Movies buffered between two cache writes
+DISCOVER_CHECKPOINT_PATH = os.path.join(CACHE_DIR, "discover_checkpoint.jsonl")
+
 
 EXPERT_SYSTEM_LISP_PATH = os.path.join(BASE_DIR, "expert_system", "expert_system.lisp")
-SBCL_EXECUTABLE = "/usr/bin/sbcl"
\ No newline at end of file
+SBCL_EXECUTABLE = os.getenv("SBCL_EXECUTABLE", "/usr/bin/sbcl")
+
+# Expert system worker pool: long-lived SBCL processes that load the Lisp script once.
+# The pool is per gunicorn worker, so its default size divides the CPUs between them.
+EXPERT_SYSTEM_USE_POOL = os.getenv("EXPERT_SYSTEM_USE_POOL", "1") == "1"
+GUNICORN_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+EXPERT_SYSTEM_POOL_SIZE = int(os.getenv("EXPERT_SYSTEM_POOL_SIZE", max(1, (os.cpu_count() or 1) // GUNICORN_WORKERS)))
+EXPERT_SYSTEM_TIMEOUT = float(os.getenv("EXPERT_SYSTEM_TIMEOUT", "30"))  # Seconds per request
+EXPERT_SYSTEM_HEALTH_CHECK_INTERVAL = float(os.getenv("EXPERT_SYSTEM_HEALTH_CHECK_INTERVAL", "60"))  # Seconds
+# Keep the catalogue in memory in the SBCL workers and only send the user with each request
+EXPERT_SYSTEM_RESIDENT_CATALOGUE = os.getenv("EXPERT_SYSTEM_RESIDENT_CATALOGUE", "1") == "1"
+# Ship the resident catalogue in the compact line format (LOAD-CATALOGUE-LINES) instead of S-expressions
+EXPERT_SYSTEM_COMPACT_CATALOGUE = os.getenv("EXPERT_SYSTEM_COMPACT_CATALOGUE", "1") == "1"
+
+# Default number of recommendations and number of best-scored candidates they are taken from
+DEFAULT_RECOMMENDATIONS = 5
+DEFAULT_CANDIDATE_WINDOW = 50
+# Largest n and window accepted from clients (the engines allocate the candidate window per request)
+MAX_RECOMMENDATIONS = int(os.getenv("MAX_RECOMMENDATIONS", "100"))
+MAX_CANDIDATE_WINDOW = int(os.getenv("MAX_CANDIDATE_WINDOW", "1000"))
+# Nombre maximum de films du cache envoyés au système expert (à augmenter avec un catalogue agrandi par le crawl
+# /discover/movie, surtout avec le moteur natif)
+EXPERT_SYSTEM_CATALOGUE_SIZE = int(os.getenv("EXPERT_SYSTEM_CATALOGUE_SIZE", "2000"))
+
+# Batch recommendations (/api/recommend-batch): maximum users per request, users scored together by the native engine
+BATCH_MAX_USERS = int(os.getenv("BATCH_MAX_USERS", "1000"))
+NATIVE_BATCH_CHUNK_SIZE = 256
+
+# Recommendation engine: "sbcl" (Lisp expert system) or "native" (in-process NumPy scoring)
+EXPERT_SYSTEM_ENGINE = os.getenv("EXPERT_SYSTEM_ENGINE", "sbcl")
+
+# Movie cache backend: "json" (single JSON file, rewritten as a whole by every upsert) or "sqlite" (one row per
+# movie, next to the JSON file, upserts only write the changed rows)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "json")
+
+# Movie search (autocomplete): local title index first, then TMDB with a TTL + LRU cache
+SEARCH_RESULTS_LIMIT = 5
+SEARCH_FUZZY_THRESHOLD = 0.4  # Minimum trigram similarity of a fuzzy match
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))  # Cached TMDB queries
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))  # Seconds
+
+# Recommendation result cache: "memory" (per worker), "sqlite" (shared by the workers) or "none"
+RECOMMENDATION_CACHE_BACKEND = os.getenv("RECOMMENDATION_CACHE_BACKEND", "memory")
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "4096"))  # Cached results
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "3600"))  # Seconds
+RECOMMENDATION_CACHE_PATH = os.path.join(CACHE_DIR, "recommendations_cache.sqlite3")
+# SQLite caches (TMDB responses, recommendations): a read only writes the last use of an entry when it is older
+# than the interval, and each process checks the size of the cache every EVICTION_INTERVAL inserts
+SQLITE_CACHE_TOUCH_INTERVAL = float(os.getenv("SQLITE_CACHE_TOUCH_INTERVAL", "60"))  # Seconds
+SQLITE_CACHE_EVICTION_INTERVAL = int(os.getenv("SQLITE_CACHE_EVICTION_INTERVAL", "100"))  # Inserts
+# Bump when the scoring or the response format of an engine changes, to invalidate the cached results
+RECOMMENDATION_ENGINE_VERSION = "2"
+
+# Serving mode: "sync" gunicorn workers, or "gevent" workers carrying many requests each while they wait
+# on TMDB and the expert system (see gunicorn.conf.py)
+GUNICORN_WORKER_CLASS = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+GUNICORN_WORKER_CONNECTIONS = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))  # Requests per gevent worker
+GUNICORN_TIMEOUT = int(os.getenv("GUNICORN_TIMEOUT", "60"))  # Seconds
+# Requests in flight per upstream and per worker, and maximum wait for a slot before failing
+TMDB_MAX_IN_FLIGHT = int(os.getenv("TMDB_MAX_IN_FLIGHT", "32"))
+EXPERT_SYSTEM_MAX_IN_FLIGHT = int(os.getenv("EXPERT_SYSTEM_MAX_IN_FLIGHT", str(EXPERT_SYSTEM_POOL_SIZE)))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "10"))  # Seconds
+
+# Logging level of the application ("DEBUG" logs the payloads and timings of every request) and prefix of
+# the metrics exposed on /metrics
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+METRICS_PREFIX = "es_movies_"
@@ -9,26 +9,199 @@
   "Reads an S-expression from the standard input."
   (read))
 
+;;; Splits a string on spaces
+(defun split-spaces (string)
+  "Returns the non-empty space-separated tokens of STRING."
+  (loop for start = 0 then (1+ end)
+        for end = (position #\Space string :start start)
+        for token = (subseq string start end)
+        unless (string= token "") collect token
+        while end))
+
+;;; Parses request parameters
+(defun parse-parameters (tokens)
+  "Parses key=value TOKENS into an alist of keywords and integers. Other tokens are ignored."
+  (loop for token in tokens
+        for equal-sign = (position #\= token)
+        when equal-sign
+          collect (cons (intern (string-upcase (subseq token 0 equal-sign)) :keyword)
+                        (parse-integer token :start (1+ equal-sign)))))
+
+;;; Retrieves a request parameter
+(defun get-parameter (parameters key default)
+  "Gets the value of the parameter KEY, or DEFAULT if it was not given."
+  (let ((parameter (assoc key parameters)))
+    (if parameter (cdr parameter) default)))
+
+;;; Writes a string as a JSON string
+(defun write-json-string (string stream)
+  "Writes STRING to STREAM as a JSON string, escaping quotes, backslashes and control characters."
+  (write-char #\" stream)
+  (loop for char across string
+        for code = (char-code char)
+        do (case char
+             (#\" (write-string "\\\"" stream))
+             (#\\ (write-string "\\\\" stream))
+             (#\Newline (write-string "\\n" stream))
+             (#\Return (write-string "\\r" stream))
+             (#\Tab (write-string "\\t" stream))
+             (t (if (< code 32)
+                    (format stream "\\u~4,'0x" code)
+                    (write-char char stream)))))
+  (write-char #\" stream))
+
+;;; Writes a number as a JSON number
+(defun write-json-number (number stream)
+  "Writes NUMBER to STREAM as a JSON number: integers as is, other numbers as floats (printed in
+  their own format, so without a d0 or f0 exponent marker)."
+  (if (integerp number)
+      (format stream "~d" number)
+      (let* ((value (if (floatp number) number (float number)))
+             (*read-default-float-format* (type-of value)))
+        (prin1 value stream))))
+
+;;; Writes an association list as a JSON object
+(defun write-json-object (alist stream)
+  "Writes ALIST to STREAM as a JSON object whose keys are the names of the alist keys."
+  (write-char #\{ stream)
+  (loop for (key . value) in alist
+        for first = t then nil
+        do (unless first
+             (write-string ", " stream))
+           (write-json-string (if (symbolp key) (symbol-name key) (princ-to-string key)) stream)
+           (write-string ": " stream)
+           (write-json-value value stream))
+  (write-char #\} stream))
+
+;;; Writes a Lisp value as a JSON value
+(defun write-json-value (value stream)
+  "Writes VALUE to STREAM as JSON: strings, numbers, T as true, NIL as null, association lists
+  with symbol keys as objects and other lists or vectors as arrays."
+  (cond
+    ((stringp value) (write-json-string value stream))
+    ((numberp value) (write-json-number value stream))
+    ((null value) (write-string "null" stream))
+    ((eq value t) (write-string "true" stream))
+    ((and (consp value) (consp (first value)) (symbolp (car (first value))))
+     (write-json-object value stream))
+    ((typep value 'sequence)
+     (write-char #\[ stream)
+     (let ((first t))
+       (map nil (lambda (element)
+                  (unless first
+                    (write-string ", " stream))
+                  (setf first nil)
+                  (write-json-value element stream))
+            value))
+     (write-char #\] stream))
+    (t (write-json-string (princ-to-string value) stream))))
+
 ;;; Converts an association list into a JSON string
 (defun alist-to-json (alist)
   "Converts an association list to a JSON string."
-  (let ((json "{"))
-    (loop for (key . value) in alist
-          for keystr = (if (symbolp key)
-                           (symbol-name key)
-                           (princ-to-string key))
-          for valuestr = (cond
-                          ((stringp value) (format nil "\"~a\"" value))
-                          ((numberp value) (princ-to-string value))
-                          ((null value) "null")
-                          ((eq value t) "true")
-                          (t (format nil "\"~a\"" value)))
-          do (progn
-               (when (> (length json) 1)
-                 (setf json (concatenate 'string json ", ")))
-               (setf json (concatenate 'string json
-                                        "\"" keystr "\": " valuestr))))
-    (concatenate 'string json "}")))
+  (with-output-to-string (stream)
+    (write-json-object alist stream)))
+
+;;; Compact catalogue format (LOAD-CATALOGUE-LINES), read without the general Lisp reader: the
+;;; version on the first line, then one movie per line with tab-separated fields
+;;;   id  popularity  vote_average  adult (1/0)  genre IDs (comma-separated)  release_date
+;;;   original_language  poster_path  title
+;;; String fields escape backslash, tab, newline and carriage return with a backslash, and \N
+;;; stands for a missing value (see backend/utils/lisp_encoder.py).
+
+;;; Splits a string on tabs
+(defun split-tabs (string)
+  "Returns the tab-separated fields of STRING, empty fields included."
+  (loop for start = 0 then (1+ end)
+        for end = (position #\Tab string :start start)
+        collect (subseq string start end)
+        while end))
+
+;;; Decodes a string field of the compact format
+(defun unescape-field (field)
+  "Decodes a string FIELD of the compact format: NIL for \\N, otherwise the string with its
+  backslash sequences replaced by a backslash, a tab, a newline or a carriage return."
+  (cond
+    ((string= field "\\N") nil)
+    ((not (find #\\ field)) field)
+    (t (with-output-to-string (out)
+         (let ((i 0))
+           (loop while (< i (length field))
+                 do (let ((char (char field i)))
+                      (if (and (char= char #\\) (< (1+ i) (length field)))
+                          (progn
+                            (write-char (case (char field (1+ i))
+                                          (#\t #\Tab)
+                                          (#\n #\Newline)
+                                          (#\r #\Return)
+                                          (t (char field (1+ i))))
+                                        out)
+                            (incf i 2))
+                          (progn
+                            (write-char char out)
+                            (incf i))))))))))
+
+;;; Parses a decimal number
+(defun parse-decimal (string)
+  "Parses a number written by Python (7, -1.5, 2e-05) to the value the Lisp reader would read: an
+  integer without decimal point nor exponent, otherwise the nearest single float."
+  (let* ((exponent-start (position-if (lambda (char) (char-equal char #\e)) string))
+         (mantissa-end (or exponent-start (length string)))
+         (point (position #\. string :end mantissa-end)))
+    (if (and (null point) (null exponent-start))
+        (parse-integer string)
+        (let* ((negative (char= (char string 0) #\-))
+               (digits-start (if (find (char string 0) "+-") 1 0))
+               (integer-end (or point mantissa-end))
+               (integer-part (if (> integer-end digits-start)
+                                 (parse-integer string :start digits-start :end integer-end)
+                                 0))
+               (fraction-digits (if point (- mantissa-end point 1) 0))
+               (fraction (if (> fraction-digits 0)
+                             (parse-integer string :start (1+ point) :end mantissa-end)
+                             0))
+               (exponent (if exponent-start (parse-integer string :start (1+ exponent-start)) 0))
+               ;; Valeur exacte en rationnel, arrondie une seule fois comme le fait le lecteur
+               (value (* (+ (* integer-part (expt 10 fraction-digits)) fraction)
+                         (expt 10 (- exponent fraction-digits)))))
+          (float (if negative (- value) value) 1.0)))))
+
+;;; Parses comma-separated genre IDs
+(defun parse-genre-ids (field)
+  "Returns the list of the comma-separated integers of FIELD."
+  (unless (string= field "")
+    (loop for start = 0 then (1+ end)
+          for end = (position #\, field :start start)
+          collect (parse-integer field :start start :end end)
+          while end)))
+
+;;; Builds a movie from a line of the compact format
+(defun parse-movie-line (line)
+  "Returns the association list of the movie of LINE, as the Lisp reader reads it from Movie.to_lisp."
+  (destructuring-bind (id popularity vote-average adult genre-ids release-date language poster-path title)
+      (split-tabs line)
+    (let ((movie (list (cons :title (unescape-field title))
+                       (cons :id (parse-integer id))
+                       (cons :genre_ids (parse-genre-ids genre-ids))
+                       (cons :release_date (unescape-field release-date))
+                       (cons :popularity (parse-decimal popularity))
+                       (cons :vote_average (parse-decimal vote-average))
+                       (cons :adult (string= adult "1"))
+                       (cons :original_language (unescape-field language))))
+          (poster-path (unescape-field poster-path)))
+      (if (and poster-path (string/= poster-path ""))
+          (append movie (list (cons :poster_path poster-path)))
+          movie))))
+
+;;; Reads a catalogue in the compact format
+(defun read-catalogue-lines (payload)
+  "Reads a (version . movies) pair from PAYLOAD in the compact format."
+  (with-input-from-string (stream payload)
+    (cons (read-line stream nil "")
+          (loop for line = (read-line stream nil nil)
+                while line
+                unless (string= line "")
+                  collect (parse-movie-line line)))))
 
 ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
 ;;; utility functions
@@ -121,67 +294,195 @@
   (cdr (assoc :id movie)))
 
 ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
-;;; Scoring functions
-;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
-
-;;; Function to calculate the percentage similarity between a movie's genre IDs and the user's favorite movie genres
-(defun calculate-genre-similarity (movie movies)
-  "Calculates the percentage similarity between a movie's genre IDs and the genre IDs of the user's favorite movies."
-  (let* ((movie-genres (get-movie-genres movie))
-         (favorite-genres (remove-duplicates (apply #'append (mapcar #'get-movie-genres movies)) :test #'equal))
-         (common-genres (intersection movie-genres favorite-genres :test #'equal))
-         (total-genres (length movie-genres)))
-    (if (> total-genres 0)
-        (* 100 (/ (float (length common-genres)) total-genres)) ; Percentage similarity
-        0.0))) ; Return 0 if the movie has no genres
-
-;;; Function to calculate the year difference between two movies
-(defun calculate-year-difference (movie1 movie2)
-  "Calculates the absolute year difference between two movies."
-  (let ((year1 (get-movie-year movie1))
-        (year2 (get-movie-year movie2)))
-    (if (and year1 year2)
-        (abs (- year1 year2)) ; Calculate absolute difference
-        nil))) ; Return nil if either year is unavailable
-
-;;; Function to calculate language similarity
-(defun calculate-language-similarity (movie user-mood-movies user-favorite-movies)
-  ;; on compte le nombre de fois que le language du film apparait dans les films favoris et mood et on divise par le nombre de films total dans les deux listes
-  "Calculates the language similarity between a movie and the user's favorite and mood-based movies."
-  (let* ((movie-language (get-movie-original-language movie))
-         (user-mood-languages (mapcar #'get-movie-original-language user-mood-movies))
-         (user-favorite-languages (mapcar #'get-movie-original-language user-favorite-movies))
-         (total-movies (+ (length user-mood-languages) (length user-favorite-languages)))
-         (common-languages (+ (count movie-language user-mood-languages :test #'string=)
-                              (count movie-language user-favorite-languages :test #'string=))))
-    (if (> total-movies 0)
-        (* (/ (float common-languages) total-movies) 100) ; Language similarity in percentage
-        0.0))) ; Return 0 if there are no movies to compare
+;;; User profile and scoring functions
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
 
-(defun score-movie (movie user)
-  "Scores a movie based on multiple criteria."
+;;; Aggregates of the user's movies, computed once per request instead of once per scored movie
+(defstruct user-profile
+  (mood-genres 0)          ; bitset of the genre IDs of the mood movies
+  (favorite-genres 0)      ; bitset of the genre IDs of the favorite movies
+  (language-counts nil)    ; hash table: original language -> number of mood and favorite movies
+  (total-movies 0)         ; number of mood and favorite movies
+  (mood-average-year nil)) ; average release year of the mood movies, nil if unknown
+
+;;; Builds a bitset of the genres of a list of movies
+(defun genres-bitset (movies)
+  "Returns an integer whose bits are set at the genre IDs of MOVIES."
+  (let ((bitset 0))
+    (dolist (movie movies bitset)
+      (dolist (genre (get-movie-genres movie))
+        (setf bitset (logior bitset (ash 1 genre)))))))
+
+;;; Builds the profile of a user
+(defun build-user-profile (user)
+  "Computes the genre bitsets, the language frequency table and the mood average year of USER."
   (let* ((user-favorites (get-user-favorite-movies user))
          (user-mood (get-user-mood-movies user))
-         (year-difference (if user-mood
-                              (let ((average-year (/ (reduce #'+ (mapcar #'get-movie-year user-mood)) 
-                                                     (length user-mood))))
-                                (if (get-movie-year movie)
-                                    (abs (- (get-movie-year movie) average-year))
-                                    nil))
-                              nil))
-         (genre-similarity-mood (calculate-genre-similarity movie user-mood))
-         (genre-similarity-favorites (calculate-genre-similarity movie user-favorites))
-         (popularity-score (/ (get-movie-popularity movie) 100.0))
-         (vote-score (* (movie-vote-average movie) 10))
-         (language-similarity (calculate-language-similarity movie user-mood user-favorites)))
+         (language-counts (make-hash-table :test #'equal))
+         (mood-years (remove nil (mapcar #'get-movie-year user-mood))))
+    (dolist (movie (append user-mood user-favorites))
+      (incf (gethash (get-movie-original-language movie) language-counts 0)))
+    (make-user-profile
+     :mood-genres (genres-bitset user-mood)
+     :favorite-genres (genres-bitset user-favorites)
+     :language-counts language-counts
+     :total-movies (+ (length user-mood) (length user-favorites))
+     :mood-average-year (when mood-years
+                          (/ (reduce #'+ mood-years) (length mood-years))))))
+
+;;; Genre similarity against a precomputed bitset
+(defun profile-genre-similarity (movie genres)
+  "Calculates the percentage of the movie's genre IDs that are set in the GENRES bitset."
+  (let ((movie-genres (get-movie-genres movie)))
+    (if movie-genres
+        (* 100 (/ (float (count-if (lambda (genre) (logbitp genre genres)) movie-genres))
+                  (length movie-genres)))
+        0.0)))
+
+;;; Language similarity against the precomputed frequency table
+(defun profile-language-similarity (movie profile)
+  "Calculates the percentage of the user's movies sharing the movie's original language."
+  (let ((total-movies (user-profile-total-movies profile)))
+    (if (> total-movies 0)
+        (* (/ (float (gethash (get-movie-original-language movie)
+                              (user-profile-language-counts profile)
+                              0))
+              total-movies)
+           100)
+        0.0)))
+
+;;; Criteria of the score of a movie, before weighting
+(defun score-criteria (movie profile)
+  "Returns the criteria of the score of MOVIE against PROFILE as multiple values: mood genre
+  similarity, favorite genre similarity, popularity score, vote score, language similarity and
+  year penalty."
+  (let* ((average-year (user-profile-mood-average-year profile))
+         (movie-year (get-movie-year movie))
+         (year-difference (if (and average-year movie-year)
+                              (abs (- movie-year average-year))
+                              nil)))
+    (values (profile-genre-similarity movie (user-profile-mood-genres profile))
+            (profile-genre-similarity movie (user-profile-favorite-genres profile))
+            (/ (get-movie-popularity movie) 100.0)
+            (* (movie-vote-average movie) 10)
+            (profile-language-similarity movie profile)
+            (if year-difference
+                (min 1.0 (/ year-difference 100.0))
+                0.0))))
+
+(defun score-movie-with-profile (movie profile)
+  "Scores a movie based on multiple criteria against a precomputed user profile."
+  (multiple-value-bind (genre-similarity-mood genre-similarity-favorites popularity-score vote-score
+                        language-similarity year-penalty)
+      (score-criteria movie profile)
     (- (+ (* 0.3 genre-similarity-mood)
           (* 0.25 genre-similarity-favorites)
           (* 0.15 popularity-score)
           (* 0.25 vote-score)
           (* 0.15 language-similarity))
-       (* 0.1 (if year-difference
-                  (min 1.0 (/ year-difference 100.0))
-                  0.0)))))
+       (* 0.1 year-penalty))))
+
+;;; Weighted criteria of the score of a movie, returned with the recommendations
+(defun score-details (movie profile)
+  "Returns the weighted criteria of the score of MOVIE against PROFILE as an alist. Their sum is
+  the score (the year penalty is negative)."
+  (multiple-value-bind (genre-similarity-mood genre-similarity-favorites popularity-score vote-score
+                        language-similarity year-penalty)
+      (score-criteria movie profile)
+    (list (cons :genre_mood (* 0.3 genre-similarity-mood))
+          (cons :genre_favorites (* 0.25 genre-similarity-favorites))
+          (cons :popularity (* 0.15 popularity-score))
+          (cons :vote (* 0.25 vote-score))
+          (cons :language (* 0.15 language-similarity))
+          (cons :year (- (* 0.1 year-penalty))))))
+
+(defun score-movie (movie user)
+  "Scores a movie based on multiple criteria."
+  (score-movie-with-profile movie (build-user-profile user)))
+
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;; Candidate indexes
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+
+;;; A movie sharing no genre and no original language with the user's movies scores at most its
+;;; popularity and vote terms (its "static score"). Only the movies found through the inverted
+;;; indexes are fully scored; the others are visited by decreasing static score until none of
+;;; them can enter the candidate window, which gives the same result as scoring every movie.
+(defstruct catalogue-index
+  (movies #())         ; vector of the movies, in catalogue order
+  (genres nil)         ; hash table: genre ID -> positions of the movies of this genre
+  (languages nil)      ; hash table: original language -> positions of the movies in this language
+  (static-scores #())  ; static score of each movie
+  (static-order #()))  ; positions sorted by decreasing static score
+
+;;; Popularity and vote terms of the score
+(defun movie-static-score (movie)
+  "Returns the popularity and vote terms of the score of MOVIE, an upper bound of its score when it
+  shares no genre and no original language with the user's movies."
+  (+ (* 0.15 (/ (get-movie-popularity movie) 100.0))
+     (* 0.25 (* (movie-vote-average movie) 10))))
+
+;;; Builds the inverted indexes of a list of movies
+(defun build-catalogue-index (db)
+  "Builds the genre and language inverted indexes and the static score order of the movies of DB."
+  (let* ((movies (coerce db 'vector))
+         (genres (make-hash-table))
+         (languages (make-hash-table :test #'equal))
+         (static-scores (map 'vector #'movie-static-score movies))
+         (static-order (make-array (length movies))))
+    (loop for movie across movies
+          for position from 0
+          do (dolist (genre (remove-duplicates (get-movie-genres movie)))
+               (push position (gethash genre genres)))
+             (push position (gethash (get-movie-original-language movie) languages))
+             (setf (aref static-order position) position))
+    (make-catalogue-index
+     :movies movies
+     :genres genres
+     :languages languages
+     :static-scores static-scores
+     :static-order (stable-sort static-order #'> :key (lambda (position) (aref static-scores position))))))
+
+;;; Accepts a list of movies or an already built index
+(defun ensure-catalogue-index (db)
+  "Returns DB if it is a catalogue index, or the index of the list of movies DB."
+  (if (catalogue-index-p db)
+      db
+      (build-catalogue-index db)))
+
+;;; Marks the movies sharing a genre or the original language with the user's movies
+(defun candidate-marks (index profile)
+  "Returns a bit vector over the catalogue positions, set for the movies having a genre of the user's
+  movies or the original language of one of them."
+  (let ((marks (make-array (length (catalogue-index-movies index)) :element-type 'bit :initial-element 0))
+        (genres (logior (user-profile-mood-genres profile) (user-profile-favorite-genres profile))))
+    (loop for genre from 0 below (integer-length genres)
+          when (logbitp genre genres)
+            do (dolist (position (gethash genre (catalogue-index-genres index)))
+                 (setf (sbit marks position) 1)))
+    (loop for language being the hash-keys of (user-profile-language-counts profile)
+          do (dolist (position (gethash language (catalogue-index-languages index)))
+               (setf (sbit marks position) 1)))
+    marks))
+
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;; Instrumentation
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+
+(defvar *timings* nil
+  "Alist of the step durations (in milliseconds) of the last recommendation.")
+
+;;; Milliseconds elapsed since an internal real time
+(defun elapsed-ms (start)
+  "Returns the milliseconds elapsed since START, an internal real time."
+  (/ (* 1000.0 (- (get-internal-real-time) start)) internal-time-units-per-second))
+
+;;; Formats the timings of the last recommendation
+(defun format-timings ()
+  "Formats *timings* as space-separated key=value pairs."
+  (format nil "~{~a~^ ~}"
+          (mapcar (lambda (timing) (format nil "~(~a~)=~,3f" (car timing) (cdr timing)))
+                  *timings*)))
 
 
 ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
@@ -189,32 +490,157 @@
 ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
 
   
-(defun recommend-movies (db user &optional (n 5))
-  "Recommends the top N movies by a calculated score from the top 50 of the database 
-  that are not in the user's favorites or mood-movies. Filters adult movies if the user is under 18.
-  Ensures no duplicate IDs in the final list."
-  (let* ((user-fav-titles (get-user-fav-movie-titles user))
-         (user-mood-titles (get-user-mood-movies-titles user))
-         ;; Filtrage initial des films non admissibles
-         (filtered-db (remove-if (lambda (movie)
-                                   (or (and (< (get-user-age user) 18) (is-movie-adult movie))
-                                       (member (movie-title movie) user-fav-titles :test #'string=)
-                                       (member (movie-title movie) user-mood-titles :test #'string=)))
-                                 db)))
-    ;; Tri des films par score décroissant
-    (setf filtered-db (sort filtered-db #'> :key (lambda (movie) (score-movie movie user))))
-    ;; Prendre les 50 premiers films triés
-    (let ((top-50 (subseq filtered-db 0 (min 50 (length filtered-db))))
-          (unique-ids '())
-          (unique-movies '()))
-      ;; Supprimer les duplicatas dans les 50 premiers
-      (dolist (movie top-50)
-        (let ((id (get-movie-id movie)))
-          (unless (member id unique-ids)
-            (push id unique-ids)
-            (push movie unique-movies))))
-      ;; Retourner les N premiers films sans duplicatas
-      (subseq (reverse unique-movies) 0 (min n (length unique-movies))))))
+;;; Bounded selection of the best candidates. A candidate is a list (score index . movie); the
+;;; catalogue index breaks ties so that equal scores keep the catalogue order.
+(defstruct top-k
+  (size 0)     ; number of candidates in the heap
+  (heap nil))  ; min-heap: the worst kept candidate is at index 0
+
+;;; Compares two candidates
+(defun candidate-better-p (a b)
+  "Returns true if candidate A ranks before candidate B: higher score, then earlier catalogue index."
+  (or (> (car a) (car b))
+      (and (= (car a) (car b)) (< (cadr a) (cadr b)))))
+
+;;; Restores the heap order from a node towards the root
+(defun heap-sift-up (heap i)
+  "Moves the candidate at index I up while it ranks below its parent."
+  (loop while (> i 0)
+        do (let ((parent (floor (1- i) 2)))
+             (if (candidate-better-p (aref heap parent) (aref heap i))
+                 (progn
+                   (rotatef (aref heap parent) (aref heap i))
+                   (setf i parent))
+                 (return)))))
+
+;;; Restores the heap order from a node towards the leaves
+(defun heap-sift-down (heap size i)
+  "Moves the candidate at index I down while one of its children ranks below it."
+  (loop
+    (let* ((left (1+ (* 2 i)))
+           (right (1+ left))
+           (worst i))
+      (when (and (< left size) (candidate-better-p (aref heap worst) (aref heap left)))
+        (setf worst left))
+      (when (and (< right size) (candidate-better-p (aref heap worst) (aref heap right)))
+        (setf worst right))
+      (if (= worst i)
+          (return)
+          (progn
+            (rotatef (aref heap i) (aref heap worst))
+            (setf i worst))))))
+
+;;; Offers a scored movie to the selection
+(defun top-k-offer (top-k score index movie)
+  "Keeps the movie if it ranks among the K best candidates seen so far."
+  (let ((heap (top-k-heap top-k))
+        (size (top-k-size top-k)))
+    (cond
+      ((< size (length heap))
+       (setf (aref heap size) (list* score index movie))
+       (heap-sift-up heap size)
+       (setf (top-k-size top-k) (1+ size)))
+      ((and (> size 0)
+            (let ((worst (aref heap 0)))
+              ;; Movies may be offered out of catalogue order, so an earlier index wins a tie
+              (or (> score (car worst))
+                  (and (= score (car worst)) (< index (cadr worst))))))
+       (setf (aref heap 0) (list* score index movie))
+       (heap-sift-down heap size 0)))))
+
+;;; Checks whether a movie can still enter the selection
+(defun top-k-closed-p (top-k bound)
+  "Returns true if no movie scoring at most BOUND can enter the selection: the heap is full and
+  its worst candidate scores strictly more than BOUND."
+  (let ((heap (top-k-heap top-k)))
+    (and (= (top-k-size top-k) (length heap))
+         (or (= (length heap) 0)
+             (> (car (aref heap 0)) bound)))))
+
+;;; Returns the selected candidates
+(defun top-k-candidates (top-k)
+  "Returns the selected candidates (score index . movie), best first."
+  (sort (subseq (top-k-heap top-k) 0 (top-k-size top-k)) #'candidate-better-p))
+
+(defun recommend-movies (db user &optional (n 5) (window 50))
+  "Recommends the top N movies by a calculated score from the top WINDOW (50 by default) of the
+  database that are not in the user's favorites or mood-movies. Filters adult movies if the user
+  is under 18. Ensures no duplicate IDs in the final list.
+  Each recommended movie is returned with its :score and its :score_details (see score-details).
+  DB is a list of movies or its catalogue index. Only the WINDOW best candidates are kept (bounded
+  heap), and movies that cannot reach them are not scored (see catalogue-index)."
+  (let* ((index (ensure-catalogue-index db))
+         (start (get-internal-real-time))
+         (profile (build-user-profile user))
+         (profile-ms (elapsed-ms start))
+         (scoring-start (get-internal-real-time))
+         (movies (catalogue-index-movies index))
+         (static-scores (catalogue-index-static-scores index))
+         (candidates (candidate-marks index profile))
+         (minor (< (get-user-age user) 18))
+         (excluded-titles (make-hash-table :test #'equal))
+         ;; La fenêtre ne dépasse jamais le catalogue, quelle que soit la valeur demandée
+         (top-k (make-top-k :heap (make-array (max 0 (min window (length movies))))))
+         (scored 0)
+         (unique-ids (make-hash-table))
+         (unique-movies '()))
+    (dolist (title (append (get-user-fav-movie-titles user) (get-user-mood-movies-titles user)))
+      (setf (gethash title excluded-titles) t))
+    ;; Filtrage des films non admissibles et sélection des meilleurs scores
+    (flet ((offer (position)
+             (let ((movie (aref movies position)))
+               (unless (or (and minor (is-movie-adult movie))
+                           (gethash (movie-title movie) excluded-titles))
+                 (incf scored)
+                 (top-k-offer top-k (score-movie-with-profile movie profile) position movie)))))
+      ;; Films partageant un genre ou une langue avec l'utilisateur : score complet
+      (loop for position from 0 below (length movies)
+            when (= (sbit candidates position) 1)
+              do (offer position))
+      ;; Autres films : par score statique décroissant, tant qu'ils peuvent entrer dans la fenêtre
+      (loop for position across (catalogue-index-static-order index)
+            when (= (sbit candidates position) 0)
+              do (if (top-k-closed-p top-k (aref static-scores position))
+                     (return)
+                     (offer position))))
+    ;; Supprimer les duplicatas dans la fenêtre et garder les N premiers films
+    (dolist (candidate (top-k-candidates top-k))
+      (let* ((movie (cddr candidate))
+             (id (get-movie-id movie)))
+        (when (and (< (length unique-movies) n)
+                   (not (gethash id unique-ids)))
+          (setf (gethash id unique-ids) t)
+          (push (append movie (list (cons :score (car candidate))
+                                    (cons :score_details (score-details movie profile))))
+                unique-movies))))
+    (setf *timings* (list (cons :profile_ms profile-ms)
+                          (cons :scoring_ms (elapsed-ms scoring-start))
+                          (cons :scored scored)))
+    (nreverse unique-movies)))
+
+(defun recommend-movies-batch (db users &optional (n 5) (window 50) emit)
+  "Recommends the top N movies to each user of USERS from the same database, in one call.
+  Returns one list of recommendations per user, in the order of USERS. If EMIT is given, it is
+  called with the recommendations of each user as soon as they are computed, and nothing is
+  collected. The timings are summed over the users."
+  (let ((index (ensure-catalogue-index db))
+        (profile-ms 0.0)
+        (scoring-ms 0.0)
+        (scored 0)
+        (results '()))
+    (dolist (user users)
+      (let ((recommendations (recommend-movies index user n window)))
+        (incf profile-ms (cdr (assoc :profile_ms *timings*)))
+        (incf scoring-ms (cdr (assoc :scoring_ms *timings*)))
+        (incf scored (cdr (assoc :scored *timings*)))
+        (if emit
+            (funcall emit recommendations)
+            (push recommendations results))))
+    (setf *timings* (list (cons :users (length users))
+                          (cons :profile_ms profile-ms)
+                          (cons :scoring_ms scoring-ms)
+                          (cons :scored scored)))
+    (nreverse results)))
 
 
 
@@ -222,21 +648,176 @@
 ;;; Main function
 ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
 
+;;; The recommendations are written as JSON lines: one line per user holding the JSON array of
+;;; the recommended movies, then a line "END count" giving the number of users, so that a reader
+;;; can decode each user as it arrives and detect a truncated output.
+
+;;; Writes the recommendations of one user as a JSON line
+(defun write-recommendations-line (recommendations stream)
+  "Writes RECOMMENDATIONS (movie association lists) to STREAM as a JSON array on one line."
+  (write-json-value (or recommendations (vector)) stream)
+  (terpri stream))
+
+;;; Writes the end of the recommendations
+(defun write-recommendations-end (count stream)
+  "Writes the END line closing the recommendations of COUNT users to STREAM."
+  (format stream "END ~d~%" count))
+
+;;; Converts the recommendations of several users into JSON lines
+(defun recommendations-to-json-lines (batch)
+  "Converts a list of recommendation lists (one per user) into JSON lines followed by the END line."
+  (with-output-to-string (stream)
+    (dolist (recommendations batch)
+      (write-recommendations-line recommendations stream))
+    (write-recommendations-end (length batch) stream)))
+
 ;;; Main function to process input and generate recommendations
 (defun main ()
-  "Main function: reads input, generates recommendations, and outputs them as JSON."
-  (let* ((input (read-input))
+  "Main function: reads input, generates recommendations, and outputs them as JSON lines.
+  The number of recommendations and the candidate window can be given as n=... and window=...
+  command line arguments. With batch=1, the input is (movies . users) and one line is written per
+  user as soon as its recommendations are computed."
+  (let* ((parameters (parse-parameters (rest sb-ext:*posix-argv*)))
+         (input (read-input))
          (db (get-movies input))
-         (user (get-user input))
-         (recommendations (recommend-movies db user)))
-    ;; Convert recommendations to JSON
-    (let ((json "["))
-      (loop for movie in recommendations
-            for i from 0 do
-              (when (> i 0)
-                (setf json (concatenate 'string json ", ")))
-              (setf json (concatenate 'string json (alist-to-json movie))))
-      (setf json (concatenate 'string json "]"))
-      (print json))))
-
-(main)
+         (n (get-parameter parameters :n 5))
+         (window (get-parameter parameters :window 50)))
+    (if (= (get-parameter parameters :batch 0) 1)
+        (let ((count 0))
+          (recommend-movies-batch db (cdr input) n window
+                                  (lambda (recommendations)
+                                    (write-recommendations-line recommendations *standard-output*)
+                                    (incf count)))
+          (write-recommendations-end count *standard-output*))
+        (progn
+          (write-recommendations-line (recommend-movies db (get-user input) n window) *standard-output*)
+          (write-recommendations-end 1 *standard-output*)))
+    (finish-output)
+    (format *error-output* "[TIMING] ~a~%" (format-timings))))
+
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+;;; Worker mode
+;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
+
+;;; In worker mode (`sbcl --script expert_system.lisp --serve`) the script is loaded once and
+;;; then answers framed requests on stdin/stdout until stdin is closed. A frame is a header
+;;; line "COMMAND LENGTH" followed by exactly LENGTH characters of payload; request parameters
+;;; may follow the length as key=value pairs ("RECOMMEND-USER 812 n=5 window=50"). Responses use the
+;;; same framing with the status "OK" or "ERR" in place of the command; the header of a
+;;; recommendation response also carries the step timings ("OK 123 profile_ms=0.050 scoring_ms=1.200").
+;;; Recommendations are returned as JSON lines (see write-recommendations-line).
+;;;
+;;; Commands:
+;;;   PING            -> "PONG"
+;;;   RECOMMEND       (movies . user) -> JSON line of recommendations
+;;;   LOAD-CATALOGUE  (version . movies) -> version, keeps the movies in memory
+;;;   LOAD-CATALOGUE-LINES  same, with the catalogue in the compact format (see read-catalogue-lines)
+;;;   RECOMMEND-USER  (version . user) -> same, from the resident catalogue
+;;;   RECOMMEND-BATCH (movies . users) -> one JSON line of recommendations per user
+;;;   RECOMMEND-USERS (version . users) -> same, from the resident catalogue
+
+;;; Checks whether the script was started in worker mode
+(defun serve-mode-p ()
+  "Returns true if the script was started with the --serve argument."
+  (member "--serve" sb-ext:*posix-argv* :test #'string=))
+
+;;; Reads one request frame
+(defun read-frame (stream)
+  "Reads a request frame from STREAM. Returns the command, the payload and the request parameters,
+  or NIL at end of input."
+  (let ((header (read-line stream nil nil)))
+    (when header
+      (let* ((tokens (split-spaces header))
+             (command (string-upcase (first tokens)))
+             (size (if (second tokens) (parse-integer (second tokens)) 0))
+             (payload (make-string size)))
+        (when (= (read-sequence payload stream) size)
+          (values command payload (parse-parameters (cddr tokens))))))))
+
+;;; Writes one response frame
+(defun write-frame (stream status payload &optional (extras ""))
+  "Writes a response frame with the given status to STREAM and flushes it.
+  EXTRAS (key=value pairs such as timings) are appended to the header line."
+  (if (string= extras "")
+      (format stream "~a ~d~%~a" status (length payload) payload)
+      (format stream "~a ~d ~a~%~a" status (length payload) extras payload))
+  (finish-output stream))
+
+;;; Movies kept in memory between requests in worker mode
+(defvar *catalogue* nil
+  "Catalogue index of the movies loaded by the LOAD-CATALOGUE command.")
+
+(defvar *catalogue-version* nil
+  "Version ID of the resident catalogue.")
+
+;;; Reads the S-expression of a request payload
+(defun read-payload (payload)
+  "Reads the S-expression contained in a request payload."
+  (let ((*read-eval* nil))
+    (read-from-string payload)))
+
+;;; Replaces the resident catalogue
+(defun load-catalogue (input)
+  "Stores the movies of INPUT, a (version . movies) pair, as the resident catalogue, with its
+  inverted indexes."
+  (setf *catalogue-version* (car input)
+        *catalogue* (build-catalogue-index (cdr input)))
+  *catalogue-version*)
+
+;;; Recommends movies from the resident catalogue
+(defun recommend-from-catalogue (input n window)
+  "Recommends N movies from the resident catalogue for INPUT, a (version . user) pair.
+  Signals an error if the catalogue version does not match the resident one."
+  (unless (equal (car input) *catalogue-version*)
+    (error "Stale catalogue: requested ~a, loaded ~a" (car input) *catalogue-version*))
+  (recommend-movies *catalogue* (cdr input) n window))
+
+;;; Recommends movies to several users from the resident catalogue
+(defun recommend-batch-from-catalogue (input n window)
+  "Recommends N movies to each user of INPUT, a (version . users) pair, from the resident catalogue.
+  Signals an error if the catalogue version does not match the resident one."
+  (unless (equal (car input) *catalogue-version*)
+    (error "Stale catalogue: requested ~a, loaded ~a" (car input) *catalogue-version*))
+  (recommend-movies-batch *catalogue* (cdr input) n window))
+
+;;; Dispatches a request to the matching command
+(defun handle-request (command payload parameters)
+  "Executes COMMAND on PAYLOAD with the request PARAMETERS and returns the response payload as a string."
+  (let ((n (get-parameter parameters :n 5))
+        (window (get-parameter parameters :window 50)))
+    (cond
+      ((string= command "PING") "PONG")
+      ((string= command "RECOMMEND")
+       (let ((input (read-payload payload)))
+         (recommendations-to-json-lines (list (recommend-movies (get-movies input) (get-user input) n window)))))
+      ((string= command "LOAD-CATALOGUE")
+       (load-catalogue (read-payload payload)))
+      ((string= command "LOAD-CATALOGUE-LINES")
+       (load-catalogue (read-catalogue-lines payload)))
+      ((string= command "RECOMMEND-USER")
+       (recommendations-to-json-lines (list (recommend-from-catalogue (read-payload payload) n window))))
+      ((string= command "RECOMMEND-BATCH")
+       (let ((input (read-payload payload)))
+         (recommendations-to-json-lines (recommend-movies-batch (get-movies input) (cdr input) n window))))
+      ((string= command "RECOMMEND-USERS")
+       (recommendations-to-json-lines (recommend-batch-from-catalogue (read-payload payload) n window)))
+      (t (error "Unknown command: ~a" command)))))
+
+;;; Request loop of a worker
+(defun serve ()
+  "Serves framed requests on stdin/stdout until stdin is closed."
+  (let ((in (sb-sys:make-fd-stream 0 :input t :external-format :utf-8 :buffering :full))
+        (out (sb-sys:make-fd-stream 1 :output t :external-format :utf-8 :buffering :full)))
+    (loop
+      (multiple-value-bind (command payload parameters) (read-frame in)
+        (unless command
+          (return))
+        (setf *timings* nil)
+        (handler-case (let ((response (handle-request command payload parameters)))
+                        (write-frame out "OK" response (format-timings)))
+          (error (e)
+            (write-frame out "ERR" (princ-to-string e))))))))
+
+(if (serve-mode-p)
+    (serve)
+    (main))
@@ -1,5 +1,7 @@
 from typing import List, Dict
 
+from backend.utils.lisp_encoder import movie_to_lisp
+
 TMDB_URL = "https://api.themoviedb.org/3/movie/"
 CACHE_FILE = "movies_cache.json"
 
@@ -20,6 +22,10 @@ class Movie:
         poster_path (str): The original poster of the movie
     """
 
+    # No per-instance __dict__: large catalogues hold many Movie objects
+    __slots__ = ("_id", "_title", "_genre_ids", "_release_date", "_popularity", "_vote_average", "_adult",
+                 "_original_language", "_poster_path")
+
     def __init__(
             self,
             id: int,
@@ -293,29 +299,11 @@ class Movie:
 
     def to_lisp(self) -> str:
         """
-        Converts the Movie object into a Lisp cons pair structure.
+        Converts the Movie object into a Lisp cons pair structure, with escaped strings.
         Example:
           ((:title . "Interstellar") (:genre_ids . (12 18 878)) ...)
         """
-
-        def list_to_lisp(lst):
-            return "(" + " ".join(str(x) for x in lst) + ")"
-
-        parts = [f'(:title . "{self._title}")', f'(:id . {self._id})']
-        if self._genre_ids:
-            genre_list = list_to_lisp(self._genre_ids)
-            parts.append(f'(:genre_ids . {genre_list})')
-        else:
-            parts.append('(:genre_ids . ())')
-        parts.append(f'(:release_date . "{self._release_date}")')
-        parts.append(f'(:popularity . {self._popularity})')
-        parts.append(f'(:vote_average . {self._vote_average})')
-        parts.append(f'(:adult . {"t" if self._adult else "nil"})')
-        parts.append(f'(:original_language . "{self._original_language}")')
-        if self._poster_path:
-            parts.append(f'(:poster_path . "{self._poster_path}")')
-
-        return "(" + " ".join(parts) + ")"
+        return movie_to_lisp(self.to_dict())
 
     def __str__(self) -> str:
         """
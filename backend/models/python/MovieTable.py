@@ -0,0 +1,177 @@
+from typing import List, Dict, Iterator, Optional, Union
+
+import numpy as np
+
+from backend.models.python.Movie import Movie
+from backend.utils.lisp_encoder import MOVIE_DEFAULTS
+
+# Release year stored for movies without a valid release date
+MISSING_YEAR = -1
+# Language stored for movies without an original language (e.g. null in the TMDB response)
+MISSING_LANGUAGE = MOVIE_DEFAULTS["original_language"]
+
+
+def parse_year(release_date: Optional[str]) -> Optional[int]:
+    """
+    Extracts the release year from a release date, like `get-movie-year` in the Lisp engine.
+
+    :param release_date: Release date in 'YYYY-MM-DD' format.
+    :return: The release year, or None if the release date is not available.
+    """
+    release_date = release_date or ""
+    try:
+        return int(release_date[:4]) if len(release_date) >= 4 else None
+    except ValueError:
+        return None
+
+
+class MovieTable:
+    """
+    A columnar, read-only table of movies.
+
+    Numeric attributes are stored in NumPy arrays and genres in a flat array with row offsets,
+    instead of one object and one dictionary per movie. Rows are returned as Movie objects, so the
+    table can be used where a list of movies is expected.
+
+    Attributes:
+        ids (np.ndarray): ID of each movie.
+        titles (List[str]): Title of each movie.
+        release_dates (List[str]): Release date of each movie.
+        poster_paths (List[str]): Poster path of each movie.
+        years (np.ndarray): Release year of each movie (MISSING_YEAR if unknown).
+        popularity (np.ndarray): Popularity of each movie.
+        vote_average (np.ndarray): Vote average of each movie.
+        adult (np.ndarray): Adult flag of each movie.
+        languages (List[str]): The distinct original languages, sorted.
+        language_codes (np.ndarray): Index of the original language of each movie in `languages`.
+        genres (List[int]): The distinct genre IDs, sorted.
+        genre_offsets (np.ndarray): Start of the genres of each movie in `genre_values` (one more entry than rows).
+        genre_values (np.ndarray): Genre IDs of all the movies, in row order.
+        genre_bitmask (Optional[np.ndarray]): Bitmask of the genres of each movie (bit i for `genres[i]`),
+            None if the catalogue has more than 64 genres.
+    """
+
+    def __init__(self, movies: List[Union[Dict, Movie]]):
+        """
+        Builds the columns from movies.
+
+        :param movies: The movies as dictionaries (as stored in the cache) or Movie objects.
+        """
+        movies = [Movie.from_dict(m) if isinstance(m, dict) else m for m in movies]
+        self.ids = np.array([m.id for m in movies], dtype=np.int64)
+        self.titles = [m.title for m in movies]
+        self.release_dates = [m.release_date for m in movies]
+        self.poster_paths = [m.poster_path for m in movies]
+
+        years = (parse_year(m.release_date) for m in movies)
+        self.years = np.array([MISSING_YEAR if y is None else y for y in years], dtype=np.int32)
+        self.popularity = np.array([m.popularity for m in movies], dtype=np.float64)
+        self.vote_average = np.array([m.vote_average for m in movies], dtype=np.float64)
+        self.adult = np.array([bool(m.adult) for m in movies], dtype=bool)
+
+        languages = [MISSING_LANGUAGE if m.original_language is None else m.original_language for m in movies]
+        self.languages = sorted(set(languages))
+        language_index = {lang: i for i, lang in enumerate(self.languages)}
+        self.language_codes = np.array([language_index[lang] for lang in languages], dtype=np.int16)
+
+        self.genre_offsets = np.zeros(len(movies) + 1, dtype=np.int64)
+        self.genre_offsets[1:] = np.cumsum([len(m.genre_ids) for m in movies])
+        self.genre_values = np.array([g for m in movies for g in m.genre_ids], dtype=np.int32)
+        self.genres = sorted(set(self.genre_values.tolist()))
+
+        self.genre_bitmask = None
+        if len(self.genres) <= 64:
+            bits = np.left_shift(np.uint64(1), np.searchsorted(self.genres, self.genre_values).astype(np.uint64))
+            self.genre_bitmask = np.zeros(len(movies), dtype=np.uint64)
+            np.bitwise_or.at(self.genre_bitmask, self.genre_rows(), bits)
+
+    @classmethod
+    def from_columns(cls, **columns) -> "MovieTable":
+        """
+        Creates a table from existing columns (e.g. arrays mapped from a catalogue snapshot), without copying them.
+
+        :param columns: A value for each attribute of the table.
+        :return: A MovieTable instance.
+        """
+        table = cls.__new__(cls)
+        for name, column in columns.items():
+            setattr(table, name, column)
+        return table
+
+    def head(self, count: int) -> "MovieTable":
+        """
+        Returns the first movies of the table, sharing the columns of this table.
+
+        :param count: Number of movies.
+        :return: A MovieTable of the first `count` movies.
+        """
+        if count >= len(self):
+            return self
+        end = int(self.genre_offsets[count])
+        return MovieTable.from_columns(**{
+            **vars(self),
+            "ids": self.ids[:count],
+            "titles": self.titles[:count],
+            "release_dates": self.release_dates[:count],
+            "poster_paths": self.poster_paths[:count],
+            "years": self.years[:count],
+            "popularity": self.popularity[:count],
+            "vote_average": self.vote_average[:count],
+            "adult": self.adult[:count],
+            "language_codes": self.language_codes[:count],
+            "genre_offsets": self.genre_offsets[:count + 1],
+            "genre_values": self.genre_values[:end],
+            "genre_bitmask": None if self.genre_bitmask is None else self.genre_bitmask[:count],
+        })
+
+    def genre_ids(self, row: int) -> List[int]:
+        """
+        Gets the genre IDs of a movie.
+
+        :param row: The row of the movie.
+        :return: The genre IDs of the movie, in their original order.
+        """
+        return self.genre_values[self.genre_offsets[row]:self.genre_offsets[row + 1]].tolist()
+
+    def genre_rows(self) -> np.ndarray:
+        """
+        Gets the row of each entry of `genre_values`.
+
+        :return: An array as long as `genre_values`.
+        """
+        return np.repeat(np.arange(len(self)), np.diff(self.genre_offsets))
+
+    def __getitem__(self, row: int) -> Movie:
+        """
+        Gets a movie of the table.
+
+        :param row: The row of the movie.
+        :return: A Movie with the values of the row.
+        """
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("MovieTable index out of range")
+        return Movie(
+            id=int(self.ids[row]),
+            title=self.titles[row],
+            genre_ids=self.genre_ids(row),
+            release_date=self.release_dates[row],
+            popularity=float(self.popularity[row]),
+            vote_average=float(self.vote_average[row]),
+            adult=bool(self.adult[row]),
+            original_language=self.languages[self.language_codes[row]],
+            poster_path=self.poster_paths[row],
+        )
+
+    def __iter__(self) -> Iterator[Movie]:
+        """
+        Iterates over the movies of the table.
+        """
+        return (self[row] for row in range(len(self)))
+
+    def __len__(self) -> int:
+        """
+        Number of movies in the table.
+        """
+        return len(self.titles)
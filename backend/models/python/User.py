@@ -1,5 +1,10 @@
-from typing import List
+import logging
+from typing import List, Dict, Optional
 from backend.models.python.Movie import Movie
+from backend.utils.lisp_encoder import user_to_lisp
+from backend.utils.catalogue_store import normalize_title
+
+logger = logging.getLogger(__name__)
 
 
 class User:
@@ -19,51 +24,79 @@ class User:
         self.favorite_movies: List[Movie] = []
         self.mood_movies: List[Movie] = []
 
+    @staticmethod
+    def is_valid_age(age) -> bool:
+        """
+        Checks an age received from a request: the engines and the recommendation cache compare it to 18.
+
+        :param age: The age to check.
+        :return: True if the age is a non-negative integer.
+        """
+        return isinstance(age, int) and not isinstance(age, bool) and age >= 0
+
+    @staticmethod
+    def is_valid_titles(titles) -> bool:
+        """
+        Checks movie titles received from a request (favoriteMovies or moodMovies).
+
+        :param titles: The titles to check.
+        :return: True if the titles are a list of strings.
+        """
+        return isinstance(titles, list) and all(isinstance(title, str) for title in titles)
+
+    def set_movies(self, favorite_titles: List[str], mood_titles: List[str],
+                   resolved: Optional[Dict[str, Optional[Movie]]] = None):
+        """
+        Sets the user's favorite and mood movies, resolving all the titles in one batch
+        (cache index first, then parallel API searches and a single cache write).
+        :param favorite_titles: List of favorite movie titles to search for.
+        :param mood_titles: List of mood movie titles to search for.
+        :param resolved: Movies already resolved by normalized title (e.g. for several users at once).
+        """
+        from backend.services.movie_selector import resolve_titles
+        movies = resolved if resolved is not None else resolve_titles(list(favorite_titles) + list(mood_titles))
+        self.favorite_movies = self._select_movies(movies, favorite_titles, "favorites")
+        self.mood_movies = self._select_movies(movies, mood_titles, "mood")
+
     def set_favorite_movies(self, titles: List[str]):
         """
         Sets the user's favorite movies by querying the API or cache.
         :param titles: List of movie titles to search for.
         """
-        from services.movie_selector import fetch_movie_by_title
-        self.favorite_movies.clear()
-        for title in titles:
-            print(f"Fetching movie for title: {title}")
-            movie = fetch_movie_by_title(title)
-            if movie:
-                print(f"Added '{movie.title}' to favorites.")
-                self.favorite_movies.append(movie)
-            else:
-                raise Exception(f"Movie not found for title: {title}")
+        from backend.services.movie_selector import resolve_titles
+        self.favorite_movies = self._select_movies(resolve_titles(titles), titles, "favorites")
 
     def set_mood_movies(self, titles: List[str]):
-        from services.movie_selector import fetch_movie_by_title
-        self.mood_movies.clear()
+        from backend.services.movie_selector import resolve_titles
+        self.mood_movies = self._select_movies(resolve_titles(titles), titles, "mood")
+
+    @staticmethod
+    def _select_movies(movies: Dict[str, Optional[Movie]], titles: List[str], label: str) -> List[Movie]:
+        """
+        Picks the resolved movies of a list of titles, in the order of the titles.
+        :param movies: The movies resolved by normalized title.
+        :param titles: List of movie titles.
+        :param label: Name of the list, for the logs.
+        :return: The movies of the titles.
+        :raises Exception: If a title was not found.
+        """
+        selected = []
         for title in titles:
-            print(f"Fetching movie for title: {title}")
-            movie = fetch_movie_by_title(title)
+            movie = movies.get(normalize_title(title))
             if movie:
-                print(f"Added '{movie.title}' to mood.")
-                self.mood_movies.append(movie)
+                logger.debug("Added '%s' to %s.", movie.title, label)
+                selected.append(movie)
             else:
                 raise Exception(f"Movie not found for title: {title}")
+        return selected
 
     def to_lisp(self) -> str:
         """
-        Convert the user and their favorite movies to a Lisp s-expression.
+        Convert the user and their favorite movies to a Lisp s-expression, with escaped strings.
         Example:
           (user . ((name . "Alice") (age . 25) (movies . (...)) (mood_movies . (...))))
         """
-        user_part = f'(:name . "{self.name}") (:age . {self.age})'
-        movies_parts = [movie.to_lisp() for movie in self.favorite_movies]
-        mood_movies_parts = [movie.to_lisp() for movie in self.mood_movies]
-
-        movies_list = "(" + " ".join(movies_parts) + ")"
-        mood_movies_list = "(" + " ".join(mood_movies_parts) + ")"
-
-        movies_part = f'(:movies . {movies_list})'
-        mood_movies_part = f'(:mood_movies . {mood_movies_list})'
-
-        return f"({user_part} {movies_part} {mood_movies_part})"
+        return user_to_lisp(self)
 
     def __str__(self):
         """
@@ -1,47 +1,131 @@
 import json
+import logging
 import os
 
-import requests
 from flask import Blueprint, request, jsonify
-from backend.config.constants import CACHE_PATH
+from backend.config.constants import CACHE_PATH, DEFAULT_RECOMMENDATIONS, DEFAULT_CANDIDATE_WINDOW, \
+    SEARCH_RESULTS_LIMIT, BATCH_MAX_USERS, MAX_RECOMMENDATIONS, MAX_CANDIDATE_WINDOW
 from backend.models.python.User import User
-from backend.services.data_formatter import get_data_as_lisp
-from backend.services.movie_selector import call_expert_system
-from backend.utils.api_key_manager import get_api_key
+from backend.services.movie_search import search_movies, get_search_cache_stats
+from backend.services.movie_selector import recommend_movies, recommend_movies_batch, resolve_titles
+from backend.services.recommendation_cache import get_recommendation_cache_stats
+
+logger = logging.getLogger(__name__)
 
 # Crée un Blueprint pour les routes API
 api_bp = Blueprint('api', __name__)
 
+LIMITS_ERROR = f"n must be an integer from 1 to {MAX_RECOMMENDATIONS} and window from 1 to {MAX_CANDIDATE_WINDOW}"
+PROFILE_ERROR = "age must be a non-negative integer, favoriteMovies and moodMovies lists of titles"
+
+
+def is_valid_limit(value, maximum: int) -> bool:
+    """
+    Checks a count sent by a client (n or window): an int (not a bool) from 1 to `maximum`.
+
+    :param value: The value to check.
+    :param maximum: The largest accepted value.
+    :return: True if the value is valid.
+    """
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= maximum
+
+
+def is_valid_profile(data) -> bool:
+    """
+    Checks a user profile sent by a client: an object with a valid age and lists of titles.
+
+    :param data: The profile.
+    :return: True if the profile is valid.
+    """
+    return (isinstance(data, dict) and User.is_valid_age(data.get("age"))
+            and User.is_valid_titles(data.get("favoriteMovies", []))
+            and User.is_valid_titles(data.get("moodMovies", [])))
+
 
 @api_bp.route('/submit-movies', methods=['POST'])
 def submit_movies():
     try:
         # Récupérer les données envoyées par le formulaire
         data = request.json
-        print(f"Received data: {data}")  # Log les données reçues
+        logger.debug("Received data: %s", data)  # Log les données reçues
         name = data.get("name")
         age = data.get("age")
         favorite_movies = data.get("favoriteMovies", [])
         mood_movies = data.get("moodMovies", [])
+        n = data.get("n", DEFAULT_RECOMMENDATIONS)  # Nombre de films recommandés
+        window = data.get("window", DEFAULT_CANDIDATE_WINDOW)  # Nombre de meilleurs candidats considérés
+        if not (is_valid_limit(n, MAX_RECOMMENDATIONS) and is_valid_limit(window, MAX_CANDIDATE_WINDOW)):
+            return jsonify({"error": LIMITS_ERROR}), 400
+        if not is_valid_profile(data):
+            return jsonify({"error": PROFILE_ERROR}), 400
 
-        print(f"Name: {name}, Age: {age}, Favorite Movies: {favorite_movies}, Mood Movies: {mood_movies}")
+        logger.debug("Name: %s, Age: %s, Favorite Movies: %s, Mood Movies: %s", name, age, favorite_movies,
+                     mood_movies)
 
         # Appeler le système expert (simulez une réponse pour tester)
         user = User(name=name, age=age)
-        user.set_favorite_movies(favorite_movies)
-        user.set_mood_movies(mood_movies)
+        user.set_movies(favorite_movies, mood_movies)  # Tous les titres sont résolus en une fois
 
-        lisp_data = get_data_as_lisp(CACHE_PATH, user)  # Conversion en Lisp
-        json_response = call_expert_system(lisp_data)  # Appel au système expert
-        print(f"Expert system response: {json_response}")
+        json_response = recommend_movies(user, CACHE_PATH, n=n, window=window)  # Appel au système expert
+        logger.debug("Expert system response: %s", json_response)
 
         return json_response  # Retourner la réponse du système expert
     except json.JSONDecodeError as json_error:
-        print("JSON parsing failed:", json_error)
+        logger.error("JSON parsing failed: %s", json_error)
         return jsonify({"error": "JSON parsing failed", "details": str(json_error)}), 500
 
+    except TimeoutError as timeout_error:
+        logger.warning("An upstream timed out: %s", timeout_error)
+        return jsonify({"error": "The service is busy, please try again", "details": str(timeout_error)}), 504
+
+    except Exception as e:
+        logger.exception("An unexpected error occurred: %s", e)
+        return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
+
+
+@api_bp.route('/recommend-batch', methods=['POST'])
+def recommend_batch():
+    try:
+        # Plusieurs profils en une requête : les titres sont résolus et le catalogue préparé une seule fois
+        data = request.json
+        users_data = data.get("users", [])
+        n = data.get("n", DEFAULT_RECOMMENDATIONS)
+        window = data.get("window", DEFAULT_CANDIDATE_WINDOW)
+        if not (is_valid_limit(n, MAX_RECOMMENDATIONS) and is_valid_limit(window, MAX_CANDIDATE_WINDOW)):
+            return jsonify({"error": LIMITS_ERROR}), 400
+        if not isinstance(users_data, list) or len(users_data) > BATCH_MAX_USERS:
+            return jsonify({"error": f"users must be a list of at most {BATCH_MAX_USERS} users"}), 400
+        invalid = [position for position, u in enumerate(users_data) if not is_valid_profile(u)]
+        if invalid:
+            return jsonify({"error": PROFILE_ERROR, "users": invalid}), 400
+
+        logger.debug("Received batch of %d users", len(users_data))
+        titles = [title for u in users_data for title in u.get("favoriteMovies", []) + u.get("moodMovies", [])]
+        resolved = resolve_titles(titles)
+
+        # Un utilisateur dont un titre est introuvable reçoit une erreur, les autres sont recommandés
+        results = [{"name": u.get("name")} for u in users_data]
+        users, positions = [], []
+        for position, u in enumerate(users_data):
+            user = User(name=u.get("name"), age=u.get("age"))
+            try:
+                user.set_movies(u.get("favoriteMovies", []), u.get("moodMovies", []), resolved)
+            except Exception as e:
+                results[position]["error"] = str(e)
+                continue
+            users.append(user)
+            positions.append(position)
+
+        for position, recommendations in zip(positions, recommend_movies_batch(users, CACHE_PATH, n, window)):
+            results[position]["recommendations"] = recommendations
+        return jsonify(results)
+
+    except TimeoutError as timeout_error:
+        logger.warning("An upstream timed out: %s", timeout_error)
+        return jsonify({"error": "The service is busy, please try again", "details": str(timeout_error)}), 504
+
     except Exception as e:
-        print("An unexpected error occurred:", e)
+        logger.exception("An unexpected error occurred: %s", e)
         return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
 
 
@@ -51,17 +135,19 @@ def search_movie():
     if not query:
         return jsonify({"error": "Query parameter is required"}), 400
 
-    url = f"https://api.themoviedb.org/3/search/movie"
-    params = {
-        "api_key": get_api_key(),
-        "query": query
-    }
-
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        limited_results = data.get('results', [])[:5]
+        # Recherche d'abord dans le catalogue local, puis sur TMDB (résultats mis en cache)
+        limited_results = search_movies(query, SEARCH_RESULTS_LIMIT)
         return jsonify(limited_results)
-    except requests.RequestException as e:
+    except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@api_bp.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    # Compteurs du worker courant (le cache SQLite des recommandations est partagé entre workers)
+    return jsonify({
+        "pid": os.getpid(),
+        "recommendations": get_recommendation_cache_stats(),
+        "search": get_search_cache_stats(),
+    })
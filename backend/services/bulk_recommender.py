@@ -0,0 +1,218 @@
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List, Dict, Optional, Iterator, TextIO
+
+from backend.config.constants import CACHE_PATH, DEFAULT_RECOMMENDATIONS, DEFAULT_CANDIDATE_WINDOW, \
+    EXPERT_SYSTEM_ENGINE, EXPERT_SYSTEM_USE_POOL, MAX_RECOMMENDATIONS, MAX_CANDIDATE_WINDOW
+from backend.models.python.Movie import Movie
+from backend.models.python.User import User
+from backend.services.expert_system_pool import get_expert_system_pool
+from backend.services.movie_selector import recommend_movies_batch
+from backend.services.native_engine import get_native_catalogue
+from backend.utils.catalogue_store import get_catalogue, normalize_title
+
+
+# ---------------------------------------------------------------------------------------------------
+# Worker processes
+# ---------------------------------------------------------------------------------------------------
+
+def init_worker(verbose: bool):
+    """
+    Prepares a worker process: loads the catalogue once (and the native engine arrays when it is
+    the selected engine), and logs the debug messages if `verbose`.
+
+    With the SBCL engine, each worker process gets a pool of a single SBCL worker: the processes
+    already run one per CPU, so a pool of EXPERT_SYSTEM_POOL_SIZE workers in each of them would start
+    about CPU² SBCL processes, each holding its own copy of the catalogue.
+
+    :param verbose: If True, keep the debug output of the worker.
+    """
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.WARNING)
+    get_catalogue(CACHE_PATH)
+    if EXPERT_SYSTEM_ENGINE == "native":
+        get_native_catalogue(CACHE_PATH)
+    elif EXPERT_SYSTEM_USE_POOL:
+        get_expert_system_pool(size=1)
+
+
+def resolve_titles_from_cache(titles: List[str]) -> Dict[str, Optional[Movie]]:
+    """
+    Resolves titles from the catalogue only (no API request in bulk runs).
+
+    :param titles: The titles of the movies.
+    :return: The Movie found for each normalized title (None if not in the catalogue).
+    """
+    catalogue = get_catalogue(CACHE_PATH)
+    resolved = {}
+    for title in titles:
+        movie_data = catalogue.find_by_title(title)
+        resolved[normalize_title(title)] = Movie.from_dict(movie_data) if movie_data is not None else None
+    return resolved
+
+
+def recommend_chunk(lines: List[str], n: int, window: int) -> List[str]:
+    """
+    Recommends movies to a chunk of profiles with one engine call.
+
+    :param lines: JSON lines of profiles ({"name", "age", "favoriteMovies", "moodMovies"}).
+    :param n: Number of movies to recommend to each user.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :return: One JSON line per profile, with "recommendations" or "error".
+    """
+    results: List[Dict] = []
+    users, positions = [], []
+    for line in lines:
+        result = {}
+        results.append(result)
+        try:
+            profile = json.loads(line)
+            result.update({key: profile[key] for key in ("id", "name") if key in profile})
+            favorite_titles = profile.get("favoriteMovies", [])
+            mood_titles = profile.get("moodMovies", [])
+            if not User.is_valid_age(profile.get("age")):
+                raise ValueError("age must be a non-negative integer")
+            if not (User.is_valid_titles(favorite_titles) and User.is_valid_titles(mood_titles)):
+                raise ValueError("favoriteMovies and moodMovies must be lists of titles")
+            user = User(name=profile.get("name"), age=profile.get("age"))
+            user.set_movies(favorite_titles, mood_titles, resolve_titles_from_cache(favorite_titles + mood_titles))
+        except Exception as e:
+            result["error"] = str(e)
+            continue
+        users.append(user)
+        positions.append(len(results) - 1)
+
+    if users:
+        try:
+            for position, recommendations in zip(positions, recommend_movies_batch(users, CACHE_PATH, n, window)):
+                results[position]["recommendations"] = recommendations
+        except Exception as e:
+            for position in positions:
+                results[position]["error"] = str(e)
+    return [json.dumps(result, ensure_ascii=False) for result in results]
+
+
+# ---------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------
+
+def read_chunks(input_file: TextIO, chunk_size: int) -> Iterator[List[str]]:
+    """
+    Reads the non-empty lines of a file by chunks, without loading the whole file.
+
+    :param input_file: The opened JSONL file.
+    :param chunk_size: Number of lines per chunk.
+    :return: An iterator over the chunks.
+    """
+    lines = (line for line in input_file if line.strip())
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_bulk_recommendations(
+        input_path: str,
+        output_path: str,
+        n: int = DEFAULT_RECOMMENDATIONS,
+        window: int = DEFAULT_CANDIDATE_WINDOW,
+        workers: Optional[int] = None,
+        chunk_size: int = 64,
+        progress_interval: float = 5.0,
+        verbose: bool = False,
+) -> Dict[str, float]:
+    """
+    Recommends movies to every profile of a JSONL file and writes one JSON line per profile, in the
+    order of the input.
+
+    The input is read and the output written incrementally: at most two chunks per worker process
+    are in flight, so memory does not grow with the number of profiles.
+
+    :param input_path: Path to the JSONL file of profiles.
+    :param output_path: Path to the JSONL output file.
+    :param n: Number of movies to recommend to each user.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :param workers: Number of worker processes (the CPU count by default).
+    :param chunk_size: Number of profiles sent to a worker at once.
+    :param progress_interval: Seconds between two progress reports on stderr.
+    :param verbose: If True, keep the debug output of the workers.
+    :return: The statistics of the run ("profiles", "errors", "seconds", "profiles_per_second").
+    """
+    workers = workers or os.cpu_count() or 1
+    start = last_report = time.monotonic()
+    profiles = errors = 0
+
+    def report(final: bool = False):
+        elapsed = time.monotonic() - start
+        rate = profiles / elapsed if elapsed > 0 else 0.0
+        label = "Done" if final else "Progress"
+        print(f"[{label}] {profiles} profiles ({errors} errors) in {elapsed:.1f}s - {rate:.1f} profiles/s",
+              file=sys.stderr)
+
+    with open(input_path, "r", encoding="utf-8") as input_file, \
+            open(output_path, "w", encoding="utf-8") as output_file, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(verbose,)) as executor:
+        chunks = read_chunks(input_file, chunk_size)
+        in_flight = collections.deque()
+        while True:
+            # Garde deux paquets par worker en cours, puis écrit les résultats dans l'ordre d'entrée
+            while len(in_flight) < 2 * workers:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                in_flight.append(executor.submit(recommend_chunk, chunk, n, window))
+            if not in_flight:
+                break
+
+            output_lines = in_flight.popleft().result()
+            output_file.write("\n".join(output_lines) + "\n")
+            profiles += len(output_lines)
+            errors += sum('"error":' in line for line in output_lines)
+
+            if time.monotonic() - last_report >= progress_interval:
+                output_file.flush()
+                report()
+                last_report = time.monotonic()
+
+    report(final=True)
+    elapsed = time.monotonic() - start
+    return {
+        "profiles": profiles,
+        "errors": errors,
+        "seconds": elapsed,
+        "profiles_per_second": profiles / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+# ---------------------------------------------------------------------------------------------------
+# Main Execution Block
+# ---------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    """
+    Recommends movies to the profiles of a JSONL file:
+        python -m backend.services.bulk_recommender profiles.jsonl recommendations.jsonl
+    Titles are only resolved from the movie cache; the engine is selected by EXPERT_SYSTEM_ENGINE.
+    """
+    parser = argparse.ArgumentParser(description="Recommend movies to the profiles of a JSONL file.")
+    parser.add_argument("input", help="JSONL file of profiles (name, age, favoriteMovies, moodMovies)")
+    parser.add_argument("output", help="JSONL file receiving one line of recommendations per profile")
+    parser.add_argument("-n", type=int, default=DEFAULT_RECOMMENDATIONS, help="movies recommended per profile")
+    parser.add_argument("--window", type=int, default=DEFAULT_CANDIDATE_WINDOW, help="candidate window")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=64, help="profiles per engine call")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress reports")
+    parser.add_argument("--verbose", action="store_true", help="keep the debug output of the workers")
+    args = parser.parse_args()
+    if not (0 < args.n <= MAX_RECOMMENDATIONS and 0 < args.window <= MAX_CANDIDATE_WINDOW):
+        parser.error(f"n must be from 1 to {MAX_RECOMMENDATIONS} and window from 1 to {MAX_CANDIDATE_WINDOW}")
+
+    run_bulk_recommendations(args.input, args.output, args.n, args.window, args.workers, args.chunk_size,
+                             args.progress_interval, args.verbose)
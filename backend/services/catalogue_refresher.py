@@ -0,0 +1,274 @@
+import argparse
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from backend.config.constants import CACHE_PATH, CATALOGUE_SNAPSHOT_PATH, CATALOGUE_SNAPSHOT_ENABLED, \
+    CATALOGUE_REFRESH_INTERVAL, CATALOGUE_REFRESH_MOVIES, CATALOGUE_WATCH_INTERVAL, CATALOGUE_REFRESH_LOCK_PATH, \
+    CATALOGUE_REFRESH_STATE_PATH, REFRESH_CHECKPOINT_PATH, EXPERT_SYSTEM_ENGINE, LOG_LEVEL
+from backend.services.movie_loader import fetch_movies_from_api, update_cache_incrementally
+from backend.services.movie_search import TitleIndex, publish_title_index
+from backend.services.movie_selector import get_catalogue_payload
+from backend.services.native_engine import build_native_catalogue, publish_native_catalogue
+from backend.utils.cache_manager import get_cache_version
+from backend.utils.catalogue_snapshot import build_snapshot
+from backend.utils.catalogue_store import load_catalogue, publish_catalogue, watch_catalogue, get_catalogue
+from backend.utils.metrics import span
+from backend.utils.tmdb_client import TmdbClient
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------
+
+def refresh_catalogue(
+        cache_path: str = CACHE_PATH,
+        number_of_movies: int = CATALOGUE_REFRESH_MOVIES,
+        client: Optional[TmdbClient] = None,
+        snapshot_path: Optional[str] = CATALOGUE_SNAPSHOT_PATH if CATALOGUE_SNAPSHOT_ENABLED else None,
+) -> Dict[str, int]:
+    """
+    Fetches the popular movies and writes the new and changed ones to the cache.
+
+    The cache backends replace the cache atomically (renamed temporary file, or one SQLite
+    transaction), so readers see either the previous version or the new one.
+
+    :param cache_path: Path to the cache file.
+    :param number_of_movies: Number of popular movies to fetch.
+    :param client: The TMDB client (the process-wide client by default).
+    :param snapshot_path: Catalogue snapshot recompiled after a change (None to leave it).
+    :return: The number of fetched, added and updated movies.
+    """
+    with span("catalogue_refresh"):
+        # Pages are revalidated with TMDB (conditional requests), never taken from the response cache as they are
+        fetched = fetch_movies_from_api(number_of_movies, client, REFRESH_CHECKPOINT_PATH, resume=False, max_age=0)
+        added, updated = update_cache_incrementally(fetched, cache_path)
+        if snapshot_path and (added or updated):
+            build_snapshot(cache_path, snapshot_path)
+    return {"fetched": len(fetched), "added": added, "updated": updated}
+
+
+def warm_catalogue(cache_path: str = CACHE_PATH) -> str:
+    """
+    Builds the in-memory structures of the current cache version (catalogue indexes, title index,
+    and the native tables or the Lisp rendering of the selected engine) from one catalogue, then
+    publishes them, so that requests switch to the new version without building anything.
+
+    :param cache_path: Path to the cache file.
+    :return: The version of the cache that was loaded.
+    """
+    catalogue = load_catalogue(cache_path)
+    index = TitleIndex(catalogue.movies, catalogue.version)
+    native_catalogue = None
+    if EXPERT_SYSTEM_ENGINE == "native":
+        native_catalogue = build_native_catalogue(cache_path, catalogue)
+    else:
+        get_catalogue_payload(cache_path, catalogue)
+
+    publish_title_index(cache_path, index)
+    if native_catalogue is not None:
+        publish_native_catalogue(cache_path, native_catalogue)
+    publish_catalogue(cache_path, catalogue)
+    return catalogue.version
+
+
+def read_refresh_state(state_path: str = CATALOGUE_REFRESH_STATE_PATH) -> Dict:
+    """
+    Reads the state of the last refresh shared by the workers ({} if there was none).
+    """
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_refresh_state(state: Dict, state_path: str = CATALOGUE_REFRESH_STATE_PATH):
+    """
+    Writes the state of the last refresh, through a temporary file renamed over the previous one.
+    """
+    directory = os.path.dirname(state_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".catalogue_refresh-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# ---------------------------------------------------------------------------------------------------
+# Scheduler
+# ---------------------------------------------------------------------------------------------------
+
+class CatalogueRefresher:
+    """
+    Background thread refreshing the catalogue on an interval and reloading new cache versions.
+
+    Every gunicorn worker (and the optional sidecar, `python -m backend.services.catalogue_refresher`)
+    runs a refresher. A refresh is done by one of them at a time: it takes an exclusive lock on a
+    file of the cache directory, and skips the refresh if the shared state file shows that another
+    process refreshed less than an interval ago. Every refresher then notices the new cache version
+    and builds its in-memory structures off the request path; requests keep the previous version
+    until the new one is published, and never load a version themselves once the refresher watches
+    the cache (`watch_catalogue`).
+    """
+
+    def __init__(
+            self,
+            cache_path: str = CACHE_PATH,
+            interval: float = CATALOGUE_REFRESH_INTERVAL,
+            watch_interval: float = CATALOGUE_WATCH_INTERVAL,
+            number_of_movies: int = CATALOGUE_REFRESH_MOVIES,
+            warm: bool = True,
+    ):
+        """
+        Initializes a CatalogueRefresher instance.
+
+        :param cache_path: Path to the cache file.
+        :param interval: Seconds between two refreshes (0 to only reload the versions written by others).
+        :param watch_interval: Seconds between two checks of the cache version (and of a due refresh).
+        :param number_of_movies: Number of popular movies fetched by a refresh.
+        :param warm: If True, load each new cache version in memory (False for the sidecar).
+        """
+        self.cache_path = cache_path
+        self.interval = interval
+        self.watch_interval = watch_interval
+        self.number_of_movies = number_of_movies
+        self.warm = warm
+        self.loaded_version: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh_if_due(self, force: bool = False) -> Optional[Dict]:
+        """
+        Refreshes the catalogue unless another process is refreshing it or refreshed it less than an
+        interval ago.
+
+        :param force: If True, refresh even if the last refresh is recent.
+        :return: The statistics of the refresh, or None if it was skipped.
+        """
+        os.makedirs(os.path.dirname(CATALOGUE_REFRESH_LOCK_PATH), exist_ok=True)
+        with open(CATALOGUE_REFRESH_LOCK_PATH, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None  # Un autre processus rafraîchit le catalogue
+            try:
+                last_refresh = read_refresh_state().get("last_refresh", 0.0)
+                if not force and time.time() - last_refresh < self.interval:
+                    return None
+
+                start = time.monotonic()
+                try:
+                    stats = refresh_catalogue(self.cache_path, self.number_of_movies)
+                except Exception as e:
+                    # L'échec est enregistré : le prochain essai a lieu à l'intervalle suivant
+                    logger.error("Catalogue refresh failed: %s", e)
+                    write_refresh_state({"last_refresh": time.time(), "error": str(e)})
+                    return None
+                stats["seconds"] = round(time.monotonic() - start, 3)
+                write_refresh_state({"last_refresh": time.time(), **stats})
+                logger.info("Catalogue refreshed: %s", stats)
+                return stats
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Loads the current cache version in memory if it is not loaded yet, or if a request published
+        another version of the catalogue since (see `publish_written_catalogue`).
+
+        :return: True if a new version was loaded.
+        """
+        version = get_cache_version(self.cache_path)
+        if version == self.loaded_version and version == get_catalogue(self.cache_path).version:
+            return False
+        self.loaded_version = warm_catalogue(self.cache_path)
+        logger.debug("Catalogue version %s loaded in the background", self.loaded_version)
+        return True
+
+    def run(self):
+        """
+        Runs the refresh loop until `stop` is called.
+        """
+        while True:
+            try:
+                if self.interval > 0:
+                    self.refresh_if_due()
+                if self.warm:
+                    self.reload_if_changed()
+            except Exception as e:
+                logger.error("Catalogue refresher error: %s", e)
+            if self._stop.wait(self.watch_interval):
+                return
+
+    def start(self):
+        """
+        Starts the refresh loop in a daemon thread.
+        """
+        if self.warm:
+            watch_catalogue(self.cache_path)
+        self._thread = threading.Thread(target=self.run, name="catalogue-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the refresh loop.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_refresher: Optional[CatalogueRefresher] = None
+_refresher_lock = threading.Lock()
+
+
+def start_catalogue_refresher(cache_path: str = CACHE_PATH) -> CatalogueRefresher:
+    """
+    Starts the catalogue refresher of the current process (once).
+
+    :param cache_path: Path to the cache file.
+    :return: The CatalogueRefresher instance.
+    """
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = CatalogueRefresher(cache_path)
+            _refresher.start()
+        return _refresher
+
+
+# ---------------------------------------------------------------------------------------------------
+# Main Execution Block
+# ---------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    """
+    Refreshes the catalogue as a sidecar of the web workers:
+        python -m backend.services.catalogue_refresher --interval 3600
+        python -m backend.services.catalogue_refresher --once
+    """
+    parser = argparse.ArgumentParser(description="Refresh the movie catalogue from TMDB.")
+    parser.add_argument("--interval", type=float, default=CATALOGUE_REFRESH_INTERVAL or 3600,
+                        help="seconds between two refreshes")
+    parser.add_argument("--movies", type=int, default=CATALOGUE_REFRESH_MOVIES, help="popular movies fetched")
+    parser.add_argument("--once", action="store_true", help="refresh once now and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=LOG_LEVEL)
+
+    refresher = CatalogueRefresher(interval=args.interval, number_of_movies=args.movies, warm=False)
+    if args.once:
+        print(refresher.refresh_if_due(force=True))
+    else:
+        refresher.run()
@@ -1,34 +1,221 @@
+import io
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
 from backend.models.python.User import User
-from backend.config.constants import CACHE_PATH
+from backend.config.constants import CACHE_PATH, EXPERT_SYSTEM_CATALOGUE_SIZE
+from backend.utils.lisp_encoder import movie_to_lisp, movie_to_line, write_lisp_string, write_user, \
+    users_to_lisp
 from backend.services.movie_loader import load_movies
+from backend.utils.cache_manager import get_cache_version, cache_exists
+from backend.utils.catalogue_store import MovieCatalogue, get_catalogue
+
+logger = logging.getLogger(__name__)
 
 
-def get_movies_from_cache_as_lisp(cache_path: str = CACHE_PATH) -> str:
+class LispCatalogue:
+    """
+    Rendu Lisp mémoïsé du catalogue, partagé entre les requêtes.
+
+    Le rendu est conservé tant que la version du cache ne change pas (chaque écriture du cache
+    change sa version). Chaque film garde son fragment Lisp pré-calculé : après une écriture,
+    seuls les films ajoutés ou modifiés sont encodés à nouveau. Le rendu de la version précédente
+    est gardé aussi : les requêtes qui tiennent encore l'ancien catalogue pendant le passage à la
+    nouvelle version ne le ré-encodent pas.
+
+    En format compact, chaque film est une ligne du format lu par `read-catalogue-lines`
+    (voir `lisp_encoder`) au lieu d'une liste d'association.
+    """
+
+    def __init__(self, size: int, compact: bool = False):
+        """
+        Initialise un rendu vide.
+
+        :param size: Nombre maximum de films envoyés au système expert.
+        :param compact: Si True, rendu au format compact (une ligne par film).
+        """
+        self.size = size
+        self.compact = compact
+        self._rendered: Tuple[Optional[str], str] = (None, "" if compact else "()")  # (version, rendu)
+        self._previous: Tuple[Optional[str], str] = self._rendered
+        self._fragments: Dict[Tuple[int, int], Tuple[Dict, str]] = {}
+        self._lock = threading.Lock()
+
+    def render(self, catalogue: MovieCatalogue) -> str:
+        """
+        Retourne la liste Lisp des films du catalogue, en réutilisant les fragments déjà encodés.
+
+        :param catalogue: Le catalogue indexé du cache.
+        :return: Une chaîne contenant la liste des films au format Lisp (ou les lignes du format compact).
+        """
+        for version, text in (self._rendered, self._previous):
+            if version == catalogue.version:
+                return text
+
+        with self._lock:
+            if self._previous[0] == catalogue.version:
+                return self._previous[1]
+            if self._rendered[0] != catalogue.version:
+                fragments = {}
+                occurrences: Dict[int, int] = {}
+                encode = movie_to_line if self.compact else movie_to_lisp
+                buffer = io.StringIO()
+                count = encoded = 0
+                for movie_data in catalogue.movies[:self.size]:
+                    # Un même ID peut apparaître plusieurs fois dans le cache
+                    occurrence = occurrences[movie_data.get("id")] = occurrences.get(movie_data.get("id"), -1) + 1
+                    key = (movie_data.get("id"), occurrence)
+                    cached = self._fragments.get(key)
+                    if cached is None or cached[0] != movie_data:
+                        cached = (movie_data, encode(movie_data))
+                        encoded += 1
+                    fragments[key] = cached
+                    buffer.write(cached[1])
+                    buffer.write("\n" if self.compact else " ")
+                    count += 1
+                logger.debug("Lisp catalogue %s: %d movies encoded, %d reused", catalogue.version, encoded,
+                             count - encoded)
+                self._fragments = fragments
+                rendered = buffer.getvalue()
+                self._previous = self._rendered
+                self._rendered = (catalogue.version, rendered if self.compact else "(" + rendered[:-1] + ")")
+            return self._rendered[1]
+
+
+_lisp_catalogues: Dict[Tuple[str, bool], LispCatalogue] = {}
+_lisp_catalogues_lock = threading.Lock()
+
+
+def get_movies_from_cache_as_lisp(cache_path: str = CACHE_PATH, compact: bool = False,
+                                  catalogue: Optional[MovieCatalogue] = None) -> str:
     """
     Génère une liste Lisp à partir des films du cache.
+    Le rendu est mémoïsé par version du cache et partagé entre les requêtes.
 
     :param cache_path: Chemin vers le fichier de cache JSON.
+    :param compact: Si True, génère les lignes du format compact au lieu d'une liste Lisp.
+    :param catalogue: Le catalogue à rendre (par défaut, celui du cache).
     :return: Une chaîne contenant la liste des films au format Lisp.
     """
-    # movies_data = load_cache(cache_path)
-    movies_data = load_movies(2000, True, False)
-    lisp_movies = [m.to_lisp() for m in movies_data]
-    return "(" + " ".join(lisp_movies) + ")"
+    if not cache_exists(cache_path):
+        # Sans cache, les films sont récupérés depuis l'API
+        movies_data = [m.to_dict() for m in load_movies(EXPERT_SYSTEM_CATALOGUE_SIZE, True, False)]
+        if compact:
+            return "".join(movie_to_line(m) + "\n" for m in movies_data)
+        return "(" + " ".join(movie_to_lisp(m) for m in movies_data) + ")"
+
+    with _lisp_catalogues_lock:
+        lisp_catalogue = _lisp_catalogues.setdefault((cache_path, compact),
+                                                      LispCatalogue(EXPERT_SYSTEM_CATALOGUE_SIZE, compact))
+    return lisp_catalogue.render(catalogue or get_catalogue(cache_path))
 
 
-def get_data_as_lisp(cache_path: str, user: User) -> str:
+def get_data_as_lisp(cache_path: str, user: User, catalogue: Optional[MovieCatalogue] = None) -> str:
     """
     Génère une structure Lisp contenant les films en `car` et l'utilisateur en `cdr`.
 
     :param cache_path: Chemin vers le fichier de cache JSON.
     :param user: Instance de la classe User.
+    :param catalogue: Le catalogue à envoyer (par défaut, celui du cache).
     :return: Une chaîne contenant les films et l'utilisateur au format Lisp.
     """
 
-    movies_list = get_movies_from_cache_as_lisp(cache_path)
+    buffer = io.StringIO()
+    buffer.write("(")
+    buffer.write(get_movies_from_cache_as_lisp(cache_path, catalogue=catalogue))
+    buffer.write(" . ")
+    write_user(buffer, user)
+    buffer.write(")")
+    return buffer.getvalue()
+
+
+def get_batch_data_as_lisp(cache_path: str, users: List[User], catalogue: Optional[MovieCatalogue] = None) -> str:
+    """
+    Génère une structure Lisp contenant les films en `car` et la liste des utilisateurs en `cdr`,
+    pour recommander des films à plusieurs utilisateurs en un seul appel (batch=1).
+
+    :param cache_path: Chemin vers le fichier de cache JSON.
+    :param users: Liste d'instances de la classe User.
+    :param catalogue: Le catalogue à envoyer (par défaut, celui du cache).
+    :return: Une chaîne contenant les films et les utilisateurs au format Lisp.
+    """
+    return f"({get_movies_from_cache_as_lisp(cache_path, catalogue=catalogue)} . {users_to_lisp(users)})"
+
 
-    # Utilisateur
-    user_lisp = user.to_lisp()
+def get_catalogue_version(cache_path: str = CACHE_PATH) -> str:
+    """
+    Génère l'identifiant de version du catalogue à partir de la date de modification et de la taille du cache.
 
-    # Structure complète
-    return f"({movies_list} . {user_lisp})"
+    :param cache_path: Chemin vers le fichier de cache JSON.
+    :return: L'identifiant de version du catalogue (vide si le cache n'existe pas).
+    """
+    return get_cache_version(cache_path)
+
+
+def get_catalogue_as_lisp(cache_path: str, catalogue: MovieCatalogue) -> str:
+    """
+    Génère la structure Lisp `(version . films)` chargée une fois par le système expert (LOAD-CATALOGUE).
+    Les films et la version viennent du même catalogue, pour qu'un worker n'associe jamais
+    d'anciens films à une nouvelle version.
+
+    :param cache_path: Chemin vers le fichier de cache JSON.
+    :param catalogue: Le catalogue à envoyer.
+    :return: Une chaîne contenant la version et les films au format Lisp.
+    """
+    buffer = io.StringIO()
+    buffer.write("(")
+    write_lisp_string(buffer, catalogue.version)
+    buffer.write(" . ")
+    buffer.write(get_movies_from_cache_as_lisp(cache_path, catalogue=catalogue))
+    buffer.write(")")
+    return buffer.getvalue()
+
+
+def get_catalogue_as_lines(cache_path: str, catalogue: MovieCatalogue) -> str:
+    """
+    Génère le catalogue au format compact chargé par le système expert (LOAD-CATALOGUE-LINES) :
+    la version sur la première ligne, puis une ligne par film. Ce format est lu sans passer par le
+    lecteur Lisp général.
+
+    :param cache_path: Chemin vers le fichier de cache JSON.
+    :param catalogue: Le catalogue à envoyer.
+    :return: Une chaîne contenant la version et les films au format compact.
+    """
+    return catalogue.version + "\n" + get_movies_from_cache_as_lisp(cache_path, compact=True, catalogue=catalogue)
+
+
+def get_user_request_as_lisp(user: User, version: str) -> str:
+    """
+    Génère la structure Lisp `(version . utilisateur)` envoyée au système expert (RECOMMEND-USER)
+    lorsque le catalogue est déjà chargé en mémoire.
+
+    :param user: Instance de la classe User.
+    :param version: Identifiant de version du catalogue attendu.
+    :return: Une chaîne contenant la version et l'utilisateur au format Lisp.
+    """
+    buffer = io.StringIO()
+    buffer.write("(")
+    write_lisp_string(buffer, version)
+    buffer.write(" . ")
+    write_user(buffer, user)
+    buffer.write(")")
+    return buffer.getvalue()
+
+
+def get_users_request_as_lisp(users: List[User], version: str) -> str:
+    """
+    Génère la structure Lisp `(version . utilisateurs)` envoyée au système expert (RECOMMEND-USERS)
+    lorsque le catalogue est déjà chargé en mémoire.
+
+    :param users: Liste d'instances de la classe User.
+    :param version: Identifiant de version du catalogue attendu.
+    :return: Une chaîne contenant la version et les utilisateurs au format Lisp.
+    """
+    buffer = io.StringIO()
+    buffer.write("(")
+    write_lisp_string(buffer, version)
+    buffer.write(" . ")
+    buffer.write(users_to_lisp(users))
+    buffer.write(")")
+    return buffer.getvalue()
@@ -0,0 +1,310 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Optional, NamedTuple
+
+from backend.config.constants import CACHE_PATH, DISCOVER_MOVIES_URL, DEFAULT_LANGUAGE, TMDB_MAX_CONCURRENCY, \
+    DISCOVER_CHECKPOINT_PATH, DISCOVER_GENRE_IDS, DISCOVER_MAX_PAGES, DISCOVER_FLUSH_SIZE, \
+    CATALOGUE_SNAPSHOT_PATH, CATALOGUE_SNAPSHOT_ENABLED, LOG_LEVEL
+from backend.utils.cache_manager import upsert_cache
+from backend.utils.catalogue_snapshot import build_snapshot
+from backend.utils.tmdb_client import TmdbClient, get_tmdb_client
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------------------------------
+# Shards
+# ---------------------------------------------------------------------------------------------------
+
+class DiscoverShard(NamedTuple):
+    """
+    A /discover/movie query: the movies of a genre released between two dates (inclusive).
+    """
+    start: str
+    end: str
+    genre: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.start}:{self.end}:{self.genre}"
+
+    def params(self, page: int) -> Dict:
+        """
+        The query parameters of a page of the shard.
+        """
+        return {
+            "language": DEFAULT_LANGUAGE,
+            "sort_by": "popularity.desc",
+            "include_adult": "false",
+            "include_video": "false",
+            "primary_release_date.gte": self.start,
+            "primary_release_date.lte": self.end,
+            "with_genres": str(self.genre),
+            "page": page,
+        }
+
+    def split(self) -> List["DiscoverShard"]:
+        """
+        Splits the shard into two halves of its date range (none if it covers a single day).
+        """
+        start, end = datetime.date.fromisoformat(self.start), datetime.date.fromisoformat(self.end)
+        if start >= end:
+            return []
+        middle = start + (end - start) // 2
+        return [DiscoverShard(self.start, middle.isoformat(), self.genre),
+                DiscoverShard((middle + datetime.timedelta(days=1)).isoformat(), self.end, self.genre)]
+
+
+def year_shards(start_year: int, end_year: int, genre_ids: List[int] = DISCOVER_GENRE_IDS) -> List[DiscoverShard]:
+    """
+    Builds one shard per year and genre, most recent years first.
+
+    :param start_year: First release year.
+    :param end_year: Last release year.
+    :param genre_ids: TMDB genre IDs.
+    :return: The shards.
+    """
+    return [DiscoverShard(f"{year}-01-01", f"{year}-12-31", genre)
+            for year in range(end_year, start_year - 1, -1) for genre in genre_ids]
+
+
+def load_shard_checkpoint(checkpoint_path: str) -> Dict[str, Dict]:
+    """
+    Loads the progress of an interrupted crawl.
+
+    :param checkpoint_path: Path to the checkpoint file (one JSON line per page written to the cache,
+        and one per split shard).
+    :return: By shard key, the last page written and the total number of pages, or "split".
+    """
+    progress: Dict[str, Dict] = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Line cut by an interruption
+                state = progress.setdefault(entry["shard"], {"page": 0, "total_pages": None, "split": False})
+                if entry.get("split"):
+                    state["split"] = True
+                else:
+                    state["page"] = max(state["page"], entry["page"])
+                    state["total_pages"] = entry["total_pages"]
+    return progress
+
+
+# ---------------------------------------------------------------------------------------------------
+# Crawler
+# ---------------------------------------------------------------------------------------------------
+
+class DiscoverCrawler:
+    """
+    Crawls /discover/movie shard by shard to grow the catalogue beyond the popular movies.
+
+    Shards run in parallel through the shared TMDB client (one rate limit for all of them); the pages
+    of a shard are fetched in order. TMDB returns at most DISCOVER_MAX_PAGES pages per query, so a
+    shard with more pages is split into two halves of its date range.
+
+    Movies are buffered, deduplicated by ID and upserted into the cache every `flush_size` movies;
+    the pages they came from are then appended to the checkpoint file, so an interrupted crawl
+    resumes each shard after its last written page.
+    """
+
+    def __init__(
+            self,
+            cache_path: str = CACHE_PATH,
+            client: Optional[TmdbClient] = None,
+            checkpoint_path: str = DISCOVER_CHECKPOINT_PATH,
+            max_workers: int = TMDB_MAX_CONCURRENCY,
+            flush_size: int = DISCOVER_FLUSH_SIZE,
+            max_movies: Optional[int] = None,
+    ):
+        """
+        Initializes a DiscoverCrawler instance.
+
+        :param cache_path: Path to the cache file.
+        :param client: The TMDB client (the process-wide client by default).
+        :param checkpoint_path: Path to the checkpoint file.
+        :param max_workers: Number of shards crawled in parallel.
+        :param flush_size: Number of buffered movies written to the cache at once.
+        :param max_movies: Stop once this many distinct movies were crawled (no limit by default).
+        """
+        self.cache_path = cache_path
+        self.client = client or get_tmdb_client()
+        self.checkpoint_path = checkpoint_path
+        self.max_workers = max_workers
+        self.flush_size = flush_size
+        self.max_movies = max_movies
+        self.progress: Dict[str, Dict] = {}
+        self._pending_movies: Dict[int, Dict] = {}
+        self._pending_pages: List[Dict] = []
+        self._seen_ids = set()
+        self._pages = 0
+        self._written = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _checkpoint(self, entries: List[Dict]):
+        """
+        Appends entries to the checkpoint file.
+        """
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    def _flush(self):
+        """
+        Writes the buffered movies to the cache, then records their pages in the checkpoint.
+        Must be called with the lock held.
+        """
+        if self._pending_movies:
+            upsert_cache(list(self._pending_movies.values()), self.cache_path)
+            self._written += len(self._pending_movies)
+        if self._pending_pages:
+            self._checkpoint(self._pending_pages)
+        self._pending_movies, self._pending_pages = {}, []
+
+    def _add_page(self, shard: DiscoverShard, page: int, total_pages: int, results: List[Dict]):
+        """
+        Buffers the movies of a page, and flushes the buffer when it is full.
+        """
+        with self._lock:
+            for movie in results:
+                self._pending_movies[movie.get("id")] = movie
+                self._seen_ids.add(movie.get("id"))
+            self._pending_pages.append({"shard": shard.key, "page": page, "total_pages": total_pages})
+            self._pages += 1
+            if len(self._pending_movies) >= self.flush_size:
+                self._flush()
+            if self.max_movies is not None and len(self._seen_ids) >= self.max_movies:
+                self._stop.set()
+
+    def crawl_shard(self, shard: DiscoverShard) -> List[DiscoverShard]:
+        """
+        Fetches the pages of a shard not written yet.
+
+        :param shard: The shard.
+        :return: The halves of the shard if it has too many pages (they are crawled instead), else [].
+        """
+        state = self.progress.get(shard.key, {})
+        if state.get("split"):
+            return shard.split()
+        page, total_pages = state.get("page", 0) + 1, state.get("total_pages")
+
+        while not self._stop.is_set() and (total_pages is None or page <= min(total_pages, DISCOVER_MAX_PAGES)):
+            data = self.client.get(DISCOVER_MOVIES_URL, shard.params(page))
+            total_pages = data.get("total_pages", 0)
+            if page == 1 and total_pages > DISCOVER_MAX_PAGES:
+                halves = shard.split()
+                if halves:
+                    with self._lock:
+                        self._checkpoint([{"shard": shard.key, "split": True}])
+                    return halves
+                logger.warning("Shard %s has %d pages, only %d are reachable", shard.key, total_pages,
+                               DISCOVER_MAX_PAGES)
+            self._add_page(shard, page, total_pages, data.get("results", []))
+            page += 1
+        return []
+
+    def crawl(self, shards: List[DiscoverShard], resume: bool = True) -> Dict[str, int]:
+        """
+        Crawls shards in parallel. Shards finished by a previous crawl are skipped when resuming.
+
+        :param shards: The shards.
+        :param resume: If True, reuse the progress of the checkpoint file.
+        :return: The number of pages fetched, distinct movies crawled and movie writes to the cache.
+        :raises Exception: If a request failed (the crawl stops, its progress is kept for a resume).
+        """
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        if not resume and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.progress = load_shard_checkpoint(self.checkpoint_path)
+
+        def finished(shard: DiscoverShard) -> bool:
+            state = self.progress.get(shard.key)
+            return bool(state and not state["split"] and state["total_pages"] is not None
+                        and state["page"] >= min(state["total_pages"], DISCOVER_MAX_PAGES))
+
+        error: Optional[Exception] = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.crawl_shard, shard) for shard in shards if not finished(shard)}
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        halves = future.result()
+                    except Exception as e:
+                        # L'API échoue malgré les réessais : le crawl s'arrête et reprendra depuis le checkpoint
+                        logger.error("Discover shard failed: %s", e)
+                        error = error or e
+                        self._stop.set()
+                        continue
+                    futures |= {executor.submit(self.crawl_shard, half) for half in halves if not finished(half)}
+
+        with self._lock:
+            self._flush()
+        stats = {"pages": self._pages, "movies": len(self._seen_ids), "written": self._written}
+        logger.info("Discover crawl: %s", stats)
+
+        if error is not None:
+            raise error
+        if not self._stop.is_set() and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)  # Tous les shards sont terminés
+        return stats
+
+
+def crawl_discover(
+        start_year: int,
+        end_year: int,
+        genre_ids: List[int] = DISCOVER_GENRE_IDS,
+        max_movies: Optional[int] = None,
+        resume: bool = True,
+        cache_path: str = CACHE_PATH,
+        max_workers: int = TMDB_MAX_CONCURRENCY,
+) -> Dict[str, int]:
+    """
+    Grows the cache with the /discover/movie results of each year and genre, then recompiles the
+    catalogue snapshot.
+
+    :param start_year: First release year.
+    :param end_year: Last release year.
+    :param genre_ids: TMDB genre IDs.
+    :param max_movies: Stop once this many distinct movies were crawled (no limit by default).
+    :param resume: If True, resume the crawl of the checkpoint file.
+    :param cache_path: Path to the cache file.
+    :param max_workers: Number of shards crawled in parallel.
+    :return: The statistics of the crawl.
+    """
+    crawler = DiscoverCrawler(cache_path, max_workers=max_workers, max_movies=max_movies)
+    stats = crawler.crawl(year_shards(start_year, end_year, genre_ids), resume)
+    if CATALOGUE_SNAPSHOT_ENABLED and stats["written"]:
+        build_snapshot(cache_path, CATALOGUE_SNAPSHOT_PATH)
+    return stats
+
+
+# ---------------------------------------------------------------------------------------------------
+# Main Execution Block
+# ---------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    """
+    Grows the movie cache from /discover/movie, by year and genre:
+        python -m backend.services.discover_crawler --start-year 1970 --max-movies 100000
+    An interrupted crawl resumes from its checkpoint when run again.
+    """
+    parser = argparse.ArgumentParser(description="Grow the movie cache from TMDB's /discover/movie.")
+    parser.add_argument("--start-year", type=int, default=1950, help="first release year")
+    parser.add_argument("--end-year", type=int, default=datetime.date.today().year, help="last release year")
+    parser.add_argument("--genres", type=int, nargs="+", default=DISCOVER_GENRE_IDS, help="TMDB genre IDs")
+    parser.add_argument("--max-movies", type=int, help="stop after this many distinct movies")
+    parser.add_argument("--workers", type=int, default=TMDB_MAX_CONCURRENCY, help="shards crawled in parallel")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of a previous crawl")
+    args = parser.parse_args()
+    logging.basicConfig(level=LOG_LEVEL)
+
+    print(crawl_discover(args.start_year, args.end_year, args.genres, args.max_movies, not args.restart,
+                         max_workers=args.workers))
@@ -0,0 +1,353 @@
+import atexit
+import collections
+import io
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from backend.config.constants import EXPERT_SYSTEM_LISP_PATH, SBCL_EXECUTABLE, EXPERT_SYSTEM_POOL_SIZE, \
+    EXPERT_SYSTEM_TIMEOUT, EXPERT_SYSTEM_HEALTH_CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class ExpertSystemWorker:
+    """
+    A long-lived SBCL process running the expert system in worker mode (`--serve`).
+
+    The Lisp script is loaded once when the process starts. Requests are then exchanged over
+    stdin/stdout as frames: a header line "COMMAND LENGTH" followed by LENGTH characters of payload.
+    Headers may carry extra key=value pairs after the length: request parameters (n, window) and
+    step timings in responses.
+    """
+
+    def __init__(self, lisp_script_path: str = EXPERT_SYSTEM_LISP_PATH, sbcl_executable: str = SBCL_EXECUTABLE):
+        """
+        Initializes a worker. The SBCL process is only started by `start()`.
+
+        :param lisp_script_path: The absolute path to the Lisp script.
+        :param sbcl_executable: The path to the SBCL executable.
+        """
+        self.lisp_script_path = lisp_script_path
+        self.sbcl_executable = sbcl_executable
+        self.process: Optional[subprocess.Popen] = None
+        self._stdin: Optional[io.TextIOWrapper] = None
+        self._stdout: Optional[io.TextIOWrapper] = None
+        self.last_used = 0.0
+        self.catalogue_version: Optional[str] = None
+        self._stderr_lines = collections.deque(maxlen=20)
+        self._timed_out = False
+
+    def start(self):
+        """
+        Starts the SBCL process and a thread draining its stderr.
+
+        :raises FileNotFoundError: If SBCL is not installed.
+        """
+        self.process = subprocess.Popen(
+            [self.sbcl_executable, "--script", self.lisp_script_path, "--serve"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # Frame lengths count characters, so the pipes must not translate newlines
+        self._stdin = io.TextIOWrapper(self.process.stdin, encoding="utf-8", newline="")
+        self._stdout = io.TextIOWrapper(self.process.stdout, encoding="utf-8", newline="")
+        self._stderr_lines.clear()
+        self._timed_out = False
+        self.catalogue_version = None
+        self.last_used = time.monotonic()
+        threading.Thread(target=self._drain_stderr, args=(self.process,), daemon=True).start()
+
+    def _drain_stderr(self, process: subprocess.Popen):
+        """
+        Keeps the stderr pipe empty so the worker never blocks on it, remembering the last lines.
+
+        :param process: The process whose stderr is drained.
+        """
+        for line in process.stderr:
+            self._stderr_lines.append(line.decode("utf-8", errors="replace").rstrip())
+
+    def is_alive(self) -> bool:
+        """
+        Checks whether the SBCL process is running.
+
+        :return: True if the process is running.
+        """
+        return self.process is not None and self.process.poll() is None
+
+    def _kill(self):
+        """
+        Kills the SBCL process after a request timed out.
+        """
+        self._timed_out = True
+        self.process.kill()
+
+    def _frame_lines(self, size: int) -> Iterator[str]:
+        """
+        Yields the lines of a response frame of `size` characters as the worker writes them.
+
+        :param size: The length of the frame in characters.
+        :return: An iterator over the lines of the frame.
+        :raises OSError: If the output ends inside the frame (e.g. the worker was killed).
+        """
+        remaining = size
+        while remaining > 0:
+            line = self._stdout.readline(remaining)
+            if not line:
+                raise OSError("Expert system output ended inside a frame.")
+            remaining -= len(line)
+            yield line
+
+    def request(
+            self,
+            command: str,
+            payload: str = "",
+            timeout: float = EXPERT_SYSTEM_TIMEOUT,
+            parameters: Optional[Dict[str, int]] = None,
+            reader: Optional[Callable[[Iterable[str]], Any]] = None,
+    ) -> Any:
+        """
+        Sends a request frame and waits for the response frame.
+
+        :param command: The command to execute (e.g. "RECOMMEND").
+        :param payload: The request payload.
+        :param timeout: Maximum number of seconds to wait for the response.
+        :param parameters: Request parameters sent as key=value pairs in the header (e.g. {"n": 5}).
+        :param reader: Decodes the lines of a successful response as they are read from the pipe
+            (e.g. `read_recommendations`); the response is returned as a string by default.
+        :return: The response payload, or what `reader` returned.
+        :raises TimeoutError: If the worker did not answer in time (the worker is killed).
+        :raises subprocess.SubprocessError: If the worker died or reported an error.
+        :raises ValueError: If `reader` could not decode the response.
+        """
+        if not self.is_alive():
+            raise subprocess.SubprocessError("Expert system worker is not running.")
+
+        timer = threading.Timer(timeout, self._kill)
+        timer.start()
+        reader_error = None
+        try:
+            fields = [command, str(len(payload))] + [f"{k}={v}" for k, v in (parameters or {}).items()]
+            self._stdin.write(" ".join(fields) + "\n" + payload)
+            self._stdin.flush()
+            header = self._stdout.readline()
+            status, _, size = header.strip().partition(" ")
+            size, _, extras = size.partition(" ")
+            lines = self._frame_lines(int(size) if size.isdigit() else 0)
+            response = None
+            if status == "OK" and reader is not None:
+                try:
+                    response = reader(lines)
+                except ValueError as e:
+                    reader_error = e
+            else:
+                response = "".join(lines)
+            for _ in lines:
+                pass  # Read the rest of the frame, so that the next response starts with its header
+        except (OSError, ValueError):
+            header, status, response, extras = "", "", "", ""
+        finally:
+            timer.cancel()
+        self.last_used = time.monotonic()
+
+        if self._timed_out:
+            raise TimeoutError(f"Expert system did not answer within {timeout} seconds.")
+        if not header or status not in ("OK", "ERR"):
+            # The stream is out of sync: the worker is killed and restarted on next use
+            if self.is_alive():
+                self.process.kill()
+            raise subprocess.SubprocessError(f"Expert system worker died: {' | '.join(self._stderr_lines)}")
+        if status == "ERR":
+            raise subprocess.SubprocessError(f"Error in Lisp script: {response}")
+        if extras:
+            # Step timings of the expert system, e.g. "profile_ms=0.050 scoring_ms=1.200"
+            logger.debug("Expert system timings: %s", extras)
+        if reader_error is not None:
+            raise reader_error
+        return response
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        """
+        Checks that the worker answers requests.
+
+        :param timeout: Maximum number of seconds to wait for the answer.
+        :return: True if the worker answered the ping.
+        """
+        try:
+            return self.request("PING", timeout=timeout) == "PONG"
+        except (TimeoutError, subprocess.SubprocessError):
+            return False
+
+    def stop(self):
+        """
+        Stops the SBCL process by closing its stdin, killing it if it does not exit.
+        """
+        if self.process is None:
+            return
+        try:
+            self._stdin.close()
+            self.process.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.process = None
+
+
+class ExpertSystemPool:
+    """
+    A fixed-size pool of ExpertSystemWorker processes.
+
+    Workers are started lazily, checked before use (a ping when idle for too long) and restarted
+    when they crash or time out.
+    """
+
+    def __init__(
+            self,
+            size: int = EXPERT_SYSTEM_POOL_SIZE,
+            lisp_script_path: str = EXPERT_SYSTEM_LISP_PATH,
+            request_timeout: float = EXPERT_SYSTEM_TIMEOUT,
+            health_check_interval: float = EXPERT_SYSTEM_HEALTH_CHECK_INTERVAL,
+    ):
+        """
+        Initializes the pool.
+
+        :param size: Number of SBCL workers.
+        :param lisp_script_path: The absolute path to the Lisp script.
+        :param request_timeout: Maximum number of seconds per request.
+        :param health_check_interval: Idle time in seconds after which a worker is pinged before use.
+        """
+        self.size = size
+        self.request_timeout = request_timeout
+        self.health_check_interval = health_check_interval
+        self._workers = [ExpertSystemWorker(lisp_script_path) for _ in range(size)]
+        self._idle = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+
+    def _acquire(self) -> ExpertSystemWorker:
+        """
+        Takes an idle worker, (re)starting it if it is not healthy.
+
+        :return: A running worker.
+        :raises TimeoutError: If no worker becomes available in time.
+        """
+        try:
+            worker = self._idle.get(timeout=self.request_timeout)
+        except queue.Empty:
+            raise TimeoutError("No expert system worker available.")
+
+        try:
+            idle_for = time.monotonic() - worker.last_used
+            if not worker.is_alive() or (idle_for > self.health_check_interval and not worker.ping()):
+                worker.stop()
+                worker.start()
+        except Exception:
+            self._idle.put(worker)
+            raise
+        return worker
+
+    def submit(self, command: str, payload: str = "", parameters: Optional[Dict[str, int]] = None,
+               reader: Optional[Callable[[Iterable[str]], Any]] = None) -> Any:
+        """
+        Runs a request on a worker of the pool.
+
+        :param command: The command to execute (e.g. "RECOMMEND").
+        :param payload: The request payload.
+        :param parameters: Request parameters (e.g. {"n": 5, "window": 50}).
+        :param reader: Decodes the lines of the response as they are read (see ExpertSystemWorker.request).
+        :return: The response payload, or what `reader` returned.
+        :raises TimeoutError: If the request timed out.
+        :raises subprocess.SubprocessError: If the worker crashed or the Lisp script reported an error.
+        """
+        worker = self._acquire()
+        try:
+            return worker.request(command, payload, timeout=self.request_timeout, parameters=parameters,
+                                  reader=reader)
+        finally:
+            # A worker that timed out or crashed is restarted the next time it is acquired
+            self._idle.put(worker)
+
+    def submit_with_catalogue(
+            self,
+            command: str,
+            payload: str,
+            catalogue_version: str,
+            catalogue_loader: Callable[[], str],
+            parameters: Optional[Dict[str, int]] = None,
+            load_command: str = "LOAD-CATALOGUE",
+            reader: Optional[Callable[[Iterable[str]], Any]] = None,
+    ) -> Any:
+        """
+        Runs a request on a worker holding the given catalogue version in memory.
+
+        Workers that have not loaded this version yet (new, restarted, or holding an older
+        version) first receive the catalogue through a LOAD-CATALOGUE (or LOAD-CATALOGUE-LINES) request.
+
+        :param command: The command to execute (e.g. "RECOMMEND-USER").
+        :param payload: The request payload.
+        :param catalogue_version: The version ID of the catalogue the request needs.
+        :param catalogue_loader: Returns the catalogue payload of that version for `load_command`.
+        :param parameters: Request parameters (e.g. {"n": 5, "window": 50}).
+        :param load_command: The command loading the catalogue ("LOAD-CATALOGUE" for a `(version . movies)`
+            Lisp payload, "LOAD-CATALOGUE-LINES" for the compact format).
+        :param reader: Decodes the lines of the response as they are read (see ExpertSystemWorker.request).
+        :return: The response payload, or what `reader` returned.
+        :raises TimeoutError: If a request timed out.
+        :raises subprocess.SubprocessError: If the worker crashed or the Lisp script reported an error.
+        """
+        worker = self._acquire()
+        try:
+            if worker.catalogue_version != catalogue_version:
+                worker.request(load_command, catalogue_loader(), timeout=self.request_timeout)
+                worker.catalogue_version = catalogue_version
+            return worker.request(command, payload, timeout=self.request_timeout, parameters=parameters,
+                                  reader=reader)
+        finally:
+            self._idle.put(worker)
+
+    def close(self):
+        """
+        Stops all the workers of the pool.
+        """
+        for worker in self._workers:
+            worker.stop()
+
+
+_pools: Dict[str, ExpertSystemPool] = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_expert_system_pool(lisp_script_path: str = EXPERT_SYSTEM_LISP_PATH,
+                           size: int = EXPERT_SYSTEM_POOL_SIZE) -> ExpertSystemPool:
+    """
+    Returns the worker pool of the current process for the given Lisp script.
+
+    Pools are created on first use and per process ID, so each gunicorn worker owns its own pool
+    even when the application is loaded before forking.
+
+    :param lisp_script_path: The absolute path to the Lisp script.
+    :param size: Number of SBCL workers of the pool, if it is created by this call.
+    :return: The ExpertSystemPool instance.
+    """
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools, _pools_pid = {}, os.getpid()
+        if lisp_script_path not in _pools:
+            _pools[lisp_script_path] = ExpertSystemPool(size=size, lisp_script_path=lisp_script_path)
+        return _pools[lisp_script_path]
+
+
+@atexit.register
+def _close_pools():
+    """
+    Stops the workers of the current process when the interpreter exits.
+    """
+    if _pools_pid == os.getpid():
+        for pool in _pools.values():
+            pool.close()
@@ -1,98 +1,245 @@
+import json
+import logging
+import math
 import os
-import requests
-from typing import List, Dict
-from backend.utils.cache_manager import load_cache, save_cache
-from backend.utils.api_key_manager import get_api_key
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple
+from backend.utils.cache_manager import cache_exists, upsert_cache, get_cache_version
+from backend.utils.catalogue_snapshot import load_snapshot, get_snapshot_path
+from backend.utils.catalogue_store import MovieCatalogue, get_catalogue
+from backend.utils.tmdb_client import TmdbClient, get_tmdb_client
 from backend.models.python.Movie import Movie
-from backend.config.constants import DEFAULT_LANGUAGE, DEFAULT_REGION, POPULAR_MOVIES_URL, CACHE_PATH, BASE_DIR, CACHE_DIR
+from backend.models.python.MovieTable import MovieTable
+from backend.config.constants import DEFAULT_LANGUAGE, DEFAULT_REGION, POPULAR_MOVIES_URL, CACHE_PATH, BASE_DIR, \
+    CACHE_DIR, POPULAR_CHECKPOINT_PATH, TMDB_MAX_CONCURRENCY, TMDB_RESULTS_PER_PAGE, \
+    CATALOGUE_SNAPSHOT_ENABLED, TMDB_RESPONSE_CACHE_TTL, LOG_LEVEL
+
+logger = logging.getLogger(__name__)
 
 
 # ---------------------------------------------------------------------------------------------------
 # Functions
 # ---------------------------------------------------------------------------------------------------
 
-def fetch_movies_from_api(number_of_movies: int) -> List[Dict]:
+def load_checkpoint(checkpoint_path: str, params: Dict, max_age: float = TMDB_RESPONSE_CACHE_TTL) -> Dict[int, Dict]:
+    """
+    Load the pages completed by an interrupted fetch.
+
+    The first line of the checkpoint records the parameters of the fetch and when it started: a
+    checkpoint written for other parameters, or older than `max_age`, is discarded, so a resumed
+    fetch never mixes pages of another language, region or day.
+
+    :param checkpoint_path: Path to the checkpoint file (a header, then one JSON line per completed page).
+    :param params: The parameters of the fetch (URL, language, region).
+    :param max_age: Maximum age of the checkpoint in seconds.
+    :return: The "results" and "total_pages" of each completed page, by page number.
+    """
+    pages = {}
+    if not os.path.exists(checkpoint_path):
+        return pages
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        try:
+            header = json.loads(f.readline())
+        except json.JSONDecodeError:
+            header = {}
+        if header.get("params") != params or not time.time() - header.get("created", 0) <= max_age:
+            logger.info("Discarding checkpoint %s: other parameters or older than %ds.", checkpoint_path, max_age)
+            return pages
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Line cut by an interruption
+            pages[entry["page"]] = entry
+    return pages
+
+
+def fetch_movies_from_api(
+        number_of_movies: int,
+        client: Optional[TmdbClient] = None,
+        checkpoint_path: str = POPULAR_CHECKPOINT_PATH,
+        resume: bool = True,
+        max_workers: int = TMDB_MAX_CONCURRENCY,
+        max_age: Optional[float] = None,
+        checkpoint_max_age: float = TMDB_RESPONSE_CACHE_TTL,
+) -> List[Dict]:
     """
     Fetch popular movies from the TMDB API.
 
+    The first page gives the total number of pages, then the remaining pages are fetched in parallel
+    through the shared TMDB client (keep-alive session, rate limit and retries). Each completed page
+    is appended to a checkpoint file, so an interrupted fetch resumes without fetching those pages
+    again, as long as the checkpoint was written for the same parameters less than
+    `checkpoint_max_age` seconds ago. The checkpoint is removed once all pages are fetched.
+
     :param number_of_movies: The number of movies to fetch.
+    :param client: The TMDB client (the process-wide client by default).
+    :param checkpoint_path: Path to the checkpoint file.
+    :param resume: If True, reuse the pages of the checkpoint file.
+    :param max_workers: Number of pages fetched in parallel.
+    :param max_age: Maximum age of the responses taken from the shared response cache (see TmdbClient.get).
+    :param checkpoint_max_age: Maximum age of a checkpoint resumed, in seconds.
     :return: A list of dictionaries containing movie details.
     """
-    api_key = get_api_key()  # Retrieve the API key from environment variables
-    fetched_movies = []  # List to hold fetched movies
-    page = 1  # API pagination starts at page 1
+    client = client or get_tmdb_client()
+    fetch_params = {"url": POPULAR_MOVIES_URL, "language": DEFAULT_LANGUAGE, "region": DEFAULT_REGION}
+    pages = load_checkpoint(checkpoint_path, fetch_params, checkpoint_max_age) if resume else {}
+    checkpoint_lock = threading.Lock()
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    if pages:
+        logger.info("Resuming from checkpoint: %d pages already fetched.", len(pages))
+    else:
+        # New checkpoint: its header identifies the fetch
+        with open(checkpoint_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"params": fetch_params, "created": time.time()}) + "\n")
 
-    # Keep fetching until the required number of movies is obtained
-    while len(fetched_movies) < number_of_movies:
+    def fetch_page(page: int) -> Dict:
+        """
+        Fetch one page and record it in the checkpoint file.
+        """
         # API request parameters
         params = {
-            "api_key": api_key,
             "language": DEFAULT_LANGUAGE,
             "region": DEFAULT_REGION,
             "page": page
         }
+        data = client.get(POPULAR_MOVIES_URL, params, max_age=max_age)
+        entry = {"page": page, "total_pages": data.get("total_pages", 1), "results": data.get("results", [])}
+        with checkpoint_lock, open(checkpoint_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        pages[page] = entry
+        return entry
 
-        # Perform the GET request to the API
-        response = requests.get(POPULAR_MOVIES_URL, params=params)
-        if response.status_code != 200:
-            raise Exception(f"API Error: {response.status_code} - {response.text}")
+    # The first page tells how many pages the API can return
+    first_page = pages[1] if 1 in pages else fetch_page(1)
+    number_of_pages = min(first_page["total_pages"], math.ceil(number_of_movies / TMDB_RESULTS_PER_PAGE))
 
-        # Extract movie results from the API response
-        data = response.json()
-        fetched_movies += data.get("results", [])
-        page += 1  # Move to the next page
+    # Fetch the missing pages in parallel
+    missing_pages = [page for page in range(1, number_of_pages + 1) if page not in pages]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in as_completed([executor.submit(fetch_page, page) for page in missing_pages]):
+            future.result()
 
+    fetched_movies = [movie for page in sorted(pages) if page <= number_of_pages for movie in pages[page]["results"]]
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
     return fetched_movies[:number_of_movies]
 
 
-def update_cache_incrementally(new_movies: List[Dict], cache_path: str):
+def diff_movies(catalogue: MovieCatalogue, fetched_movies: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Compare movies retrieved from the API with the cache, by ID.
+
+    :param catalogue: The cached catalogue.
+    :param fetched_movies: Movies retrieved from the API (the first occurrence of an ID is kept).
+    :return: The new movies, and the cached movies whose data changed (e.g. popularity, vote average).
+    """
+    added_movies, updated_movies = [], []
+    seen_ids = set()
+    for m in fetched_movies:
+        if m.get("id") in seen_ids:
+            continue
+        seen_ids.add(m.get("id"))
+        cached = catalogue.find_by_id(m.get("id"))
+        if cached is None:
+            added_movies.append(m)
+        elif cached != m:
+            updated_movies.append(m)
+    return added_movies, updated_movies
+
+
+def update_cache_incrementally(new_movies: List[Dict], cache_path: str) -> Tuple[int, int]:
     """
-    Update the movie cache incrementally by adding only new movies.
+    Update the movie cache incrementally: new movies are added and cached movies whose data changed
+    are replaced, the other movies are not written.
 
     :param new_movies: List of movies retrieved from the API.
     :param cache_path: Path to the cache file.
+    :return: The number of added and updated movies.
     """
-    # Load the existing cache (if it exists)
-    existing_movies = load_cache(cache_path)
-    existing_ids = {m.get("id") for m in existing_movies}  # Set of existing movie IDs
-
-    # Add only new movies that are not already in the cache
-    updated_movies = existing_movies.copy()
-    for m in new_movies:
-        if m.get("id") not in existing_ids:
-            updated_movies.append(m)
+    added_movies, updated_movies = diff_movies(get_catalogue(cache_path), new_movies)
 
-    # Save the updated cache back to the file
-    print(f"Adding {len(updated_movies) - len(existing_movies)} new movies to the cache.")
-    save_cache(updated_movies, cache_path)
+    # Write only the new and changed movies to the cache
+    logger.info("Adding %d new movies and updating %d movies in the cache.", len(added_movies), len(updated_movies))
+    upsert_cache(added_movies + updated_movies, cache_path)
+    return len(added_movies), len(updated_movies)
 
 
-def load_movies(number_of_movies: int, use_cache: bool, update_cache: bool) -> List[Movie]:
+def load_movies_data(number_of_movies: int, use_cache: bool, update_cache: bool,
+                     cache_path: str = CACHE_PATH) -> List[Dict]:
     """
-    Load movies either from the cache or the TMDB API.
+    Load movie data either from the cache or the TMDB API.
 
     :param number_of_movies: Number of movies to load.
     :param use_cache: If True, load movies from the cache; otherwise, fetch from the API.
     :param update_cache: If True, update the cache incrementally with new movies.
-    :return: A list of Movie objects.
+    :param cache_path: Path to the cache file.
+    :return: A list of dictionaries containing movie details.
     """
-    if use_cache and os.path.exists(CACHE_PATH):
-        print("Loading movies from cache...")
-        movies_data = load_cache(CACHE_PATH)
+    if use_cache and cache_exists(cache_path):
+        logger.debug("Loading movies from cache...")
+        movies_data = get_catalogue(cache_path).movies
     else:
-        print("Fetching movies from the TMDB API...")
+        logger.info("Fetching movies from the TMDB API...")
         movies_data = fetch_movies_from_api(number_of_movies)
 
         # Update the cache incrementally if requested
         if update_cache:
-            print("Updating cache incrementally...")
-            update_cache_incrementally(movies_data, CACHE_PATH)
+            logger.info("Updating cache incrementally...")
+            update_cache_incrementally(movies_data, cache_path)
+
+    return movies_data[:number_of_movies]
 
+
+def load_movies(number_of_movies: int, use_cache: bool, update_cache: bool,
+                cache_path: str = CACHE_PATH) -> List[Movie]:
+    """
+    Load movies either from the cache or the TMDB API.
+
+    :param number_of_movies: Number of movies to load.
+    :param use_cache: If True, load movies from the cache; otherwise, fetch from the API.
+    :param update_cache: If True, update the cache incrementally with new movies.
+    :param cache_path: Path to the cache file.
+    :return: A list of Movie objects.
+    """
     # Convert the loaded movie data into a list of Movie objects
-    loaded_movies = [Movie.from_dict(m) for m in movies_data[:number_of_movies]]
+    loaded_movies = [Movie.from_dict(m) for m in load_movies_data(number_of_movies, use_cache, update_cache,
+                                                                  cache_path)]
     return loaded_movies
 
 
+def load_movie_table(number_of_movies: int, use_cache: bool, update_cache: bool,
+                     cache_path: str = CACHE_PATH,
+                     catalogue: Optional[MovieCatalogue] = None) -> Tuple[MovieTable, str]:
+    """
+    Load movies either from the cache or the TMDB API into a columnar table, which takes much less
+    memory than a list of Movie objects for large catalogues.
+
+    :param number_of_movies: Number of movies to load.
+    :param use_cache: If True, load movies from the cache; otherwise, fetch from the API.
+    :param update_cache: If True, update the cache incrementally with new movies.
+    :param cache_path: Path to the cache file.
+    :param catalogue: The catalogue of the cache to load (the current one by default); the snapshot
+        is only used if it was compiled from the same version.
+    :return: A MovieTable of the movies, and the version of the cache they were read from (empty if
+        they were fetched from the API).
+    """
+    if use_cache and cache_exists(cache_path):
+        # The compiled snapshot is mapped instead of parsing the cache, unless the cache changed since
+        version = catalogue.version if catalogue is not None else get_cache_version(cache_path)
+        table = load_snapshot(get_snapshot_path(cache_path), expected_version=version) \
+            if CATALOGUE_SNAPSHOT_ENABLED else None
+        if table is not None:
+            logger.debug("Loading movies from the catalogue snapshot...")
+            return table.head(number_of_movies), version
+        catalogue = catalogue or get_catalogue(cache_path)
+        return MovieTable(catalogue.movies[:number_of_movies]), catalogue.version
+
+    return MovieTable(load_movies_data(number_of_movies, use_cache, update_cache, cache_path)), ""
+
+
 # ---------------------------------------------------------------------------------------------------
 # Main Execution Block
 # ---------------------------------------------------------------------------------------------------
@@ -101,6 +248,8 @@ if __name__ == "__main__":
     """
     Example usage of the movie loader script.
     """
+    logging.basicConfig(level=LOG_LEVEL)
+
     # Display base and cache directory paths
     print(f"Base Directory: {BASE_DIR}")
     print(f"Cache Directory: {CACHE_DIR}")
@@ -0,0 +1,281 @@
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional, Set
+
+from backend.config.constants import CACHE_PATH, SEARCH_MOVIE_URL, SEARCH_RESULTS_LIMIT, SEARCH_FUZZY_THRESHOLD, \
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL
+from backend.utils.catalogue_store import get_catalogue, is_watched, normalize_title
+from backend.utils.tmdb_client import get_tmdb_client
+from backend.utils.ttl_cache import TTLCache, RequestCoalescer
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------------------------------
+# Local title index
+# ---------------------------------------------------------------------------------------------------
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Return the character trigrams of a text.
+
+    :param text: The text (already normalized).
+    :return: The set of its trigrams.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def padded_trigrams(text: str) -> Set[str]:
+    """
+    Return the trigrams of a text padded with spaces, so that short words and word boundaries
+    also produce trigrams (used for fuzzy matching).
+
+    :param text: The text (already normalized).
+    :return: The set of its padded trigrams.
+    """
+    return trigrams(f"  {text} ")
+
+
+def popularity(movie: Dict) -> float:
+    """
+    Return the popularity of a movie, used to rank matches of the same kind.
+    """
+    return movie.get("popularity") or 0
+
+
+class TitleIndex:
+    """
+    An index of the catalogue titles answering prefix, substring and fuzzy queries.
+
+    Prefix queries use a sorted list of titles (binary search); substring and fuzzy queries use
+    an inverted index from trigrams to titles.
+
+    Attributes:
+        version (str): Version ID of the catalogue the index was built from.
+    """
+
+    def __init__(self, movies: List[Dict], version: str):
+        """
+        Builds the index. Movies appearing several times in the catalogue are indexed once.
+
+        :param movies: The catalogue movies as dictionaries.
+        :param version: Version ID of the catalogue.
+        """
+        self.version = version
+        self._movies: List[Dict] = []
+        self._titles: List[str] = []
+        seen_ids = set()
+        for movie in movies:
+            if movie.get("id") in seen_ids or not movie.get("title"):
+                continue
+            seen_ids.add(movie.get("id"))
+            self._movies.append(movie)
+            self._titles.append(normalize_title(movie["title"]))
+
+        self._sorted_titles = sorted((title, i) for i, title in enumerate(self._titles))
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._padded_postings: Dict[str, List[int]] = defaultdict(list)
+        self._padded_counts: List[int] = []
+        for i, title in enumerate(self._titles):
+            for trigram in trigrams(title):
+                self._postings[trigram].add(i)
+            title_trigrams = padded_trigrams(title)
+            self._padded_counts.append(len(title_trigrams))
+            for trigram in title_trigrams:
+                self._padded_postings[trigram].append(i)
+
+    def _prefix_matches(self, query: str) -> List[int]:
+        """
+        Find the titles starting with the query.
+        """
+        matches = []
+        start = bisect_left(self._sorted_titles, (query, -1))
+        for title, i in self._sorted_titles[start:]:
+            if not title.startswith(query):
+                break
+            matches.append(i)
+        return matches
+
+    def _substring_matches(self, query: str) -> List[int]:
+        """
+        Find the titles containing the query (queries shorter than a trigram are not supported).
+        """
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        # Intersection des listes, de la plus courte à la plus longue
+        postings = sorted((self._postings.get(t, set()) for t in query_trigrams), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return [i for i in candidates if query in self._titles[i]]
+
+    def find(self, query: str, limit: int) -> List[Dict]:
+        """
+        Find the movies whose title starts with or contains the query. Titles starting with the
+        query come first; matches of the same kind are ranked by popularity.
+
+        :param query: The search query.
+        :param limit: Maximum number of movies returned.
+        :return: The matching movies.
+        """
+        query = normalize_title(query)
+        if not query:
+            return []
+        prefix_matches = self._prefix_matches(query)
+        results = heapq.nlargest(limit, prefix_matches, key=lambda i: popularity(self._movies[i]))
+        if len(results) < limit:
+            prefix_set = set(prefix_matches)
+            substring_matches = [i for i in self._substring_matches(query) if i not in prefix_set]
+            results += heapq.nlargest(limit - len(results), substring_matches,
+                                      key=lambda i: popularity(self._movies[i]))
+        return [self._movies[i] for i in results]
+
+    def find_similar(self, query: str, limit: int, threshold: float = SEARCH_FUZZY_THRESHOLD) -> List[Dict]:
+        """
+        Find the movies whose title is similar to the query (typos, missing words), using the
+        Dice coefficient of their padded trigrams.
+
+        :param query: The search query.
+        :param limit: Maximum number of movies returned.
+        :param threshold: Minimum similarity between 0 and 1.
+        :return: The matching movies, most similar first.
+        """
+        query_trigrams = padded_trigrams(normalize_title(query))
+        if not query_trigrams:
+            return []
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self._padded_postings.get(trigram, ()))
+
+        scored = []
+        for i, count in shared.items():
+            similarity = 2 * count / (len(query_trigrams) + self._padded_counts[i])
+            if similarity >= threshold:
+                scored.append((similarity, popularity(self._movies[i]), -i))
+        return [self._movies[-i] for _, _, i in heapq.nlargest(limit, scored)]
+
+    def __len__(self) -> int:
+        """
+        Number of indexed titles.
+        """
+        return len(self._titles)
+
+
+_indexes: Dict[str, TitleIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_title_index(cache_path: str = CACHE_PATH) -> TitleIndex:
+    """
+    Return the title index of a cache file, rebuilt when the catalogue changes. When the file is
+    watched by the catalogue refresher, the published index is returned as it is.
+
+    :param cache_path: The path to the cache file.
+    :return: The TitleIndex of the catalogue.
+    """
+    index = _indexes.get(cache_path)
+    if index is not None and is_watched(cache_path):
+        return index
+    catalogue = get_catalogue(cache_path)
+    if index is not None and index.version == catalogue.version:
+        return index
+
+    with _indexes_lock:
+        index = _indexes.get(cache_path)
+        if index is None or index.version != catalogue.version:
+            index = TitleIndex(catalogue.movies, catalogue.version)
+            _indexes[cache_path] = index
+        return index
+
+
+def publish_title_index(cache_path: str, index: TitleIndex):
+    """
+    Publish a title index: the next calls of `get_title_index` return it.
+
+    :param cache_path: The path to the cache file.
+    :param index: The title index of the cache file.
+    """
+    _indexes[cache_path] = index
+
+
+# ---------------------------------------------------------------------------------------------------
+# Remote search
+# ---------------------------------------------------------------------------------------------------
+
+# Résultats TMDB par requête normalisée ; les requêtes identiques en cours partagent un seul appel
+_remote_results = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+_remote_calls = RequestCoalescer()
+
+
+def search_remote(query: str) -> List[Dict]:
+    """
+    Search movies on TMDB. Results are cached by normalized query, and identical queries in
+    flight share one request.
+
+    :param query: The search query.
+    :return: The first page of TMDB results.
+    :raises Exception: If the TMDB request fails.
+    """
+    key = normalize_title(query)
+    results = _remote_results.get(key)
+    if results is not None:
+        return results
+
+    def fetch() -> List[Dict]:
+        data = get_tmdb_client().get(SEARCH_MOVIE_URL, {"query": key})
+        fetched = data.get("results", [])
+        _remote_results.set(key, fetched)
+        return fetched
+
+    return _remote_calls.do(key, fetch)
+
+
+def get_search_cache_stats() -> Dict[str, int]:
+    """
+    Return the hit and miss counters of the remote search cache.
+    """
+    return _remote_results.stats()
+
+
+# ---------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------
+
+def search_movies(query: str, limit: int = SEARCH_RESULTS_LIMIT, cache_path: str = CACHE_PATH) -> List[Dict]:
+    """
+    Search movies by title, answering from the local catalogue first.
+
+    Titles starting with or containing the query are taken from the catalogue; TMDB is only asked
+    when they are fewer than `limit`. Similar titles from the catalogue (typos) complete the
+    results, and replace TMDB if it cannot be reached.
+
+    :param query: The search query.
+    :param limit: Maximum number of movies returned.
+    :param cache_path: The path to the cache file.
+    :return: The matching movies as TMDB dictionaries.
+    :raises Exception: If TMDB fails and the catalogue has no match.
+    """
+    index = get_title_index(cache_path)
+    results = index.find(query, limit)
+    if len(results) >= limit:
+        return results
+
+    try:
+        remote_results: Optional[List[Dict]] = search_remote(query)
+    except Exception as e:
+        logger.error("Remote search failed: %s", e)
+        remote_results = None
+
+    result_ids = {m.get("id") for m in results}
+    for movie in (remote_results or []) + index.find_similar(query, limit):
+        if len(results) >= limit:
+            break
+        if movie.get("id") not in result_ids:
+            result_ids.add(movie.get("id"))
+            results.append(movie)
+
+    if remote_results is None and not results:
+        raise Exception("Remote search failed and no local match was found")
+    return results
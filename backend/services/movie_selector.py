@@ -1,75 +1,211 @@
 import json
+import logging
 import os
 import subprocess
-from typing import Optional, Dict, Any
-
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Iterable, Iterator
 
 from backend.config.constants import CACHE_PATH, SEARCH_MOVIE_URL, DEFAULT_LANGUAGE, EXPERT_SYSTEM_LISP_PATH, \
-    SBCL_EXECUTABLE
+    SBCL_EXECUTABLE, EXPERT_SYSTEM_USE_POOL, EXPERT_SYSTEM_RESIDENT_CATALOGUE, EXPERT_SYSTEM_ENGINE, \
+    DEFAULT_RECOMMENDATIONS, DEFAULT_CANDIDATE_WINDOW, TMDB_MAX_CONCURRENCY, EXPERT_SYSTEM_TIMEOUT, \
+    EXPERT_SYSTEM_MAX_IN_FLIGHT, UPSTREAM_QUEUE_TIMEOUT, EXPERT_SYSTEM_COMPACT_CATALOGUE
 from backend.models.python.Movie import Movie
-from backend.utils.api_key_manager import get_api_key
-from backend.utils.cache_manager import load_cache, save_cache
+from backend.models.python.User import User
+from backend.services.data_formatter import get_data_as_lisp, get_catalogue_as_lisp, get_user_request_as_lisp, \
+    get_batch_data_as_lisp, get_users_request_as_lisp, get_catalogue_as_lines
+from backend.services.expert_system_pool import get_expert_system_pool
+from backend.services.movie_search import TitleIndex, publish_title_index
+from backend.services.native_engine import get_native_catalogue
+from backend.services.recommendation_cache import recommendation_cache_key, get_cached_recommendations, \
+    cache_recommendations
+from backend.utils.cache_manager import upsert_cache
+from backend.utils.catalogue_store import MovieCatalogue, get_catalogue, normalize_title, is_watched, \
+    load_catalogue, publish_catalogue
+from backend.utils.metrics import span, recommendation_cache_lookups
+from backend.utils.tmdb_client import get_tmdb_client
+from backend.utils.upstream import UpstreamLimiter
 
+logger = logging.getLogger(__name__)
 
-def fetch_movie_by_title(title: str) -> Optional[Movie]:
+# Bounds the recommendations computed at once in the process (SBCL workers or native scoring)
+expert_system_limiter = UpstreamLimiter("Expert system", EXPERT_SYSTEM_MAX_IN_FLIGHT, UPSTREAM_QUEUE_TIMEOUT)
+_publish_lock = threading.Lock()
+
+
+def search_movie_on_api(title: str) -> Optional[Dict]:
     """
-    Fetch a movie by its title. Search first in the cache, then in the API.
+    Search a movie by its title on the TMDB API.
 
     :param title: The title of the movie to search for.
-    :return: An instance of Movie if found, else None.
+    :return: The first result as a dictionary, or None if there is no result.
+    :raises Exception: If the API request fails.
     """
-    # Load cache data
-    cache_data = load_cache(CACHE_PATH)
-
-    # Search in cache
-    for movie_data in cache_data:
-        if movie_data.get("title", "").lower() == title.lower():
-            print("Movie found in cache.")
-            return Movie.from_dict(movie_data)
-
-    # If not found in cache, search in API
-    print("Movie not found in cache. Searching in API...")
-    api_key = get_api_key()
     params = {
-        "api_key": api_key,
         "query": title,
         "language": DEFAULT_LANGUAGE
     }
-    response = requests.get(SEARCH_MOVIE_URL, params=params)
-    if response.status_code != 200:
-        raise Exception(f"API Error: {response.status_code} - {response.text}")
-
-    results = response.json().get("results", [])
+    results = get_tmdb_client().get(SEARCH_MOVIE_URL, params).get("results", [])
     if not results:
-        print("No results found in API.")
+        logger.debug("No results found in API for '%s'.", title)
         return None
 
     # If multiple results, return the first
-    selected_movie = results[0]
-    print(f"Movie '{selected_movie['title']}' found in API.")
+    logger.debug("Movie '%s' found in API.", results[0]['title'])
+    return results[0]
+
+
+def publish_written_catalogue(cache_path: str = CACHE_PATH):
+    """
+    Publishes the version of a watched cache file just written by a request, with its title index,
+    so that the next requests find the movies it added without waiting for the catalogue refresher.
+    The refresher still notices the new version and builds the engine structures off the request path.
+
+    :param cache_path: Path to the cache file.
+    """
+    with _publish_lock:
+        catalogue = load_catalogue(cache_path)
+        if catalogue.version != get_catalogue(cache_path).version:
+            publish_title_index(cache_path, TitleIndex(catalogue.movies, catalogue.version))
+            publish_catalogue(cache_path, catalogue)
+
+
+@span("resolve_titles")
+def resolve_titles(titles: List[str], cache_path: str = CACHE_PATH) -> Dict[str, Optional[Movie]]:
+    """
+    Fetch several movies by their titles at once. Titles found in the cache are answered from its
+    index; the others are searched on the API in parallel, and all the new movies are added to the
+    cache in one write.
+
+    :param titles: The titles of the movies to search for.
+    :param cache_path: Path to the cache file.
+    :return: The Movie found for each normalized title (None if not found).
+    :raises Exception: If an API request fails (the movies found by the other requests are still cached).
+    """
+    catalogue = get_catalogue(cache_path)
+    resolved: Dict[str, Optional[Movie]] = {}
+    missing: Dict[str, str] = {}
+    for title in titles:
+        key = normalize_title(title)
+        if key in resolved or key in missing:
+            continue
+        movie_data = catalogue.find_by_title(title)
+        if movie_data is not None:
+            logger.debug("Movie '%s' found in cache.", title)
+            resolved[key] = Movie.from_dict(movie_data)
+        else:
+            missing[key] = title.strip()
+
+    if not missing:
+        return resolved
+
+    # Search the missing titles in the API, in parallel
+    logger.info("%d movies not found in cache. Searching in API...", len(missing))
+    new_movies: Dict[int, Dict] = {}
+    error: Optional[Exception] = None
+    with ThreadPoolExecutor(max_workers=min(TMDB_MAX_CONCURRENCY, len(missing))) as executor:
+        futures = {key: executor.submit(search_movie_on_api, title) for key, title in missing.items()}
+        for key, future in futures.items():
+            try:
+                movie_data = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            resolved[key] = Movie.from_dict(movie_data) if movie_data else None
+            if movie_data and movie_data.get("id") not in catalogue:
+                new_movies.setdefault(movie_data.get("id"), movie_data)
+
+    # Add all the new movies to the cache in one write
+    upsert_cache(list(new_movies.values()), cache_path)
+    if new_movies and is_watched(cache_path):
+        publish_written_catalogue(cache_path)
+
+    if error is not None:
+        raise error
+    return resolved
+
+
+def fetch_movie_by_title(title: str) -> Optional[Movie]:
+    """
+    Fetch a movie by its title. Search first in the cache, then in the API.
+
+    :param title: The title of the movie to search for.
+    :return: An instance of Movie if found, else None.
+    """
+    return resolve_titles([title]).get(normalize_title(title))
+
+
+def read_recommendations(lines: Iterable[str]) -> List[List[Dict[str, Any]]]:
+    """
+    Decodes the whole output of the expert system (see `read_recommendation_lines`), e.g. as the
+    reader of a worker pool request.
+
+    :param lines: The lines of the expert system's output.
+    :return: The recommendations of each user, in the order of the request.
+    :raises json.JSONDecodeError: If a line is not valid JSON or the output is truncated.
+    """
+    return list(read_recommendation_lines(lines))
+
+
+def read_recommendation_lines(lines: Iterable[str]) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Decodes the output of the expert system one user at a time: one JSON line of recommendations
+    per user (`write-recommendations-line`), then an "END count" line.
+
+    :param lines: The lines of the expert system's output.
+    :return: An iterator over the recommendations of each user, in the order of the request.
+    :raises json.JSONDecodeError: If a line is not valid JSON or the output is truncated.
+    """
+    count = 0
+    for line in lines:
+        if line.startswith("END "):
+            if int(line[4:]) != count:
+                raise json.JSONDecodeError(f"Expected {line[4:].strip()} users, got {count}", line, 0)
+            return
+        if line.strip():
+            yield json.loads(line)
+            count += 1
+    raise json.JSONDecodeError("Truncated expert system output (no END line)", "", 0)
+
 
-    # Add to cache
-    cache_data.append(selected_movie)
-    save_cache(cache_data, CACHE_PATH)
+def _write_input(process: subprocess.Popen, data: str):
+    """
+    Writes the input of a one-shot expert system process, then closes its stdin.
 
-    return Movie.from_dict(selected_movie)
+    :param process: The process.
+    :param data: The input data.
+    """
+    try:
+        process.stdin.write(data)
+        process.stdin.close()
+    except OSError:
+        pass  # The script exited early: its return code and stderr tell why
 
 
-def call_expert_system(lisp_data: str, lisp_script_path: str = EXPERT_SYSTEM_LISP_PATH) -> Dict[str, Any]:
+def call_expert_system(lisp_data: str, lisp_script_path: str = EXPERT_SYSTEM_LISP_PATH,
+                       n: int = DEFAULT_RECOMMENDATIONS, window: int = DEFAULT_CANDIDATE_WINDOW,
+                       batch: bool = False) -> Dict[str, Any]:
     """
     Calls the expert system by executing the provided Lisp script with the given S-expression data.
+    When EXPERT_SYSTEM_USE_POOL is enabled, the request is served by a long-lived SBCL worker of the
+    pool; otherwise a new SBCL process is started for the request.
 
     Args:
         lisp_data (str): The S-expression Lisp data to send to the expert system.
         lisp_script_path (str, optional): The absolute path to the Lisp script. Defaults to EXPERT_SYSTEM_LISP_PATH.
+        n (int, optional): Number of movies to recommend. Defaults to DEFAULT_RECOMMENDATIONS.
+        window (int, optional): Number of best-scored candidates the recommendations are taken from.
+            Defaults to DEFAULT_CANDIDATE_WINDOW.
+        batch (bool, optional): If True, the data holds a list of users (`get_batch_data_as_lisp`) and
+            one list of recommendations per user is returned. Defaults to False.
 
     Returns:
-        Dict[str, Any]: The JSON response from the expert system.
+        Dict[str, Any]: The recommendations (one list per user if `batch`).
 
     Raises:
         FileNotFoundError: If SBCL is not installed or the Lisp script is not found.
         subprocess.SubprocessError: If an error occurs during the subprocess execution.
+        TimeoutError: If the worker pool did not answer in time.
         json.JSONDecodeError: If the expert system's output is not valid JSON.
         ValueError: If input data is not a string.
         AttributeError: If the input data does not have a to_lisp() method.
@@ -83,51 +219,260 @@ def call_expert_system(lisp_data: str, lisp_script_path: str = EXPERT_SYSTEM_LIS
         raise FileNotFoundError(f"Lisp script '{lisp_script_path}' not found.")
 
     try:
-        print(f"[DEBUG] Sending Lisp data (first 100 chars): {lisp_data[:100]}")  # Affiche les 100 premiers caractères
-        print(f"[DEBUG] Using Lisp script path: {lisp_script_path}")
-        print(f"[DEBUG] Executing SBCL with: {SBCL_EXECUTABLE}")
-
-        # Execute the Lisp script as a subprocess
-        process = subprocess.Popen(
-            [SBCL_EXECUTABLE, "--script", lisp_script_path],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending Lisp data (first 100 chars): %s", lisp_data[:100])
+            logger.debug("Using Lisp script path: %s", lisp_script_path)
 
-        # Send Lisp data via stdin
-        stdout, stderr = process.communicate(input=lisp_data)
+        if EXPERT_SYSTEM_USE_POOL:
+            parameters = {"n": n, "window": window}
+            command = "RECOMMEND-BATCH" if batch else "RECOMMEND"
+            # Les recommandations sont décodées au fil de la lecture du pipe
+            with span("engine"):
+                results = get_expert_system_pool(lisp_script_path).submit(command, lisp_data, parameters,
+                                                                          read_recommendations)
+            return results if batch else results[0]
 
-        # Log stdout and stderr
-        print(f"[DEBUG] Lisp script stdout (first 300 chars): {stdout[:300]}")  # Affiche les 300 premiers caractères
-        print(f"[DEBUG] Lisp script stderr: {stderr.strip()}")
+        logger.debug("Executing SBCL with: %s", SBCL_EXECUTABLE)
+
+        with span("engine"):
+            # Execute the Lisp script as a subprocess
+            process = subprocess.Popen(
+                [SBCL_EXECUTABLE, "--script", lisp_script_path, f"n={n}", f"window={window}", f"batch={int(batch)}"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            results, parse_error, stderr = None, None, []
+            timed_out = threading.Event()
+            timer = threading.Timer(EXPERT_SYSTEM_TIMEOUT, lambda: (timed_out.set(), process.kill()))
+            # Lisp data is sent via stdin and stderr drained by threads, while stdout is parsed line by line
+            threads = [threading.Thread(target=_write_input, args=(process, lisp_data), daemon=True),
+                       threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)]
+            timer.start()
+            try:
+                for thread in threads:
+                    thread.start()
+                try:
+                    results = list(read_recommendation_lines(process.stdout))
+                except json.JSONDecodeError as e:
+                    parse_error = e
+                process.stdout.read()
+                process.wait()
+                for thread in threads:
+                    thread.join()
+            finally:
+                timer.cancel()
+            stderr = "".join(stderr)
+            if timed_out.is_set():
+                raise TimeoutError(f"Expert system did not answer within {EXPERT_SYSTEM_TIMEOUT} seconds.")
+
+        # Log stderr
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Lisp script stderr: %s", stderr.strip())
 
         # Check for subprocess errors
         if process.returncode != 0:
             raise subprocess.SubprocessError(f"Error in Lisp script: {stderr.strip()}")
 
-        # Parse the JSON response
-        try:
-            json_response = json.loads(stdout)
-            print(f"[DEBUG] Parsed JSON response: {json_response}")
-        except json.JSONDecodeError as e:
-            print(f"[ERROR] Failed to parse JSON: {e.msg}")
-            raise json.JSONDecodeError(f"Failed to parse JSON: {e.msg}", e.doc, e.pos)
+        # The JSON lines of the response were parsed one user at a time
+        if parse_error is not None:
+            logger.error("Failed to parse JSON: %s", parse_error.msg)
+            raise json.JSONDecodeError(f"Failed to parse JSON: {parse_error.msg}", parse_error.doc, parse_error.pos)
+        json_response = results if batch else results[0]
+        logger.debug("Parsed JSON response: %s", json_response)
 
         return json_response
 
     except FileNotFoundError:
-        print("[ERROR] SBCL not found. Please install SBCL and ensure it is in your PATH.")
+        logger.error("SBCL not found. Please install SBCL and ensure it is in your PATH.")
         raise FileNotFoundError("SBCL not found. Please install SBCL and ensure it is in your PATH.")
     except subprocess.SubprocessError as e:
-        print(f"[ERROR] Subprocess error: {str(e)}")
+        logger.error("Subprocess error: %s", e)
+        raise e
+    except TimeoutError as e:
+        logger.error("Expert system timeout: %s", e)
         raise e
     except json.JSONDecodeError as e:
-        print(f"[ERROR] JSON decoding error: {str(e)}")
+        logger.error("JSON decoding error: %s", e)
         raise e
     except Exception as e:
-        print(f"[ERROR] An unexpected error occurred: {str(e)}")
+        logger.error("An unexpected error occurred: %s", e)
         raise Exception(f"An unexpected error occurred: {str(e)}")
 
 
+CATALOGUE_LOAD_COMMAND = "LOAD-CATALOGUE-LINES" if EXPERT_SYSTEM_COMPACT_CATALOGUE else "LOAD-CATALOGUE"
+
+
+@span("catalogue_encoding")
+def get_catalogue_payload(cache_path: str, catalogue: MovieCatalogue) -> str:
+    """
+    Builds the catalogue payload loaded by the workers with CATALOGUE_LOAD_COMMAND: the compact
+    line format when EXPERT_SYSTEM_COMPACT_CATALOGUE is enabled, `(version . movies)` otherwise.
+
+    :param cache_path: Path to the cache file holding the catalogue.
+    :param catalogue: The catalogue to send, labelled with its version.
+    :return: The catalogue payload.
+    """
+    if EXPERT_SYSTEM_COMPACT_CATALOGUE:
+        return get_catalogue_as_lines(cache_path, catalogue)
+    return get_catalogue_as_lisp(cache_path, catalogue)
+
+
+def call_expert_system_for_user(user: User, cache_path: str = CACHE_PATH,
+                                lisp_script_path: str = EXPERT_SYSTEM_LISP_PATH,
+                                n: int = DEFAULT_RECOMMENDATIONS, window: int = DEFAULT_CANDIDATE_WINDOW,
+                                catalogue: Optional[MovieCatalogue] = None) -> Any:
+    """
+    Calls an expert system worker holding the catalogue in memory, sending only the user.
+
+    The catalogue is shipped to a worker once per version (the version changes with the cache file),
+    so a request only carries `User.to_lisp()` and the catalogue version ID.
+
+    :param user: The user to recommend movies to.
+    :param cache_path: Path to the cache file holding the catalogue.
+    :param lisp_script_path: The absolute path to the Lisp script.
+    :param n: Number of movies to recommend.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :param catalogue: The catalogue to recommend from (the current catalogue of the cache by default).
+    :return: The JSON response from the expert system.
+    :raises TimeoutError: If the worker pool did not answer in time.
+    :raises subprocess.SubprocessError: If the worker crashed or the Lisp script reported an error.
+    :raises json.JSONDecodeError: If the expert system's output is not valid JSON.
+    """
+    # The version sent, the version loaded by the worker and the movies it loads come from one catalogue
+    catalogue = catalogue or get_catalogue(cache_path)
+    version = catalogue.version
+    with span("lisp_encoding"):
+        payload = get_user_request_as_lisp(user, version)
+    with span("engine"):
+        return get_expert_system_pool(lisp_script_path).submit_with_catalogue(
+            "RECOMMEND-USER",
+            payload,
+            version,
+            lambda: get_catalogue_payload(cache_path, catalogue),
+            {"n": n, "window": window},
+            CATALOGUE_LOAD_COMMAND,
+            read_recommendations,
+        )[0]
+
+
+def call_expert_system_for_users(users: List[User], cache_path: str = CACHE_PATH,
+                                 lisp_script_path: str = EXPERT_SYSTEM_LISP_PATH,
+                                 n: int = DEFAULT_RECOMMENDATIONS, window: int = DEFAULT_CANDIDATE_WINDOW,
+                                 catalogue: Optional[MovieCatalogue] = None) -> Any:
+    """
+    Calls an expert system worker holding the catalogue in memory for several users at once.
+
+    :param users: The users to recommend movies to.
+    :param cache_path: Path to the cache file holding the catalogue.
+    :param lisp_script_path: The absolute path to the Lisp script.
+    :param n: Number of movies to recommend to each user.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :param catalogue: The catalogue to recommend from (the current catalogue of the cache by default).
+    :return: One list of recommendations per user, in the order of `users`.
+    :raises TimeoutError: If the worker pool did not answer in time.
+    :raises subprocess.SubprocessError: If the worker crashed or the Lisp script reported an error.
+    :raises json.JSONDecodeError: If the expert system's output is not valid JSON.
+    """
+    catalogue = catalogue or get_catalogue(cache_path)
+    version = catalogue.version
+    with span("lisp_encoding"):
+        payload = get_users_request_as_lisp(users, version)
+    with span("engine"):
+        return get_expert_system_pool(lisp_script_path).submit_with_catalogue(
+            "RECOMMEND-USERS",
+            payload,
+            version,
+            lambda: get_catalogue_payload(cache_path, catalogue),
+            {"n": n, "window": window},
+            CATALOGUE_LOAD_COMMAND,
+            read_recommendations,
+        )
+
+
+def recommend_movies(user: User, cache_path: str = CACHE_PATH,
+                     n: int = DEFAULT_RECOMMENDATIONS, window: int = DEFAULT_CANDIDATE_WINDOW) -> Any:
+    """
+    Recommends movies to a user with the engine selected by EXPERT_SYSTEM_ENGINE.
+
+    The "native" engine scores the catalogue in-process with NumPy. The "sbcl" engine uses the resident
+    catalogue of the worker pool when EXPERT_SYSTEM_USE_POOL and EXPERT_SYSTEM_RESIDENT_CATALOGUE are
+    enabled, otherwise sends the whole catalogue with the user. Results are cached by
+    `recommendation_cache_key`, so users with the same movies and age bracket share them. At most
+    EXPERT_SYSTEM_MAX_IN_FLIGHT requests are computed at once in the process.
+
+    :param user: The user to recommend movies to.
+    :param cache_path: Path to the cache file holding the catalogue.
+    :param n: Number of movies to recommend.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :return: The JSON response from the expert system.
+    :raises TimeoutError: If the engine is saturated or did not answer in time.
+    """
+    # The cache key carries the version of the catalogue the engine recommends from
+    catalogue = get_native_catalogue(cache_path) if EXPERT_SYSTEM_ENGINE == "native" else get_catalogue(cache_path)
+    # Users with the same movies and age bracket get the same recommendations
+    key = recommendation_cache_key(user, catalogue.version, n, window)
+    cached = get_cached_recommendations(key)
+    if cached is not None:
+        recommendation_cache_lookups.inc("hit")
+        logger.debug("Recommendations found in cache.")
+        return cached
+    recommendation_cache_lookups.inc("miss")
+
+    with expert_system_limiter:
+        if EXPERT_SYSTEM_ENGINE == "native":
+            with span("engine"):
+                recommendations = catalogue.recommend(user, n, window)
+        elif EXPERT_SYSTEM_USE_POOL and EXPERT_SYSTEM_RESIDENT_CATALOGUE:
+            recommendations = call_expert_system_for_user(user, cache_path, n=n, window=window, catalogue=catalogue)
+        else:
+            with span("lisp_encoding"):
+                lisp_data = get_data_as_lisp(cache_path, user, catalogue)  # Conversion en Lisp
+            recommendations = call_expert_system(lisp_data, n=n, window=window)  # Appel au système expert
+
+    cache_recommendations(key, recommendations)
+    return recommendations
+
+
+def recommend_movies_batch(users: List[User], cache_path: str = CACHE_PATH,
+                           n: int = DEFAULT_RECOMMENDATIONS, window: int = DEFAULT_CANDIDATE_WINDOW) -> List[Any]:
+    """
+    Recommends movies to several users with one call to the engine selected by EXPERT_SYSTEM_ENGINE:
+    the catalogue is prepared once and shared by all the users. Users whose recommendations are
+    cached are not sent to the engine.
+
+    :param users: The users to recommend movies to.
+    :param cache_path: Path to the cache file holding the catalogue.
+    :param n: Number of movies to recommend to each user.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :return: One list of recommendations per user, in the order of `users`.
+    :raises TimeoutError: If the engine is saturated or did not answer in time.
+    """
+    catalogue = get_native_catalogue(cache_path) if EXPERT_SYSTEM_ENGINE == "native" else get_catalogue(cache_path)
+    keys = [recommendation_cache_key(user, catalogue.version, n, window) for user in users]
+    results: List[Any] = [get_cached_recommendations(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    recommendation_cache_lookups.inc("hit", amount=len(users) - len(missing))
+    recommendation_cache_lookups.inc("miss", amount=len(missing))
+    logger.debug("Batch of %d users: %d found in cache.", len(users), len(users) - len(missing))
+    if not missing:
+        return results
+
+    missing_users = [users[i] for i in missing]
+    with expert_system_limiter:
+        if EXPERT_SYSTEM_ENGINE == "native":
+            with span("engine"):
+                recommendations = catalogue.recommend_batch(missing_users, n, window)
+        elif EXPERT_SYSTEM_USE_POOL and EXPERT_SYSTEM_RESIDENT_CATALOGUE:
+            recommendations = call_expert_system_for_users(missing_users, cache_path, n=n, window=window,
+                                                           catalogue=catalogue)
+        else:
+            with span("lisp_encoding"):
+                lisp_data = get_batch_data_as_lisp(cache_path, missing_users, catalogue)
+            recommendations = call_expert_system(lisp_data, n=n, window=window, batch=True)
+
+    for i, user_recommendations in zip(missing, recommendations):
+        results[i] = user_recommendations
+        cache_recommendations(keys[i], user_recommendations)
+    return results
@@ -0,0 +1,523 @@
+import logging
+import threading
+import time
+from typing import List, Dict, Optional, Any, Tuple
+
+import numpy as np
+
+from backend.config.constants import CACHE_PATH, DEFAULT_RECOMMENDATIONS, DEFAULT_CANDIDATE_WINDOW, \
+    EXPERT_SYSTEM_CATALOGUE_SIZE, NATIVE_BATCH_CHUNK_SIZE
+from backend.models.python.Movie import Movie
+from backend.models.python.MovieTable import MovieTable, MISSING_LANGUAGE, MISSING_YEAR, parse_year
+from backend.models.python.User import User
+from backend.services.data_formatter import get_catalogue_version
+from backend.services.movie_loader import load_movie_table
+from backend.utils.catalogue_store import MovieCatalogue, is_watched
+from backend.utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------------------------------
+
+def get_movie_year(movie: Movie) -> Optional[int]:
+    """
+    Extracts the release year from a movie's release date, like `get-movie-year` in the Lisp engine.
+
+    :param movie: The movie.
+    :return: The release year, or None if the release date is not available.
+    """
+    return parse_year(movie.release_date)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Selects the K best scores with a partial sort. Equal scores keep their original order, like the
+    stable selection of the Lisp engine.
+
+    :param scores: The scores.
+    :param k: Number of scores to select.
+    :return: The indices of the K best scores, best first.
+    """
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        # Every score tied with the K-th one is kept, the stable sort then picks the earliest
+        selected = np.flatnonzero(scores >= threshold)
+    else:
+        selected = np.arange(len(scores))
+    return selected[np.argsort(-scores[selected], kind="stable")[:k]]
+
+
+def movie_to_result(movie: Movie, score: float, details: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Converts a movie to the JSON object returned by the Lisp engine (`write-json-object`), so both
+    engines produce the same response.
+
+    :param movie: The recommended movie.
+    :param score: The score of the movie.
+    :param details: The weighted criteria of the score (see `NativeCatalogue.score_terms`).
+    :return: A dictionary with the upper-case keys of the Lisp engine.
+    """
+    result = {
+        "TITLE": movie.title,
+        "ID": movie.id,
+        "GENRE_IDS": list(movie.genre_ids) if movie.genre_ids else None,
+        "RELEASE_DATE": movie.release_date,
+        "POPULARITY": movie.popularity,
+        "VOTE_AVERAGE": movie.vote_average,
+        "ADULT": True if movie.adult else None,
+        "ORIGINAL_LANGUAGE": movie.original_language,
+    }
+    if movie.poster_path:
+        result["POSTER_PATH"] = movie.poster_path
+    result["SCORE"] = score
+    result["SCORE_DETAILS"] = details
+    return result
+
+
+def sum_score_terms(terms: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Sums the weighted criteria of the score in the order of `score-movie-with-profile`.
+
+    :param terms: The weighted criteria returned by `NativeCatalogue.score_terms`.
+    :return: The scores.
+    """
+    return (terms["GENRE_MOOD"] + terms["GENRE_FAVORITES"] + terms["POPULARITY"] + terms["VOTE"]
+            + terms["LANGUAGE"] + terms["YEAR"])
+
+
+# ---------------------------------------------------------------------------------------------------
+# Native catalogue
+# ---------------------------------------------------------------------------------------------------
+
+class UserProfile:
+    """
+    Aggregates of a user's movies, computed once per request (like `build-user-profile` in the Lisp engine).
+
+    Attributes:
+        mood_genres (np.ndarray): Mask of the catalogue genres found in the mood movies.
+        favorite_genres (np.ndarray): Mask of the catalogue genres found in the favorite movies.
+        language_frequencies (np.ndarray): Number of mood and favorite movies per catalogue language.
+        total_movies (int): Number of mood and favorite movies.
+        mood_average_year (Optional[float]): Average release year of the mood movies, None if unknown.
+    """
+
+    def __init__(
+            self,
+            mood_genres: np.ndarray,
+            favorite_genres: np.ndarray,
+            language_frequencies: np.ndarray,
+            total_movies: int,
+            mood_average_year: Optional[float],
+    ):
+        """
+        Initializes a UserProfile instance.
+        """
+        self.mood_genres = mood_genres
+        self.favorite_genres = favorite_genres
+        self.language_frequencies = language_frequencies
+        self.total_movies = total_movies
+        self.mood_average_year = mood_average_year
+
+
+class NativeCatalogue:
+    """
+    The catalogue as NumPy arrays, scored in one pass with the same formula as `score-movie`
+    in the Lisp engine.
+
+    Attributes:
+        table (MovieTable): The columns of the movies, in catalogue order.
+        version (str): Version ID of the cache the movies were read from.
+        rows_by_title (Dict[str, List[int]]): Rows of the movies of each title (to exclude the user's movies).
+        genre_matrix (np.ndarray): (movies x genres) count matrix of the movie genres.
+        genre_totals (np.ndarray): Number of genres of each movie.
+        years (np.ndarray): Release year of each movie (NaN if unknown).
+        genre_postings (List[np.ndarray]): Inverted index: rows of the movies of each catalogue genre.
+        language_postings (List[np.ndarray]): Inverted index: rows of the movies in each catalogue language.
+        static_scores (np.ndarray): Popularity and vote terms of the score of each movie, an upper bound
+            of its score when it shares no genre and no language with the user's movies.
+    """
+
+    def __init__(self, table: MovieTable, version: str = ""):
+        """
+        Builds the scoring arrays of the catalogue.
+
+        :param table: The columnar table of the catalogue movies.
+        :param version: Version ID of the cache the movies were read from.
+        """
+        self.table = table
+        self.version = version
+        self.ids = table.ids
+        self.titles = table.titles
+        # Rows of each title, decoded once per catalogue (snapshot titles are decoded on access)
+        self.rows_by_title: Dict[str, List[int]] = {}
+        for row, title in enumerate(table.titles):
+            self.rows_by_title.setdefault(title, []).append(row)
+        self.popularity = table.popularity
+        self.vote_average = table.vote_average
+        self.adult = table.adult
+        self.languages = table.languages
+        self.language_index = {lang: i for i, lang in enumerate(table.languages)}
+        self.language_codes = table.language_codes
+
+        self.genre_index = {g: i for i, g in enumerate(table.genres)}
+        self.genre_matrix = np.zeros((len(table), len(table.genres)), dtype=np.float64)
+        np.add.at(self.genre_matrix, (table.genre_rows(), np.searchsorted(table.genres, table.genre_values)), 1)
+        self.genre_totals = self.genre_matrix.sum(axis=1)
+
+        self.years = np.where(table.years == MISSING_YEAR, np.nan, table.years.astype(np.float64))
+
+        self.genre_postings = [np.flatnonzero(column) for column in self.genre_matrix.T]
+        language_order = np.argsort(self.language_codes, kind="stable")
+        language_bounds = np.searchsorted(self.language_codes[language_order], np.arange(len(self.languages) + 1))
+        self.language_postings = [np.sort(language_order[start:end])
+                                  for start, end in zip(language_bounds[:-1], language_bounds[1:])]
+        self.static_scores = 0.15 * (self.popularity / 100.0) + 0.25 * (self.vote_average * 10)
+
+    def _genre_mask(self, user_movies: List[Movie]) -> np.ndarray:
+        """
+        Builds the mask of the catalogue genres found in the user's movies.
+
+        :param user_movies: The user's favorite or mood movies.
+        :return: A vector with 1.0 for each genre of the user's movies.
+        """
+        mask = np.zeros(len(self.genre_index), dtype=np.float64)
+        for movie in user_movies:
+            for genre in movie.genre_ids:
+                if genre in self.genre_index:
+                    mask[self.genre_index[genre]] = 1.0
+        return mask
+
+    def build_profile(self, user: User) -> UserProfile:
+        """
+        Computes the aggregates of the user's movies used to score the whole catalogue.
+
+        :param user: The user.
+        :return: The UserProfile of the user.
+        """
+        user_movies = user.mood_movies + user.favorite_movies
+        language_frequencies = np.zeros(len(self.languages), dtype=np.float64)
+        for movie in user_movies:
+            language = MISSING_LANGUAGE if movie.original_language is None else movie.original_language
+            if language in self.language_index:
+                language_frequencies[self.language_index[language]] += 1
+
+        mood_years = [y for y in (get_movie_year(m) for m in user.mood_movies) if y is not None]
+        return UserProfile(
+            mood_genres=self._genre_mask(user.mood_movies),
+            favorite_genres=self._genre_mask(user.favorite_movies),
+            language_frequencies=language_frequencies,
+            total_movies=len(user_movies),
+            mood_average_year=sum(mood_years) / len(mood_years) if mood_years else None,
+        )
+
+    def _genre_similarity(self, genres: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Vectorized `profile-genre-similarity`: percentage of each movie's genres found in the genre masks.
+
+        :param genres: The (users x genres) masks of the users' favorite or mood movies.
+        :param rows: The rows of the movies to compare (every movie if None).
+        :return: The (users x movies) genre similarities.
+        """
+        genre_matrix = self.genre_matrix if rows is None else self.genre_matrix[rows]
+        genre_totals = self.genre_totals if rows is None else self.genre_totals[rows]
+        common = genres @ genre_matrix.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(genre_totals > 0, 100 * common / genre_totals, 0.0)
+
+    def score(self, profile: UserProfile) -> np.ndarray:
+        """
+        Scores every movie of the catalogue against a user profile (vectorized `score-movie`).
+
+        :param profile: The profile of the user.
+        :return: The score of every movie of the catalogue.
+        """
+        return self.score_batch([profile])[0]
+
+    def score_batch(self, profiles: List[UserProfile], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Scores every movie of the catalogue against several user profiles at once: the genre
+        similarities of all the users are computed with one matrix product.
+
+        :param profiles: The profiles of the users.
+        :param rows: The rows of the movies to score (every movie if None).
+        :return: A (users x movies) matrix of scores.
+        """
+        return sum_score_terms(self.score_terms(profiles, rows))
+
+    def score_terms(self, profiles: List[UserProfile], rows: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Computes the weighted criteria of the score (vectorized `score-details`); their sum is the score.
+
+        :param profiles: The profiles of the users.
+        :param rows: The rows of the movies to score (every movie if None).
+        :return: A (users x movies) matrix per criterion, keyed like the SCORE_DETAILS of the Lisp engine.
+        """
+        if rows is None:
+            rows = slice(None)
+        mood_genres = np.array([p.mood_genres for p in profiles]).reshape(len(profiles), -1)
+        favorite_genres = np.array([p.favorite_genres for p in profiles]).reshape(len(profiles), -1)
+        mood_average_years = np.array([np.nan if p.mood_average_year is None else p.mood_average_year
+                                       for p in profiles], dtype=np.float64)
+        year_difference = np.abs(self.years[rows][None, :] - mood_average_years[:, None])
+        year_penalty = np.nan_to_num(np.minimum(1.0, year_difference / 100.0), nan=0.0)
+
+        language_codes = self.language_codes[rows]
+        language_similarity = np.zeros((len(profiles), len(language_codes)), dtype=np.float64)
+        for row, profile in enumerate(profiles):
+            if profile.total_movies > 0:
+                language_similarity[row] = profile.language_frequencies[language_codes] / profile.total_movies * 100
+
+        shape = language_similarity.shape
+        return {
+            "GENRE_MOOD": 0.3 * self._genre_similarity(mood_genres, rows),
+            "GENRE_FAVORITES": 0.25 * self._genre_similarity(favorite_genres, rows),
+            "POPULARITY": np.broadcast_to(0.15 * (self.popularity[rows] / 100.0), shape),
+            "VOTE": np.broadcast_to(0.25 * (self.vote_average[rows] * 10), shape),
+            "LANGUAGE": 0.15 * language_similarity,
+            "YEAR": -0.1 * year_penalty,
+        }
+
+    def _eligible(self, user: User) -> np.ndarray:
+        """
+        Builds the mask of the movies that can be recommended to a user: movies of the user's lists
+        and adult movies for users under 18 are excluded.
+
+        :param user: The user.
+        :return: A boolean vector over the catalogue.
+        """
+        eligible = np.ones(len(self.table), dtype=bool)
+        for movie in user.favorite_movies + user.mood_movies:
+            eligible[self.rows_by_title.get(movie.title, [])] = False
+        if user.age < 18:
+            eligible &= ~self.adult
+        return eligible
+
+    def _candidate_mask(self, profile: UserProfile) -> np.ndarray:
+        """
+        Looks up the inverted indexes for the movies sharing a genre or a language with the user's movies.
+        The other movies score at most their static score.
+
+        :param profile: The profile of the user.
+        :return: A boolean vector over the catalogue.
+        """
+        candidates = np.zeros(len(self.table), dtype=bool)
+        for genre in np.flatnonzero(profile.mood_genres + profile.favorite_genres):
+            candidates[self.genre_postings[genre]] = True
+        for language in np.flatnonzero(profile.language_frequencies):
+            candidates[self.language_postings[language]] = True
+        return candidates
+
+    def _score_pruned(self, profile: UserProfile, eligible: np.ndarray,
+                      window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scores only the eligible movies that can reach the WINDOW best scores, like `recommend-movies`:
+        the candidates of the inverted indexes are scored first, then the other movies whose static
+        score is not below the WINDOW-th best candidate score. The selection is the same as when
+        every movie is scored.
+
+        :param profile: The profile of the user.
+        :param eligible: The mask of the eligible movies.
+        :param window: Number of best-scored candidates the recommendations are taken from.
+        :return: The scored rows, in catalogue order, and their scores.
+        """
+        candidates = self._candidate_mask(profile)
+        rows = np.flatnonzero(candidates & eligible)
+        scores = self.score_batch([profile], rows)[0]
+        if 0 < window <= len(scores):
+            threshold = np.partition(scores, len(scores) - window)[len(scores) - window]
+            others = np.flatnonzero(~candidates & eligible & (self.static_scores >= threshold))
+        else:
+            others = np.flatnonzero(~candidates & eligible)
+
+        rows = np.concatenate([rows, others])
+        scores = np.concatenate([scores, self.score_batch([profile], others)[0]])
+        order = np.argsort(rows, kind="stable")
+        return rows[order], scores[order]
+
+    def _select(self, profile: UserProfile, scores: np.ndarray, eligible: np.ndarray, n: int,
+                window: int) -> List[Dict[str, Any]]:
+        """
+        Keeps the WINDOW best eligible scores and returns the N first movies with distinct IDs.
+
+        :param profile: The profile of the user.
+        :param scores: The score of every movie of the catalogue.
+        :param eligible: The mask of the eligible movies.
+        :param n: Number of movies to recommend.
+        :param window: Number of best-scored candidates the recommendations are taken from.
+        :return: The recommended movies, in the format of the Lisp engine.
+        """
+        candidates = np.flatnonzero(eligible)
+        return self._select_rows(profile, candidates, scores[candidates], n, window)
+
+    def _select_rows(self, profile: UserProfile, rows: np.ndarray, scores: np.ndarray, n: int,
+                     window: int) -> List[Dict[str, Any]]:
+        """
+        Keeps the WINDOW best scores of some rows and returns the N first movies with distinct IDs,
+        with the weighted criteria of their score.
+
+        :param profile: The profile of the user.
+        :param rows: The rows of the candidate movies, in catalogue order.
+        :param scores: The scores of the candidate movies.
+        :param n: Number of movies to recommend.
+        :param window: Number of best-scored candidates the recommendations are taken from.
+        :return: The recommended movies, in the format of the Lisp engine.
+        """
+        top_window = rows[top_k_indices(scores, window)]
+
+        unique_ids = set()
+        selected = []
+        for index in top_window:
+            movie_id = int(self.ids[index])
+            if len(selected) < n and movie_id not in unique_ids:
+                unique_ids.add(movie_id)
+                selected.append(index)
+
+        selected_terms = self.score_terms([profile], np.array(selected, dtype=np.int64))
+        terms = {name: term[0] for name, term in selected_terms.items()}
+        selected_scores = sum_score_terms(terms)
+        return [movie_to_result(self.table[index], float(selected_scores[i]),
+                                {name: float(term[i]) for name, term in terms.items()})
+                for i, index in enumerate(selected)]
+
+    def recommend(self, user: User, n: int = DEFAULT_RECOMMENDATIONS,
+                  window: int = DEFAULT_CANDIDATE_WINDOW) -> List[Dict[str, Any]]:
+        """
+        Recommends the top N movies like `recommend-movies`: movies of the user's lists and adult movies
+        for users under 18 are excluded, the WINDOW best scores are kept and duplicate IDs removed.
+
+        :param user: The user.
+        :param n: Number of movies to recommend.
+        :param window: Number of best-scored candidates the recommendations are taken from.
+        :return: The recommended movies, in the format of the Lisp engine.
+        """
+        eligible = self._eligible(user)
+
+        start = time.perf_counter()
+        profile = self.build_profile(user)
+        profile_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        rows, scores = self._score_pruned(profile, eligible, window)
+        recommendations = self._select_rows(profile, rows, scores, n, window)
+        scoring_ms = (time.perf_counter() - start) * 1000
+
+        logger.debug("Native engine timings: profile_ms=%.3f scoring_ms=%.3f scored=%d", profile_ms, scoring_ms,
+                     len(rows))
+        return recommendations
+
+    def recommend_batch(self, users: List[User], n: int = DEFAULT_RECOMMENDATIONS,
+                        window: int = DEFAULT_CANDIDATE_WINDOW,
+                        chunk_size: int = NATIVE_BATCH_CHUNK_SIZE) -> List[List[Dict[str, Any]]]:
+        """
+        Recommends the top N movies to each user, scoring the users by chunks of (users x movies) matrices.
+
+        :param users: The users.
+        :param n: Number of movies to recommend to each user.
+        :param window: Number of best-scored candidates the recommendations are taken from.
+        :param chunk_size: Number of users scored together (bounds the size of the score matrix).
+        :return: One list of recommendations per user, in the order of `users`.
+        """
+        start = time.perf_counter()
+        profiles = [self.build_profile(user) for user in users]
+        profile_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        recommendations = []
+        for chunk_start in range(0, len(users), chunk_size):
+            chunk = slice(chunk_start, chunk_start + chunk_size)
+            scores = self.score_batch(profiles[chunk])
+            for user, profile, user_scores in zip(users[chunk], profiles[chunk], scores):
+                recommendations.append(self._select(profile, user_scores, self._eligible(user), n, window))
+        scoring_ms = (time.perf_counter() - start) * 1000
+
+        logger.debug("Native engine timings: users=%d profile_ms=%.3f scoring_ms=%.3f", len(users), profile_ms,
+                     scoring_ms)
+        return recommendations
+
+
+# ---------------------------------------------------------------------------------------------------
+# Catalogue loading
+# ---------------------------------------------------------------------------------------------------
+
+_catalogues: Dict[str, NativeCatalogue] = {}
+_catalogues_lock = threading.Lock()
+
+
+def build_native_catalogue(cache_path: str = CACHE_PATH, catalogue: Optional[MovieCatalogue] = None) -> NativeCatalogue:
+    """
+    Builds the native catalogue of a cache file, without publishing it.
+
+    :param cache_path: Path to the cache file holding the catalogue.
+    :param catalogue: The catalogue of the cache to build from (the current one by default).
+    :return: The NativeCatalogue instance.
+    """
+    # Same catalogue as the one sent to the Lisp engine, labelled with the version it was read from
+    with span("cache_load"):
+        table, version = load_movie_table(EXPERT_SYSTEM_CATALOGUE_SIZE, True, False, cache_path, catalogue)
+    return NativeCatalogue(table, version)
+
+
+def publish_native_catalogue(cache_path: str, catalogue: NativeCatalogue):
+    """
+    Publishes a native catalogue: the next calls of `get_native_catalogue` return it.
+
+    :param cache_path: Path to the cache file holding the catalogue.
+    :param catalogue: The native catalogue of the cache file.
+    """
+    _catalogues[cache_path] = catalogue
+
+
+def get_native_catalogue(cache_path: str = CACHE_PATH) -> NativeCatalogue:
+    """
+    Returns the native catalogue of a cache file. When the file is watched by the catalogue refresher,
+    the published catalogue is returned as it is (the refresher builds and publishes the new versions);
+    otherwise it is rebuilt when the file changes.
+
+    :param cache_path: Path to the cache file holding the catalogue.
+    :return: The NativeCatalogue instance.
+    """
+    catalogue = _catalogues.get(cache_path)
+    if catalogue is not None and is_watched(cache_path):
+        return catalogue
+    version = get_catalogue_version(cache_path)
+    if catalogue is not None and catalogue.version == version:
+        return catalogue
+    with _catalogues_lock:
+        catalogue = _catalogues.get(cache_path)
+        if catalogue is None or (not is_watched(cache_path) and catalogue.version != version):
+            catalogue = _catalogues[cache_path] = build_native_catalogue(cache_path)
+        return catalogue
+
+
+def native_recommend_movies(user: User, n: int = DEFAULT_RECOMMENDATIONS, window: int = DEFAULT_CANDIDATE_WINDOW,
+                            cache_path: str = CACHE_PATH) -> List[Dict[str, Any]]:
+    """
+    Recommends movies to a user with the in-process NumPy engine.
+
+    :param user: The user to recommend movies to.
+    :param n: Number of movies to recommend.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :param cache_path: Path to the cache file holding the catalogue.
+    :return: The recommended movies, in the format of the Lisp engine.
+    """
+    return get_native_catalogue(cache_path).recommend(user, n, window)
+
+
+def native_recommend_movies_batch(users: List[User], n: int = DEFAULT_RECOMMENDATIONS,
+                                  window: int = DEFAULT_CANDIDATE_WINDOW,
+                                  cache_path: str = CACHE_PATH) -> List[List[Dict[str, Any]]]:
+    """
+    Recommends movies to several users with the in-process NumPy engine.
+
+    :param users: The users to recommend movies to.
+    :param n: Number of movies to recommend to each user.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :param cache_path: Path to the cache file holding the catalogue.
+    :return: One list of recommendations per user, in the order of `users`.
+    """
+    return get_native_catalogue(cache_path).recommend_batch(users, n, window)
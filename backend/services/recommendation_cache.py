@@ -0,0 +1,89 @@
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional
+
+from backend.config.constants import RECOMMENDATION_CACHE_BACKEND, RECOMMENDATION_CACHE_SIZE, \
+    RECOMMENDATION_CACHE_TTL, RECOMMENDATION_CACHE_PATH, RECOMMENDATION_ENGINE_VERSION, EXPERT_SYSTEM_ENGINE
+from backend.models.python.User import User
+from backend.utils.ttl_cache import TTLCache, SqliteTTLCache
+
+
+def recommendation_cache_key(user: User, catalogue_version: str, n: int, window: int,
+                             engine: str = EXPERT_SYSTEM_ENGINE) -> str:
+    """
+    Builds the key of a recommendation request.
+
+    Recommendations only depend on the user's movies (their order does not matter, but a movie given
+    twice counts twice), on whether the user is a minor (adult filter), on the catalogue and on the
+    engine, so users sharing them share the key.
+
+    :param user: The user.
+    :param catalogue_version: Version ID of the catalogue.
+    :param n: Number of movies to recommend.
+    :param window: Number of best-scored candidates the recommendations are taken from.
+    :param engine: The engine computing the recommendations.
+    :return: A SHA-256 hex digest of the canonical request.
+    """
+    canonical = json.dumps({
+        "favorites": sorted(m.id for m in user.favorite_movies),
+        "mood": sorted(m.id for m in user.mood_movies),
+        "minor": user.age < 18,
+        "catalogue": catalogue_version,
+        "engine": f"{engine}-{RECOMMENDATION_ENGINE_VERSION}",
+        "n": n,
+        "window": window,
+    }, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_recommendation_cache():
+    """
+    Returns the recommendation cache selected by RECOMMENDATION_CACHE_BACKEND.
+
+    :return: A TTLCache ("memory"), a SqliteTTLCache shared by the workers ("sqlite"), or None ("none").
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None and RECOMMENDATION_CACHE_BACKEND == "memory":
+            _cache = TTLCache(RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL)
+        elif _cache is None and RECOMMENDATION_CACHE_BACKEND == "sqlite":
+            _cache = SqliteTTLCache(RECOMMENDATION_CACHE_PATH, RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL)
+        return _cache
+
+
+def get_cached_recommendations(key: str) -> Optional[Any]:
+    """
+    Gets the cached recommendations of a request.
+
+    :param key: The key of the request.
+    :return: The cached recommendations, or None.
+    """
+    cache = get_recommendation_cache()
+    return cache.get(key) if cache is not None else None
+
+
+def cache_recommendations(key: str, recommendations: Any):
+    """
+    Stores the recommendations of a request.
+
+    :param key: The key of the request.
+    :param recommendations: The recommendations (JSON-serializable).
+    """
+    cache = get_recommendation_cache()
+    if cache is not None:
+        cache.set(key, recommendations)
+
+
+def get_recommendation_cache_stats() -> Dict[str, Any]:
+    """
+    Returns the counters of the recommendation cache.
+
+    :return: The backend, and its hit and miss counters and size (empty when disabled).
+    """
+    cache = get_recommendation_cache()
+    return {"backend": RECOMMENDATION_CACHE_BACKEND, **(cache.stats() if cache is not None else {})}
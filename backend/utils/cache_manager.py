@@ -1,7 +1,299 @@
+import contextlib
+import fcntl
 import os
 import json
-from typing import List, Dict
+import logging
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from typing import Iterator, List, Dict
 
+from backend.config.constants import CACHE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------------------------------------------------------
+
+class JsonCacheBackend:
+    """
+    Movie cache stored as a single JSON file.
+
+    Every write rewrites the whole file, through a temporary file atomically renamed over the cache,
+    so concurrent readers always see a complete cache. Writers (threads or processes) take an
+    exclusive lock on a `.lock` file next to the cache, so an upsert never loses another one's movies.
+    An upsert therefore still costs a read and a write of the whole cache; use the SQLite backend
+    (CACHE_BACKEND=sqlite) for large catalogues or frequent upserts.
+    """
+
+    def __init__(self, file_path: str):
+        """
+        Initializes a JsonCacheBackend instance.
+
+        :param file_path: The path to the JSON cache file.
+        """
+        self.file_path = file_path
+
+    def exists(self) -> bool:
+        """
+        Check whether the cache file exists.
+
+        :return: True if the cache file exists.
+        """
+        return os.path.exists(self.file_path)
+
+    def load(self) -> List[Dict]:
+        """
+        Load the whole cache.
+
+        :return: A list of cached movies as dictionaries.
+        """
+        if self.exists():
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return []
+
+    def version(self) -> str:
+        """
+        Build a version ID of the cache.
+
+        :return: A version ID built from the modification time and size of the file (empty if it does not exist).
+        """
+        if not self.exists():
+            return ""
+        stat = os.stat(self.file_path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    @contextlib.contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        """
+        Holds the exclusive lock of the writers of the cache file.
+        """
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        with open(self.file_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, movies: List[Dict]):
+        """
+        Replace the whole cache.
+
+        :param movies: A list of movie data as dictionaries.
+        """
+        with self._write_lock():
+            self._replace(movies)
+
+    def _replace(self, movies: List[Dict]):
+        """
+        Write the cache file through a temporary file renamed over it. Must be called with the write lock held.
+
+        :param movies: A list of movie data as dictionaries.
+        """
+        directory = os.path.dirname(self.file_path)
+        logger.info("Saving cache in %s", self.file_path)
+
+        # Écrit les données dans un fichier temporaire puis le renomme à la place du cache
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".movies_cache-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(movies, f, ensure_ascii=False, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def upsert(self, movies: List[Dict]):
+        """
+        Insert new movies and replace the cached movies with the same ID.
+        A JSON file can only be rewritten as a whole; the cache is read and replaced under the write lock.
+
+        :param movies: A list of movie data as dictionaries.
+        """
+        if not movies:
+            return
+        with self._write_lock():
+            cached_movies = self.load()
+            positions = {m.get("id"): i for i, m in enumerate(cached_movies)}
+            for movie in movies:
+                if movie.get("id") in positions:
+                    cached_movies[positions[movie.get("id")]] = movie
+                else:
+                    positions[movie.get("id")] = len(cached_movies)
+                    cached_movies.append(movie)
+            self._replace(cached_movies)
+
+
+class SqliteCacheBackend:
+    """
+    Movie cache stored in an SQLite database, one row per movie.
+
+    Upserts only write the changed rows. The database runs in WAL mode, so the gunicorn workers can
+    read it while another process writes, and every write is an atomic transaction. A counter in the
+    `meta` table is incremented by each write and used as the cache version.
+    """
+
+    def __init__(self, file_path: str, import_path: str = ""):
+        """
+        Initializes a SqliteCacheBackend instance. The database is created on first use.
+
+        :param file_path: The path to the SQLite database.
+        :param import_path: A JSON cache file imported when the database is created.
+        """
+        self.file_path = file_path
+        self.import_path = import_path
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open a connection, creating the database on first use.
+
+        :return: A connection to the database.
+        """
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    self._initialize()
+        connection = sqlite3.connect(self.file_path, timeout=30)
+        connection.execute("PRAGMA busy_timeout = 30000")
+        return connection
+
+    def _initialize(self):
+        """
+        Create the tables and import the JSON cache, in one transaction: an interrupted import leaves
+        no `imported` marker in the `meta` table, so it is rolled back and done again on next use.
+        """
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        with closing(sqlite3.connect(self.file_path, timeout=30, isolation_level=None)) as connection:
+            connection.execute("PRAGMA busy_timeout = 30000")
+            connection.execute("PRAGMA journal_mode = WAL")
+            # Verrou d'écriture dès le début : un seul processus importe le cache JSON
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS movies ("
+                    " position INTEGER PRIMARY KEY AUTOINCREMENT,"
+                    " id INTEGER UNIQUE,"
+                    " data TEXT NOT NULL)"
+                )
+                connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+                connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+                imported = connection.execute("SELECT 1 FROM meta WHERE key = 'imported'").fetchone()
+                if imported is None:
+                    # Les bases créées avant le marqueur ont été importées si elles contiennent des films
+                    has_movies = connection.execute("SELECT 1 FROM movies LIMIT 1").fetchone()
+                    if not has_movies and self.import_path and os.path.exists(self.import_path):
+                        logger.info("Importing %s into %s", self.import_path, self.file_path)
+                        self._write(connection, JsonCacheBackend(self.import_path).load())
+                    connection.execute("INSERT INTO meta (key, value) VALUES ('imported', 1)")
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        self._initialized = True
+
+    def exists(self) -> bool:
+        """
+        Check whether the cache exists (the database, or the JSON file it will import).
+
+        :return: True if the cache exists.
+        """
+        return os.path.exists(self.file_path) or bool(self.import_path and os.path.exists(self.import_path))
+
+    def load(self) -> List[Dict]:
+        """
+        Load the whole cache.
+
+        :return: A list of cached movies as dictionaries, in insertion order.
+        """
+        if not self.exists():
+            return []
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT data FROM movies ORDER BY position").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def version(self) -> str:
+        """
+        Build a version ID of the cache.
+
+        :return: The write counter of the database (empty if the cache does not exist).
+        """
+        if not self.exists():
+            return ""
+        with closing(self._connect()) as connection:
+            (value,) = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return f"sqlite-{value}"
+
+    def _write(self, connection: sqlite3.Connection, movies: List[Dict]):
+        """
+        Upsert movies and increment the version counter inside the current transaction.
+
+        :param connection: An open connection.
+        :param movies: A list of movie data as dictionaries.
+        """
+        connection.executemany(
+            "INSERT INTO movies (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+            [(m.get("id"), json.dumps(m, ensure_ascii=False)) for m in movies],
+        )
+        connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def save(self, movies: List[Dict]):
+        """
+        Replace the whole cache in one transaction.
+
+        :param movies: A list of movie data as dictionaries.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM movies")
+            self._write(connection, movies)
+
+    def upsert(self, movies: List[Dict]):
+        """
+        Insert new movies and replace the cached movies with the same ID, writing only those rows.
+
+        :param movies: A list of movie data as dictionaries.
+        """
+        if not movies:
+            return
+        with closing(self._connect()) as connection, connection:
+            self._write(connection, movies)
+
+
+_backends: Dict[str, object] = {}
+_backends_lock = threading.Lock()
+
+
+def get_cache_backend(file_path: str):
+    """
+    Return the cache backend selected by CACHE_BACKEND for a cache file.
+
+    With the "sqlite" backend, the database sits next to the JSON file (same name, `.sqlite3`
+    extension) and the JSON file is imported when the database is created.
+
+    :param file_path: The path to the JSON cache file.
+    :return: A JsonCacheBackend or a SqliteCacheBackend.
+    """
+    with _backends_lock:
+        if file_path not in _backends:
+            if CACHE_BACKEND == "sqlite":
+                sqlite_path = os.path.splitext(file_path)[0] + ".sqlite3"
+                _backends[file_path] = SqliteCacheBackend(sqlite_path, import_path=file_path)
+            else:
+                _backends[file_path] = JsonCacheBackend(file_path)
+        return _backends[file_path]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
 
 def load_cache(file_path: str) -> List[Dict]:
     """
@@ -10,26 +302,44 @@ def load_cache(file_path: str) -> List[Dict]:
     :param file_path: The path to the cache file.
     :return: A list of cached movies as dictionaries.
     """
+    return get_cache_backend(file_path).load()
 
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+
+def cache_exists(file_path: str) -> bool:
+    """
+    Check whether the cache exists.
+
+    :param file_path: The path to the cache file.
+    :return: True if the cache exists.
+    """
+    return get_cache_backend(file_path).exists()
+
+
+def get_cache_version(file_path: str) -> str:
+    """
+    Build a version ID of the cache, which changes with every write.
+
+    :param file_path: The path to the cache file.
+    :return: The version ID (empty if the cache does not exist).
+    """
+    return get_cache_backend(file_path).version()
 
 
 def save_cache(movies: List[Dict], file_path: str):
     """
-    Save movie data to a specified JSON cache file.
+    Save movie data to a specified JSON cache file, replacing its content.
 
     :param movies: A list of movie data as dictionaries.
     :param file_path: The full path to the cache file.
     """
+    get_cache_backend(file_path).save(movies)
 
-    # Crée le répertoire parent s'il n'existe pas
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-    print("trying to save cache in " + file_path)
+def upsert_cache(movies: List[Dict], file_path: str):
+    """
+    Add movies to the cache, replacing the cached movies with the same ID.
 
-    # Écrit les données dans le fichier
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(movies, f, ensure_ascii=False, indent=4)
+    :param movies: A list of movie data as dictionaries.
+    :param file_path: The full path to the cache file.
+    """
+    get_cache_backend(file_path).upsert(movies)
@@ -0,0 +1,295 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from typing import List, Dict, Optional, Iterator, Union
+
+import numpy as np
+
+from backend.config.constants import CACHE_PATH, CATALOGUE_SNAPSHOT_PATH
+from backend.models.python.MovieTable import MovieTable
+from backend.utils.cache_manager import load_cache, get_cache_version, cache_exists
+
+logger = logging.getLogger(__name__)
+
+# Layout of a snapshot file (little-endian):
+#   MAGIC | header length (uint32) | JSON header | padding to 8 bytes | body
+# The header gives the version of the cache the snapshot was compiled from, a CRC32 of the body and the
+# offset, type and length of each column in the body. Columns are aligned on 8 bytes so they can be
+# mapped as NumPy arrays without copy.
+MAGIC = b"ESMSNAP\x00"
+SNAPSHOT_FORMAT_VERSION = 1
+ALIGNMENT = 8
+
+# Numeric columns of a MovieTable and their type in the snapshot
+NUMERIC_COLUMNS = {
+    "ids": "<i8",
+    "years": "<i4",
+    "popularity": "<f8",
+    "vote_average": "<f8",
+    "adult": "|b1",
+    "language_codes": "<i2",
+    "genre_offsets": "<i8",
+    "genre_values": "<i4",
+    "genre_bitmask": "<u8",
+}
+
+# String columns of a MovieTable, stored as references to the interned string table
+STRING_COLUMNS = ("titles", "release_dates", "poster_paths")
+
+
+class StringColumn:
+    """
+    A read-only column of strings stored in a snapshot: each row refers to an entry of the interned
+    string table, decoded on access.
+    """
+
+    def __init__(self, refs: np.ndarray, string_offsets: np.ndarray, string_data: memoryview):
+        """
+        Initializes a StringColumn instance.
+
+        :param refs: Index of the string of each row in the string table.
+        :param string_offsets: Start of each string in `string_data` (one more entry than strings).
+        :param string_data: The UTF-8 encoded strings, concatenated.
+        """
+        self.refs = refs
+        self.string_offsets = string_offsets
+        self.string_data = string_data
+
+    def __getitem__(self, row: Union[int, slice]) -> Union[str, "StringColumn"]:
+        """
+        Gets the string of a row, or a column of a slice of rows.
+        """
+        if isinstance(row, slice):
+            return StringColumn(self.refs[row], self.string_offsets, self.string_data)
+        ref = self.refs[row]
+        return bytes(self.string_data[self.string_offsets[ref]:self.string_offsets[ref + 1]]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterates over the strings of the column.
+        """
+        return (self[row] for row in range(len(self)))
+
+    def __len__(self) -> int:
+        """
+        Number of rows of the column.
+        """
+        return len(self.refs)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Writing
+# ----------------------------------------------------------------------------------------------------------------------
+
+def _padding(length: int) -> bytes:
+    """
+    Returns the zero bytes aligning a length on ALIGNMENT.
+    """
+    return b"\x00" * (-length % ALIGNMENT)
+
+
+def write_snapshot(movies: List[Dict], source_version: str, snapshot_path: str = CATALOGUE_SNAPSHOT_PATH):
+    """
+    Compiles movies into a snapshot file. The file is written to a temporary file, then renamed over
+    the snapshot, so workers mapping the previous snapshot keep a complete file.
+
+    :param movies: The movies as dictionaries (as stored in the cache).
+    :param source_version: Version ID of the cache the movies were loaded from.
+    :param snapshot_path: Path to the snapshot file.
+    """
+    table = MovieTable(movies)
+
+    # Table de chaînes internées : chaque chaîne distincte n'est stockée qu'une fois
+    strings: Dict[str, int] = {}
+    columns: Dict[str, np.ndarray] = {}
+    for name in NUMERIC_COLUMNS:
+        if getattr(table, name) is not None:
+            columns[name] = np.ascontiguousarray(getattr(table, name), dtype=NUMERIC_COLUMNS[name])
+    for name in STRING_COLUMNS:
+        columns[name] = np.array([strings.setdefault(value or "", len(strings)) for value in getattr(table, name)],
+                                 dtype="<u4")
+    encoded_strings = [value.encode("utf-8") for value in strings]
+    columns["string_offsets"] = np.zeros(len(encoded_strings) + 1, dtype="<u8")
+    columns["string_offsets"][1:] = np.cumsum([len(value) for value in encoded_strings])
+
+    body = bytearray()
+    sections = {}
+    for name, column in columns.items():
+        sections[name] = {"offset": len(body), "dtype": column.dtype.str, "length": len(column)}
+        body += column.tobytes()
+        body += _padding(len(body))
+    sections["string_data"] = {"offset": len(body), "dtype": "|u1", "length": int(columns["string_offsets"][-1])}
+    body += b"".join(encoded_strings)
+
+    header = json.dumps({
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "source_version": source_version,
+        "count": len(table),
+        "languages": table.languages,
+        "genres": table.genres,
+        "checksum": zlib.crc32(body),
+        "sections": sections,
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += _padding(len(prefix))
+
+    directory = os.path.dirname(snapshot_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".catalogue_snapshot-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(prefix)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        # Le checksum est vérifié une fois ici, avant la publication, et non à chaque chargement
+        if not verify_snapshot(tmp_path):
+            raise ValueError(f"Catalogue snapshot {tmp_path} does not match its checksum")
+        os.replace(tmp_path, snapshot_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def get_snapshot_path(cache_path: str) -> str:
+    """
+    Returns the path of the snapshot of a cache file: next to it, with the `.snapshot` extension
+    (CATALOGUE_SNAPSHOT_PATH for the default cache).
+
+    :param cache_path: The path to the cache file.
+    :return: The path to its snapshot file.
+    """
+    return os.path.splitext(cache_path)[0] + ".snapshot"
+
+
+def build_snapshot(cache_path: str = CACHE_PATH, snapshot_path: str = CATALOGUE_SNAPSHOT_PATH) -> bool:
+    """
+    Compiles the movie cache into a snapshot file.
+
+    :param cache_path: The path to the cache file.
+    :param snapshot_path: Path to the snapshot file.
+    :return: True if a snapshot was written, False if there is no cache.
+    """
+    if not cache_exists(cache_path):
+        return False
+    # La version est lue avant le cache : une écriture concurrente rend le snapshot obsolète, jamais incohérent
+    version = get_cache_version(cache_path)
+    write_snapshot(load_cache(cache_path), version, snapshot_path)
+    return True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Loading
+# ----------------------------------------------------------------------------------------------------------------------
+
+def read_snapshot_header(buffer) -> Dict:
+    """
+    Reads the header of a snapshot.
+
+    :param buffer: The content of the snapshot file.
+    :return: The header, with the start of the body in "body_offset".
+    :raises ValueError: If the file is not a snapshot of a supported format.
+    """
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a catalogue snapshot")
+    (header_length,) = struct.unpack_from("<I", buffer, len(MAGIC))
+    start = len(MAGIC) + 4
+    header = json.loads(bytes(buffer[start:start + header_length]).decode("utf-8"))
+    if header.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"unsupported snapshot format {header.get('format_version')}")
+    header["body_offset"] = start + header_length + (-(start + header_length) % ALIGNMENT)
+    return header
+
+
+def verify_snapshot(snapshot_path: str) -> bool:
+    """
+    Checks the checksum of the body of a snapshot file. This reads the whole file, so it is done once
+    when the snapshot is written, not by the workers mapping it.
+
+    :param snapshot_path: Path to the snapshot file.
+    :return: True if the file is a snapshot whose body matches its checksum.
+    """
+    try:
+        with open(snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            header = read_snapshot_header(buffer)
+            with memoryview(buffer)[header["body_offset"]:] as body:
+                return zlib.crc32(body) == header["checksum"]
+    except (OSError, ValueError, KeyError, struct.error):
+        return False
+
+
+def load_snapshot(snapshot_path: str = CATALOGUE_SNAPSHOT_PATH, expected_version: Optional[str] = None,
+                  verify: bool = False) -> Optional[MovieTable]:
+    """
+    Maps a snapshot file into memory as a MovieTable. The columns are read directly from the mapped
+    pages, which the operating system shares between the processes mapping the same file, and only
+    the pages of the rows used are read.
+
+    :param snapshot_path: Path to the snapshot file.
+    :param expected_version: Version ID of the current cache; a snapshot compiled from another version is stale.
+    :param verify: If True, check the checksum of the body again (reads every page; `write_snapshot`
+        already checked it before publishing the file).
+    :return: The MovieTable of the snapshot, or None if it is missing, stale or invalid.
+    """
+    if not os.path.exists(snapshot_path):
+        return None
+    body = None
+    try:
+        with open(snapshot_path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        logger.error("Cannot map catalogue snapshot %s: %s", snapshot_path, e)
+        return None
+
+    try:
+        header = read_snapshot_header(buffer)
+        if expected_version is not None and header["source_version"] != expected_version:
+            logger.debug("Catalogue snapshot is stale (%s != %s)", header["source_version"], expected_version)
+            buffer.close()
+            return None
+        body = memoryview(buffer)[header["body_offset"]:]
+        if verify and zlib.crc32(body) != header["checksum"]:
+            raise ValueError("checksum mismatch")
+    except (ValueError, KeyError, struct.error) as e:
+        logger.error("Invalid catalogue snapshot %s: %s", snapshot_path, e)
+        if body is not None:
+            body.release()
+        buffer.close()
+        return None
+
+    def section(name: str) -> np.ndarray:
+        info = header["sections"][name]
+        return np.frombuffer(body, dtype=info["dtype"], count=info["length"], offset=info["offset"])
+
+    string_offsets = section("string_offsets")
+    string_data = body[header["sections"]["string_data"]["offset"]:]
+    columns = {name: section(name) if name in header["sections"] else None for name in NUMERIC_COLUMNS}
+    columns.update({name: StringColumn(section(name), string_offsets, string_data) for name in STRING_COLUMNS})
+    return MovieTable.from_columns(
+        languages=header["languages"],
+        genres=header["genres"],
+        _buffer=buffer,  # Garde le fichier mappé tant que la table est utilisée
+        **columns,
+    )
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Main Execution Block
+# ----------------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    """
+    Compiles the movie cache into a catalogue snapshot:
+        python -m backend.utils.catalogue_snapshot [cache_path] [snapshot_path]
+    """
+    source_path = sys.argv[1] if len(sys.argv) > 1 else CACHE_PATH
+    target_path = sys.argv[2] if len(sys.argv) > 2 else CATALOGUE_SNAPSHOT_PATH
+    if build_snapshot(source_path, target_path):
+        print(f"Catalogue snapshot written to {target_path}")
+    else:
+        print(f"No movie cache at {source_path}, no snapshot written.")
@@ -0,0 +1,153 @@
+import threading
+from typing import List, Dict, Optional, Set
+
+from backend.config.constants import CACHE_PATH
+from backend.utils.cache_manager import load_cache, get_cache_version
+from backend.utils.metrics import span
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalize a movie title for lookups (surrounding spaces and case are ignored).
+
+    :param title: The movie title.
+    :return: The normalized title.
+    """
+    return title.strip().lower()
+
+
+class MovieCatalogue:
+    """
+    An immutable snapshot of the movie cache with hash indexes by ID and by normalized title.
+
+    Attributes:
+        version (str): Version ID of the cache file the snapshot was loaded from.
+        movies (List[Dict]): The cached movies, in cache order.
+    """
+
+    def __init__(self, movies: List[Dict], version: str):
+        """
+        Builds the indexes of the catalogue. When several movies share an ID or a title,
+        the first one in cache order is indexed.
+
+        :param movies: The cached movies as dictionaries.
+        :param version: Version ID of the cache file.
+        """
+        self.version = version
+        self.movies = movies
+        self._by_id: Dict[int, Dict] = {}
+        self._by_title: Dict[str, Dict] = {}
+        for movie in movies:
+            self._by_id.setdefault(movie.get("id"), movie)
+            self._by_title.setdefault(normalize_title(movie.get("title", "")), movie)
+
+    def find_by_id(self, movie_id: int) -> Optional[Dict]:
+        """
+        Find a movie by its ID.
+
+        :param movie_id: The ID of the movie.
+        :return: The movie data, or None if it is not in the catalogue.
+        """
+        return self._by_id.get(movie_id)
+
+    def find_by_title(self, title: str) -> Optional[Dict]:
+        """
+        Find a movie by its title (case-insensitive).
+
+        :param title: The title of the movie.
+        :return: The movie data, or None if it is not in the catalogue.
+        """
+        return self._by_title.get(normalize_title(title))
+
+    def __contains__(self, movie_id: int) -> bool:
+        """
+        Check whether a movie ID is in the catalogue.
+        """
+        return movie_id in self._by_id
+
+    def __len__(self) -> int:
+        """
+        Number of movies in the catalogue.
+        """
+        return len(self.movies)
+
+
+_catalogues: Dict[str, MovieCatalogue] = {}
+_catalogues_lock = threading.Lock()
+_watched: Set[str] = set()  # Cache files whose new versions are published by a background thread
+
+
+def watch_catalogue(cache_path: str = CACHE_PATH):
+    """
+    Hands the reloads of a cache file over to a background thread (the catalogue refresher): requests
+    then use the published catalogue as it is, without checking the file, and only that thread loads
+    the new versions and publishes them with `publish_catalogue`.
+
+    :param cache_path: The path to the cache file.
+    """
+    _watched.add(cache_path)
+
+
+def is_watched(cache_path: str) -> bool:
+    """
+    Check whether the new versions of a cache file are published by a background thread.
+
+    :param cache_path: The path to the cache file.
+    :return: True if `watch_catalogue` was called for the file.
+    """
+    return cache_path in _watched
+
+
+def load_catalogue(cache_path: str = CACHE_PATH) -> MovieCatalogue:
+    """
+    Load the current version of a cache file, without publishing it.
+
+    :param cache_path: The path to the cache file.
+    :return: The MovieCatalogue of the cache file.
+    """
+    version = get_cache_version(cache_path)
+    with span("cache_load"):
+        return MovieCatalogue(load_cache(cache_path), version)
+
+
+def publish_catalogue(cache_path: str, catalogue: MovieCatalogue):
+    """
+    Publish a catalogue: the next calls of `get_catalogue` return it.
+
+    :param cache_path: The path to the cache file.
+    :param catalogue: The catalogue of the cache file.
+    """
+    _catalogues[cache_path] = catalogue
+
+
+def get_catalogue(cache_path: str = CACHE_PATH) -> MovieCatalogue:
+    """
+    Return the process-wide catalogue of a cache file, reloaded when the file changes.
+
+    When the file is watched (`watch_catalogue`), the published catalogue is returned as it is: the
+    background thread loads and publishes the new versions. Otherwise, checking for changes only
+    costs a `stat` of the file; the JSON is parsed again only when its modification time or size
+    changed. Callers keep a consistent snapshot while a reload builds the next one, and do not wait
+    for a reload running in another thread: they get the previous catalogue until the new one is ready.
+
+    :param cache_path: The path to the cache file.
+    :return: The MovieCatalogue of the cache file.
+    """
+    catalogue = _catalogues.get(cache_path)
+    if catalogue is not None and cache_path in _watched:
+        return catalogue
+    version = get_cache_version(cache_path)
+    if catalogue is not None and catalogue.version == version:
+        return catalogue
+    if catalogue is not None and not _catalogues_lock.acquire(blocking=False):
+        return catalogue
+    if catalogue is None:
+        _catalogues_lock.acquire()
+
+    try:
+        catalogue = _catalogues.get(cache_path)
+        if catalogue is None or (cache_path not in _watched and catalogue.version != version):
+            catalogue = _catalogues[cache_path] = load_catalogue(cache_path)
+        return catalogue
+    finally:
+        _catalogues_lock.release()
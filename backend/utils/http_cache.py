@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+from urllib.parse import urlencode
+
+from backend.config.constants import TMDB_RESPONSE_CACHE_ENABLED, TMDB_RESPONSE_CACHE_PATH, TMDB_RESPONSE_CACHE_SIZE, \
+    TMDB_RESPONSE_CACHE_TTL, TMDB_RESPONSE_CACHE_STALE
+from backend.utils.sqlite_lru import SqliteLRUStore
+
+
+def response_cache_key(url: str, params: Optional[Dict] = None) -> str:
+    """
+    Builds the key of a GET request: its URL and sorted query parameters, without the API key (so
+    that the entries survive a change of key).
+
+    :param url: The full URL.
+    :param params: The query parameters.
+    :return: The URL with its canonical query string.
+    """
+    query = urlencode(sorted((name, str(value)) for name, value in (params or {}).items() if name != "api_key"))
+    return f"{url}?{query}" if query else url
+
+
+def response_ttl(headers: Mapping[str, str], default_ttl: float) -> Optional[float]:
+    """
+    Reads how long a response may be served from the cache, from its Cache-Control header.
+
+    :param headers: The headers of the response.
+    :param default_ttl: The time to live of the cache, also the maximum honored.
+    :return: The time to live in seconds (0 to revalidate before each use), or None if the response
+        must not be stored.
+    """
+    directives = {}
+    for directive in headers.get("Cache-Control", "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    try:
+        return min(float(directives["max-age"]), default_ttl)
+    except (KeyError, ValueError):
+        return default_ttl
+
+
+class CachedResponse(NamedTuple):
+    """
+    A response stored in the HttpResponseCache, with its validators.
+    """
+    body: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated: float  # Time of the last response (200 or 304) from the server
+    expires: float  # Time until which the body is served without asking the server
+
+
+class HttpResponseCache(SqliteLRUStore):
+    """
+    A cache of JSON responses stored in an SQLite database, so that it is shared by all the processes
+    (gunicorn workers, sidecars, scripts) using the same file and survives their restarts.
+
+    Fresh entries are served as they are. Expired entries keep their ETag and Last-Modified to
+    revalidate them with a conditional request, and are still served for `stale_ttl` seconds while
+    one process revalidates them (stale-while-revalidate) or while the server fails. The least
+    recently used entries are evicted beyond `maxsize` (see SqliteLRUStore).
+    """
+
+    def __init__(self, file_path: str, maxsize: int, ttl: float, stale_ttl: float):
+        """
+        Initializes an HttpResponseCache instance, creating the database if needed.
+
+        :param file_path: The path to the SQLite database.
+        :param maxsize: Maximum number of entries.
+        :param ttl: Default time to live of a response in seconds (responses can ask for less).
+        :param stale_ttl: Seconds an expired response is still served while it is revalidated.
+        """
+        super().__init__(
+            file_path,
+            "responses",
+            "body TEXT NOT NULL, etag TEXT, last_modified TEXT, validated REAL NOT NULL, expires REAL NOT NULL,"
+            " revalidating REAL NOT NULL DEFAULT 0",
+            maxsize,
+        )
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Gets a response from the cache, fresh or stale.
+
+        :param key: The key of the request.
+        :return: The cached response, or None if it is missing or expired for longer than `stale_ttl`.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute(
+                "SELECT body, etag, last_modified, validated, expires, last_used FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[4] + self.stale_ttl < now:
+                self._delete(connection, key)
+                return None
+            self._touch(connection, key, row[5], now)
+        return CachedResponse(json.loads(row[0]), row[1], row[2], row[3], row[4])
+
+    def set(self, key: str, body_text: str, etag: Optional[str], last_modified: Optional[str], ttl: float):
+        """
+        Stores a response, evicting the least recently used entries if the cache is full.
+
+        :param key: The key of the request.
+        :param body_text: The JSON body of the response.
+        :param etag: The ETag header of the response.
+        :param last_modified: The Last-Modified header of the response.
+        :param ttl: Time to live of the response in seconds.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            self._insert(connection, key, {"body": body_text, "etag": etag, "last_modified": last_modified,
+                                           "validated": now, "expires": now + ttl}, now)
+
+    def refresh(self, key: str, ttl: float):
+        """
+        Extends a response the server confirmed unchanged (304 Not Modified).
+
+        :param key: The key of the request.
+        :param ttl: Time to live of the response in seconds.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "UPDATE responses SET validated = ?, expires = ?, revalidating = 0, last_used = ? WHERE key = ?",
+                (now, now + ttl, now, key),
+            )
+
+    def claim_revalidation(self, key: str, lease: float) -> bool:
+        """
+        Claims the revalidation of a stale response, so that one process at a time revalidates it.
+
+        :param key: The key of the request.
+        :param lease: Seconds after which another process may claim it (if the revalidation was lost).
+        :return: True if the caller must revalidate the response (False if it is being revalidated, or
+            was revalidated since the caller read it).
+        """
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            cursor = connection.execute(
+                "UPDATE responses SET revalidating = ? WHERE key = ? AND expires < ? AND revalidating < ?",
+                (now + lease, key, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of entries of the cache and how many of them are fresh.
+
+        :return: A dictionary with "size" and "fresh".
+        """
+        with closing(self._connect()) as connection:
+            size, fresh = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(expires >= ?), 0) FROM responses", (time.time(),)
+            ).fetchone()
+        return {"size": size, "fresh": fresh}
+
+
+_cache: Optional[HttpResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[HttpResponseCache]:
+    """
+    Returns the TMDB response cache shared by the processes, or None if TMDB_RESPONSE_CACHE_ENABLED is off.
+
+    :return: The HttpResponseCache instance, or None.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None and TMDB_RESPONSE_CACHE_ENABLED:
+            _cache = HttpResponseCache(TMDB_RESPONSE_CACHE_PATH, TMDB_RESPONSE_CACHE_SIZE, TMDB_RESPONSE_CACHE_TTL,
+                                       TMDB_RESPONSE_CACHE_STALE)
+        return _cache
@@ -0,0 +1,223 @@
+import io
+import math
+import numbers
+from typing import Any, Dict, Iterable, Optional
+
+# Encoding of the data sent to the expert system.
+#
+# S-expressions are read by the Lisp reader (`read-input`, `read-payload`): strings are quoted and
+# escape `"` and `\`. The compact catalogue format (`read-catalogue-lines` in the engine) avoids the
+# general Lisp reader for the large LOAD-CATALOGUE payload: the version on the first line, then one
+# movie per line with tab-separated fields:
+#
+#   id  popularity  vote_average  adult (1/0)  genre IDs (comma-separated)  release_date  original_language
+#   poster_path  title
+#
+# String fields escape backslash, tab, newline and carriage return with a backslash, and \N stands
+# for a missing value.
+
+# Default values of the movie fields, as in `Movie.from_dict`
+MOVIE_DEFAULTS = {
+    "id": 0,
+    "title": "Unknown",
+    "genre_ids": [],
+    "release_date": "Unknown",
+    "popularity": 0.0,
+    "vote_average": 0.0,
+    "adult": False,
+    "original_language": "Unknown",
+    "poster_path": "",
+}
+
+_LISP_STRING_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"'})
+_LINE_FIELD_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+# ---------------------------------------------------------------------------------------------------
+# Values
+# ---------------------------------------------------------------------------------------------------
+
+def movie_field(movie: Dict[str, Any], key: str) -> Any:
+    """
+    Gets a field of a movie dictionary, with the default value of `Movie.from_dict`.
+
+    :param movie: The movie as a dictionary.
+    :param key: The field.
+    :return: The value of the field.
+    """
+    return movie.get(key, MOVIE_DEFAULTS[key])
+
+
+def format_number(value: Any) -> str:
+    """
+    Formats a number so that the Lisp reader and `parse-decimal` read it back: integers as is,
+    other numbers with the shortest decimal representation. Missing and non-finite values are 0.
+
+    :param value: The number (int, float or NumPy scalar), or None.
+    :return: The number as text.
+    """
+    if isinstance(value, numbers.Integral) and not isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, numbers.Real) and math.isfinite(value):
+        return repr(float(value))
+    return "0"
+
+
+def write_lisp_string(buffer: io.StringIO, value: Optional[str]):
+    """
+    Writes a Lisp string literal, escaping `"` and `\\` (NIL if the value is missing).
+
+    :param buffer: The output buffer.
+    :param value: The string.
+    """
+    if value is None:
+        buffer.write("nil")
+    else:
+        buffer.write('"')
+        buffer.write(str(value).translate(_LISP_STRING_ESCAPES))
+        buffer.write('"')
+
+
+def escape_line_field(value: Optional[str]) -> str:
+    """
+    Escapes a string field of the compact catalogue format.
+
+    :param value: The string.
+    :return: The escaped field, or \\N if the value is missing.
+    """
+    return "\\N" if value is None else str(value).translate(_LINE_FIELD_ESCAPES)
+
+
+# ---------------------------------------------------------------------------------------------------
+# S-expressions
+# ---------------------------------------------------------------------------------------------------
+
+def write_movie(buffer: io.StringIO, movie: Dict[str, Any]):
+    """
+    Writes a movie as an association list:
+      ((:title . "Interstellar") (:id . 157336) (:genre_ids . (12 18 878)) ...)
+
+    :param buffer: The output buffer.
+    :param movie: The movie as a dictionary (as stored in the cache or returned by `Movie.to_dict`).
+    """
+    buffer.write("((:title . ")
+    write_lisp_string(buffer, movie_field(movie, "title"))
+    buffer.write(") (:id . ")
+    buffer.write(format_number(movie_field(movie, "id")))
+    buffer.write(") (:genre_ids . (")
+    buffer.write(" ".join(format_number(genre) for genre in movie_field(movie, "genre_ids") or ()))
+    buffer.write(")) (:release_date . ")
+    write_lisp_string(buffer, movie_field(movie, "release_date"))
+    buffer.write(") (:popularity . ")
+    buffer.write(format_number(movie_field(movie, "popularity")))
+    buffer.write(") (:vote_average . ")
+    buffer.write(format_number(movie_field(movie, "vote_average")))
+    buffer.write(") (:adult . ")
+    buffer.write("t" if movie_field(movie, "adult") else "nil")
+    buffer.write(") (:original_language . ")
+    write_lisp_string(buffer, movie_field(movie, "original_language"))
+    buffer.write(")")
+    if movie_field(movie, "poster_path"):
+        buffer.write(" (:poster_path . ")
+        write_lisp_string(buffer, movie_field(movie, "poster_path"))
+        buffer.write(")")
+    buffer.write(")")
+
+
+def write_movies(buffer: io.StringIO, movies: Iterable[Dict[str, Any]]):
+    """
+    Writes a list of movies.
+
+    :param buffer: The output buffer.
+    :param movies: The movies as dictionaries.
+    """
+    buffer.write("(")
+    for i, movie in enumerate(movies):
+        if i:
+            buffer.write(" ")
+        write_movie(buffer, movie)
+    buffer.write(")")
+
+
+def write_user(buffer: io.StringIO, user):
+    """
+    Writes a user and their movies:
+      ((:name . "Alice") (:age . 25) (:movies . (...)) (:mood_movies . (...)))
+
+    :param buffer: The output buffer.
+    :param user: The User.
+    """
+    buffer.write("((:name . ")
+    write_lisp_string(buffer, user.name)
+    buffer.write(") (:age . ")
+    buffer.write(format_number(user.age))
+    buffer.write(") (:movies . ")
+    write_movies(buffer, (movie.to_dict() for movie in user.favorite_movies))
+    buffer.write(") (:mood_movies . ")
+    write_movies(buffer, (movie.to_dict() for movie in user.mood_movies))
+    buffer.write("))")
+
+
+def movie_to_lisp(movie: Dict[str, Any]) -> str:
+    """
+    Encodes a movie as an S-expression.
+
+    :param movie: The movie as a dictionary.
+    :return: The association list of the movie.
+    """
+    buffer = io.StringIO()
+    write_movie(buffer, movie)
+    return buffer.getvalue()
+
+
+def user_to_lisp(user) -> str:
+    """
+    Encodes a user as an S-expression.
+
+    :param user: The User.
+    :return: The association list of the user.
+    """
+    buffer = io.StringIO()
+    write_user(buffer, user)
+    return buffer.getvalue()
+
+
+def users_to_lisp(users: Iterable) -> str:
+    """
+    Encodes a list of users as an S-expression.
+
+    :param users: The users.
+    :return: The list of the association lists of the users.
+    """
+    buffer = io.StringIO()
+    buffer.write("(")
+    for i, user in enumerate(users):
+        if i:
+            buffer.write(" ")
+        write_user(buffer, user)
+    buffer.write(")")
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------------------------------
+# Compact catalogue format
+# ---------------------------------------------------------------------------------------------------
+
+def movie_to_line(movie: Dict[str, Any]) -> str:
+    """
+    Encodes a movie as a line of the compact catalogue format (without the newline).
+
+    :param movie: The movie as a dictionary.
+    :return: The tab-separated fields of the movie.
+    """
+    return "\t".join((
+        format_number(movie_field(movie, "id")),
+        format_number(movie_field(movie, "popularity")),
+        format_number(movie_field(movie, "vote_average")),
+        "1" if movie_field(movie, "adult") else "0",
+        ",".join(format_number(genre) for genre in movie_field(movie, "genre_ids") or ()),
+        escape_line_field(movie_field(movie, "release_date")),
+        escape_line_field(movie_field(movie, "original_language")),
+        escape_line_field(movie_field(movie, "poster_path")),
+        escape_line_field(movie_field(movie, "title")),
+    ))
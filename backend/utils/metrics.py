@@ -0,0 +1,229 @@
+import bisect
+import contextlib
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from backend.config.constants import METRICS_PREFIX
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    """
+    Formats the labels of a sample in the Prometheus text format: {stage="engine",le="0.5"}.
+
+    :param names: The label names.
+    :param values: The label values.
+    :param extra: An additional label, already formatted.
+    :return: The labels between braces, or an empty string without labels.
+    """
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label(value: str) -> str:
+    """
+    Escapes a label value (backslash, double quote and newline).
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    """
+    A monotonically increasing count, with one value per combination of labels.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        """
+        Initializes a Counter instance.
+
+        :param name: Name of the metric (without the prefix).
+        :param documentation: Description of the metric.
+        :param label_names: Names of the labels of the metric.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        """
+        Increments the counter.
+
+        :param label_values: The values of the labels, in the order of `label_names`.
+        :param amount: The increment.
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        """
+        Returns the value of the counter for some labels (0 if never incremented).
+        """
+        return self._values.get(label_values, 0.0)
+
+    def render(self, prefix: str) -> List[str]:
+        """
+        Renders the counter in the Prometheus text format.
+        """
+        name = f"{prefix}{self.name}"
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{name}{format_labels(self.label_names, labels)} {value:g}" for labels, value in values)
+        return lines
+
+
+class Histogram:
+    """
+    A distribution of observed values in fixed buckets, with their count and sum.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """
+        Initializes a Histogram instance.
+
+        :param name: Name of the metric (without the prefix).
+        :param documentation: Description of the metric.
+        :param label_names: Names of the labels of the metric.
+        :param buckets: Upper bounds of the buckets, in increasing order (+Inf is added).
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # Par combinaison de labels : [compte par bucket (+Inf compris), somme]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        """
+        Records an observation.
+
+        :param value: The observed value.
+        :param label_values: The values of the labels, in the order of `label_names`.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(label_values) or self._values.setdefault(
+                label_values, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, *label_values: str) -> int:
+        """
+        Returns the number of observations for some labels.
+        """
+        values = self._values.get(label_values)
+        return sum(values[0]) if values else 0
+
+    def render(self, prefix: str) -> List[str]:
+        """
+        Renders the histogram in the Prometheus text format (cumulative buckets).
+        """
+        name = f"{prefix}{self.name}"
+        lines = [f"# HELP {name} {self.documentation}", f"# TYPE {name} histogram"]
+        with self._lock:
+            values = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._values.items())
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(self.label_names, labels)} {total:.6f}")
+            lines.append(f"{name}_count{format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of the process, rendered together on /metrics.
+
+    Metrics are kept in memory by each process: with several gunicorn workers, each worker exposes
+    its own values (the scraper aggregates them, e.g. with `sum by`).
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        """
+        Initializes an empty registry.
+
+        :param prefix: Prefix of the names of the metrics.
+        """
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        """
+        Returns the counter of a name, created on first use.
+        """
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        Returns the histogram of a name, created on first use.
+        """
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """
+        Renders all the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render(self.prefix))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_duration = registry.histogram("stage_duration_seconds", "Duration of the stages of a recommendation.",
+                                    ("stage",))
+stage_errors = registry.counter("stage_errors_total", "Stages that raised an exception.", ("stage",))
+http_requests = registry.counter("http_requests_total", "HTTP requests answered.", ("endpoint", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "Duration of the HTTP requests.",
+                                           ("endpoint",))
+recommendation_cache_lookups = registry.counter("recommendation_cache_lookups_total",
+                                                "Lookups in the recommendation cache.", ("result",))
+tmdb_response_cache_lookups = registry.counter("tmdb_response_cache_lookups_total",
+                                               "TMDB requests by outcome of the shared response cache "
+                                               "(hit, stale, revalidated, miss, stale_on_error).", ("result",))
+
+
+@contextlib.contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Times a stage of a request into `stage_duration_seconds`, and counts it in `stage_errors_total`
+    if it raises. Spans can be nested (e.g. the catalogue encoding inside the engine call).
+
+    :param stage: Name of the stage (e.g. "resolve_titles", "engine").
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage)
+
+
+def get_metrics_text() -> str:
+    """
+    Returns the metrics of the process in the Prometheus text exposition format.
+    """
+    return registry.render()
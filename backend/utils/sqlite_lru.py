@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Dict
+
+from backend.config.constants import SQLITE_CACHE_TOUCH_INTERVAL, SQLITE_CACHE_EVICTION_INTERVAL
+
+
+class SqliteLRUStore:
+    """
+    A table of entries by key in an SQLite database shared by all the processes using the same file,
+    with the least recently used entries evicted beyond `maxsize`. It is the storage of the SQLite
+    caches (SqliteTTLCache, HttpResponseCache), which add their own columns.
+
+    Reads stay read-only transactions as much as possible: the last use of an entry is only written
+    when it is older than `touch_interval` seconds, so the LRU order is exact to that interval. The
+    size is checked every `eviction_interval` inserts of a process rather than counted on each insert,
+    so the table may exceed `maxsize` by that many entries per process between two evictions.
+    """
+
+    def __init__(
+            self,
+            file_path: str,
+            table: str,
+            columns: str,
+            maxsize: int,
+            touch_interval: float = SQLITE_CACHE_TOUCH_INTERVAL,
+            eviction_interval: int = SQLITE_CACHE_EVICTION_INTERVAL,
+    ):
+        """
+        Initializes a SqliteLRUStore instance, creating the database and the table if needed.
+
+        :param file_path: The path to the SQLite database.
+        :param table: The name of the table.
+        :param columns: The SQL definitions of the columns of an entry, besides `key` and `last_used`.
+        :param maxsize: Maximum number of entries.
+        :param touch_interval: Seconds after which a read writes the last use of an entry again.
+        :param eviction_interval: Number of inserts of the process between two size checks.
+        """
+        self.file_path = file_path
+        self.table = table
+        self.maxsize = maxsize
+        self.touch_interval = touch_interval
+        self.eviction_interval = max(1, eviction_interval)
+        self._inserts = 0
+        self._inserts_lock = threading.Lock()
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode = WAL")
+            with connection:
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, {columns},"
+                                   f" last_used REAL NOT NULL)")
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open a connection to the database.
+        """
+        connection = sqlite3.connect(self.file_path, timeout=30)
+        connection.execute("PRAGMA busy_timeout = 30000")
+        return connection
+
+    def _touch(self, connection: sqlite3.Connection, key: str, last_used: float, now: float):
+        """
+        Records a use of an entry read at `now`, if its last recorded use is old enough.
+
+        :param connection: The connection of the read.
+        :param key: The key of the entry.
+        :param last_used: The last use of the entry read from the table.
+        :param now: The time of the read.
+        """
+        if now - last_used >= self.touch_interval:
+            connection.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key))
+
+    def _insert(self, connection: sqlite3.Connection, key: str, values: Dict[str, Any], now: float):
+        """
+        Inserts or replaces an entry, and evicts the least recently used entries every
+        `eviction_interval` inserts of the process.
+
+        :param connection: The connection of the write.
+        :param key: The key of the entry.
+        :param values: The values of the other columns, by column name.
+        :param now: The time of the write (the last use of the entry).
+        """
+        names = ["key", *values, "last_used"]
+        connection.execute(
+            f"INSERT OR REPLACE INTO {self.table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+            (key, *values.values(), now),
+        )
+        with self._inserts_lock:
+            self._inserts += 1
+            due = self._inserts % self.eviction_interval == 0
+        if due:
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection):
+        """
+        Removes the least recently used entries beyond `maxsize`.
+
+        :param connection: The connection of the write.
+        """
+        (size,) = connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if size > self.maxsize:
+            connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+                (size - self.maxsize,),
+            )
+
+    def _delete(self, connection: sqlite3.Connection, key: str):
+        """
+        Removes an entry.
+
+        :param connection: The connection of the write.
+        :param key: The key of the entry.
+        """
+        connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def delete(self, key: str):
+        """
+        Removes an entry.
+
+        :param key: The key of the entry.
+        """
+        with closing(self._connect()) as connection, connection:
+            self._delete(connection, key)
+
+    def evict(self):
+        """
+        Removes the least recently used entries beyond `maxsize` now.
+        """
+        with closing(self._connect()) as connection, connection:
+            self._evict(connection)
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(f"DELETE FROM {self.table}")
+
+    def size(self) -> int:
+        """
+        Counts the entries.
+
+        :return: The number of entries.
+        """
+        with closing(self._connect()) as connection:
+            (size,) = connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return size
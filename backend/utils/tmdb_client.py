@@ -0,0 +1,259 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.config.constants import TMDB_BASE_URL, TMDB_RATE_LIMIT, TMDB_RATE_BURST, TMDB_MAX_CONCURRENCY, \
+    TMDB_MAX_RETRIES, TMDB_TIMEOUT, TMDB_MAX_IN_FLIGHT, UPSTREAM_QUEUE_TIMEOUT
+from backend.utils.api_key_manager import get_api_key
+from backend.utils.http_cache import HttpResponseCache, CachedResponse, response_cache_key, response_ttl, \
+    get_response_cache
+from backend.utils.metrics import tmdb_response_cache_lookups
+from backend.utils.upstream import UpstreamLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket limiting the request rate.
+
+    Tokens are added at `rate` per second up to `capacity`; each request takes one token and waits
+    when the bucket is empty.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        Initializes a full bucket.
+
+        :param rate: Number of tokens added per second.
+        :param capacity: Maximum number of tokens (allowed burst).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, waiting until one is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class TmdbClient:
+    """
+    A client for the TMDB API sharing one keep-alive session between threads.
+
+    Requests go through a token bucket matching the TMDB rate limit and are retried with
+    exponential backoff on 429 (honoring Retry-After), 5xx and connection errors. Responses can be
+    kept in an HttpResponseCache shared by the workers, and revalidated with conditional requests.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(
+            self,
+            base_url: str = TMDB_BASE_URL,
+            api_key: Optional[str] = None,
+            rate_limit: float = TMDB_RATE_LIMIT,
+            rate_burst: int = TMDB_RATE_BURST,
+            max_retries: int = TMDB_MAX_RETRIES,
+            timeout: float = TMDB_TIMEOUT,
+            pool_size: int = TMDB_MAX_CONCURRENCY,
+            backoff: float = 0.5,
+            max_in_flight: int = TMDB_MAX_IN_FLIGHT,
+            queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT,
+            response_cache: Optional[HttpResponseCache] = None,
+    ):
+        """
+        Initializes a TmdbClient instance.
+
+        :param base_url: The base URL of the API (e.g. a local stub server in tests).
+        :param api_key: The TMDB API key; read from the environment on first request if not given.
+        :param rate_limit: Maximum number of requests per second.
+        :param rate_burst: Number of requests allowed at once.
+        :param max_retries: Number of retries of a failed request.
+        :param timeout: Timeout of a request in seconds.
+        :param pool_size: Number of keep-alive connections kept open.
+        :param backoff: Delay before the first retry in seconds, doubled at each retry.
+        :param max_in_flight: Maximum number of requests in flight.
+        :param queue_timeout: Maximum time waiting for a request slot, in seconds.
+        :param response_cache: The cache of the responses shared by the processes (None to disable it).
+        """
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.response_cache = response_cache
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst)
+        self.limiter = UpstreamLimiter("TMDB", max_in_flight, queue_timeout)
+        self.session = requests.Session()
+        # Enough keep-alive connections for every request in flight
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=max(pool_size, max_in_flight))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path: str) -> str:
+        """
+        Builds the URL of an API path.
+
+        :param path: The path (e.g. "/movie/popular") or a full URL.
+        :return: The full URL.
+        """
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path: str, params: Optional[Dict] = None, max_age: Optional[float] = None) -> Dict:
+        """
+        Performs a GET request on the API, through the shared response cache if the client has one.
+
+        A fresh cached response is returned without a request. A stale one is returned at once and
+        revalidated in the background by a single process; older responses are revalidated with a
+        conditional request before being returned.
+
+        :param path: The path (e.g. "/movie/popular") or a full URL.
+        :param params: The query parameters (the API key is added).
+        :param max_age: If given, cached responses validated more than `max_age` seconds ago are
+            revalidated first (0 always asks the server, e.g. for a catalogue refresh).
+        :return: The decoded JSON response.
+        :raises TimeoutError: If too many requests are already in flight.
+        :raises Exception: If the API answers with an error, or still fails after the retries.
+        """
+        url = self.url(path)
+        params = dict(params or {})
+        if self.response_cache is None:
+            return self._request(url, params).json()
+
+        key = response_cache_key(url, params)
+        cached = self.response_cache.get(key)
+        now = time.time()
+        if cached is not None and (max_age is None or now - cached.validated <= max_age):
+            if now < cached.expires:
+                tmdb_response_cache_lookups.inc("hit")
+                return cached.body
+            if max_age is None:
+                tmdb_response_cache_lookups.inc("stale")
+                self._revalidate_in_background(key, url, params, cached)
+                return cached.body
+        return self._fetch(key, url, params, cached)
+
+    def _request(self, url: str, params: Dict, headers: Optional[Dict] = None) -> requests.Response:
+        """
+        Sends a GET request with the API key, waiting for the rate limit and retrying failures.
+
+        :param url: The full URL.
+        :param params: The query parameters (without the API key).
+        :param headers: Additional headers (e.g. conditional request headers).
+        :return: The response (200, or 304 to a conditional request).
+        :raises Exception: If the API answers with an error, or still fails after the retries.
+        """
+        params = {**params, "api_key": self.api_key or get_api_key()}
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                with self.limiter:
+                    response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise Exception(f"API Error: {e}")
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+
+            if response.status_code in self.RETRY_STATUSES and attempt < self.max_retries:
+                retry_after = response.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** attempt
+                time.sleep(delay)
+                continue
+            if response.status_code not in (200, 304):
+                raise Exception(f"API Error: {response.status_code} - {response.text}")
+            return response
+
+    def _fetch(self, key: str, url: str, params: Dict, cached: Optional[CachedResponse]) -> Dict:
+        """
+        Requests a response from the server (conditionally if it is cached) and stores it in the cache.
+        A cached response is returned instead if the server cannot be reached (stale-if-error).
+        """
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        try:
+            response = self._request(url, params, headers)
+        except Exception as e:
+            if cached is None:
+                raise
+            logger.warning("Serving a stale TMDB response for %s: %s", key, e)
+            tmdb_response_cache_lookups.inc("stale_on_error")
+            return cached.body
+
+        ttl = response_ttl(response.headers, self.response_cache.ttl)
+        if response.status_code == 304 and cached is not None:
+            tmdb_response_cache_lookups.inc("revalidated")
+            if ttl is None:
+                self.response_cache.delete(key)
+            else:
+                self.response_cache.refresh(key, ttl)
+            return cached.body
+        tmdb_response_cache_lookups.inc("miss")
+        body = response.json()
+        if ttl is None:
+            # no-store : l'ancienne réponse ne doit plus être servie
+            self.response_cache.delete(key)
+        else:
+            self.response_cache.set(key, response.text, response.headers.get("ETag"),
+                                    response.headers.get("Last-Modified"), ttl)
+        return body
+
+    def _revalidate_in_background(self, key: str, url: str, params: Dict, cached: CachedResponse):
+        """
+        Revalidates a stale response in a background thread, unless another thread or process does.
+        """
+        # Le bail expire si la revalidation est perdue (processus tué), pour qu'un autre la reprenne
+        lease = self.timeout * (self.max_retries + 1)
+        if not self.response_cache.claim_revalidation(key, lease):
+            return
+
+        def revalidate():
+            try:
+                self._fetch(key, url, params, cached)
+            except Exception as e:
+                logger.warning("Background revalidation of %s failed: %s", key, e)
+
+        threading.Thread(target=revalidate, name="tmdb-revalidate", daemon=True).start()
+
+
+_client: Optional[TmdbClient] = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_tmdb_client() -> TmdbClient:
+    """
+    Returns the TMDB client of the current process (one session and one rate limiter per process,
+    and the response cache shared by all of them).
+
+    :return: The TmdbClient instance.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client, _client_pid = TmdbClient(response_cache=get_response_cache()), os.getpid()
+        return _client
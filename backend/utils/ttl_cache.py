@@ -0,0 +1,206 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from backend.utils.sqlite_lru import SqliteLRUStore
+
+
+class TTLCache:
+    """
+    A thread-safe in-memory cache with least-recently-used eviction and a time to live per entry.
+
+    Attributes:
+        maxsize (int): Maximum number of entries.
+        ttl (float): Time to live of an entry in seconds.
+        hits (int): Number of lookups answered by the cache.
+        misses (int): Number of lookups not found or expired.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Initializes an empty cache.
+
+        :param maxsize: Maximum number of entries; the least recently used entry is evicted beyond it.
+        :param ttl: Time to live of an entry in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Gets a value from the cache.
+
+        :param key: The key of the entry.
+        :return: The cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Stores a value in the cache, evicting the least recently used entries if it is full.
+
+        :param key: The key of the entry.
+        :param value: The value to cache.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every entry of the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counters and the current size of the cache.
+
+        :return: A dictionary with "hits", "misses" and "size".
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class SqliteTTLCache(SqliteLRUStore):
+    """
+    A cache with the interface of TTLCache stored in an SQLite database, so that it is shared by all the
+    processes (e.g. gunicorn workers) using the same file. Values must be JSON-serializable.
+
+    The database runs in WAL mode; the least recently used entries are evicted beyond `maxsize` (see
+    SqliteLRUStore). The hit and miss counters are those of the current process.
+    """
+
+    def __init__(self, file_path: str, maxsize: int, ttl: float):
+        """
+        Initializes a SqliteTTLCache instance, creating the database if needed.
+
+        :param file_path: The path to the SQLite database.
+        :param maxsize: Maximum number of entries.
+        :param ttl: Time to live of an entry in seconds.
+        """
+        super().__init__(file_path, "entries", "value TEXT NOT NULL, expires REAL NOT NULL", maxsize)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Gets a value from the cache.
+
+        :param key: The key of the entry.
+        :return: The cached value, or None if it is missing or expired.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT value, expires, last_used FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] >= now:
+                self._touch(connection, key, row[2], now)
+            elif row is not None:
+                self._delete(connection, key)
+                row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        """
+        Stores a value in the cache, evicting the least recently used entries if it is full.
+
+        :param key: The key of the entry.
+        :param value: The value to cache.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            self._insert(connection, key, {"value": json.dumps(value, ensure_ascii=False), "expires": now + self.ttl},
+                         now)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counters of the current process and the current size of the cache.
+
+        :return: A dictionary with "hits", "misses" and "size".
+        """
+        size = self.size()
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+class RequestCoalescer:
+    """
+    Shares one call between concurrent callers asking for the same key: the first caller runs the
+    function, the others wait for its result (or its exception).
+    """
+
+    def __init__(self):
+        """
+        Initializes a coalescer without in-flight calls.
+        """
+        self._calls: Dict[Hashable, "_InFlightCall"] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """
+        Runs `function` unless a call for the same key is already in flight, in which case its
+        result is returned instead.
+
+        :param key: The key identifying identical calls.
+        :param function: The function to run.
+        :return: The result of the function.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _InFlightCall()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _InFlightCall:
+    """
+    The state of a call shared by a RequestCoalescer.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[Exception] = None
@@ -0,0 +1,59 @@
+import threading
+from typing import Dict
+
+
+class UpstreamLimiter:
+    """
+    Bounds the number of requests in flight to an upstream (TMDB, expert system) in the current process.
+
+    Used as a context manager around a call to the upstream. When the limit is reached, callers wait
+    for a slot up to `queue_timeout` seconds, then fail fast instead of piling up. The semaphore is
+    cooperative under gevent workers, so waiting callers do not block the other requests.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, queue_timeout: float):
+        """
+        Initializes an UpstreamLimiter instance.
+
+        :param name: Name of the upstream, for errors and statistics.
+        :param max_in_flight: Maximum number of requests in flight.
+        :param queue_timeout: Maximum time waiting for a slot, in seconds.
+        """
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "UpstreamLimiter":
+        """
+        Takes a slot.
+
+        :raises TimeoutError: If no slot became available in time.
+        """
+        if not self._semaphore.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise TimeoutError(f"{self.name} is busy: {self.max_in_flight} requests already in flight.")
+        with self._lock:
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Releases the slot.
+        """
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the number of requests in flight and of rejected requests.
+
+        :return: A dictionary with "max_in_flight", "in_flight" and "rejected".
+        """
+        with self._lock:
+            return {"max_in_flight": self.max_in_flight, "in_flight": self.in_flight, "rejected": self.rejected}
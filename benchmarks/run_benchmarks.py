@@ -0,0 +1,293 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Any
+
+from benchmarks.synthetic import generate_catalogue, generate_profiles
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+STAGES = ["load_cache", "load_movies", "movie_from_dict", "get_data_as_lisp", "call_expert_system", "native_engine",
+          "json_parse", "submit_movies"]
+
+
+# ---------------------------------------------------------------------------------------------------
+# Measures
+# ---------------------------------------------------------------------------------------------------
+
+def measure(function: Callable[[int], Any], repeat: int) -> Dict[str, float]:
+    """
+    Times a stage, then measures the peak of the memory it allocates in a last untimed run.
+
+    The first run is reported on its own ("first_ms"): it includes the work memoized by the
+    application (parsed cache, Lisp rendering, worker start-up), which later runs reuse.
+
+    :param function: The stage, called with the number of the run.
+    :param repeat: Number of timed runs.
+    :return: The statistics of the stage, in milliseconds and kilobytes.
+    """
+    times = []
+    for run in range(repeat):
+        start = time.perf_counter()
+        function(run)
+        times.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        function(repeat)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    ordered = sorted(times)
+    return {
+        "runs": repeat,
+        "first_ms": round(times[0], 3),
+        "min_ms": round(ordered[0], 3),
+        "median_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def benchmark_catalogue(size: int, repeat: int, profile_count: int, seed: int, verbose: bool) -> Dict[str, Any]:
+    """
+    Benchmarks every stage of the pipeline on a synthetic catalogue.
+
+    Runs in its own process (see `run_catalogue`): the cache directory, the engine and the disabled
+    recommendation cache are set in the environment before the application is imported.
+
+    :param size: Number of movies of the catalogue.
+    :param repeat: Number of timed runs per stage.
+    :param profile_count: Number of distinct user profiles the runs cycle through.
+    :param seed: Seed of the synthetic data.
+    :param verbose: If True, keep the debug output of the application.
+    :return: The statistics of each stage, and the peak RSS of the process.
+    """
+    from app import app
+    from backend.config.constants import CACHE_PATH, DEFAULT_CANDIDATE_WINDOW, DEFAULT_RECOMMENDATIONS, \
+        EXPERT_SYSTEM_ENGINE, SBCL_EXECUTABLE
+    from backend.models.python.Movie import Movie
+    from backend.models.python.User import User
+    from backend.services.data_formatter import get_data_as_lisp
+    from backend.services.movie_loader import load_movies
+    from backend.services.expert_system_pool import get_expert_system_pool
+    from backend.services.movie_selector import call_expert_system, read_recommendation_lines
+    from backend.services.native_engine import native_recommend_movies
+    from backend.utils.cache_manager import save_cache, load_cache
+
+    output = None if verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+        save_cache(generate_catalogue(size, seed), CACHE_PATH)
+        profiles = generate_profiles(load_cache(CACHE_PATH), profile_count, seed)
+        users = []
+        for profile in profiles:
+            user = User(profile["name"], profile["age"])
+            user.set_movies(profile["favoriteMovies"], profile["moodMovies"])
+            users.append(user)
+        movies_data = load_cache(CACHE_PATH)
+        sbcl_available = os.path.exists(SBCL_EXECUTABLE)
+        client = app.test_client()
+
+        def submit(run: int):
+            response = client.post("/api/submit-movies", json=profiles[run % len(profiles)])
+            if response.status_code != 200:
+                raise Exception(f"/api/submit-movies answered {response.status_code}: {response.get_data(True)}")
+
+        stages: Dict[str, Any] = {}
+        stages["load_cache"] = measure(lambda run: load_cache(CACHE_PATH), repeat)
+        stages["load_movies"] = measure(lambda run: load_movies(size, True, False), repeat)
+        stages["movie_from_dict"] = measure(lambda run: [Movie.from_dict(m) for m in movies_data], repeat)
+        stages["get_data_as_lisp"] = measure(lambda run: get_data_as_lisp(CACHE_PATH, users[run % len(users)]),
+                                             repeat)
+        if sbcl_available:
+            lisp_data = [get_data_as_lisp(CACHE_PATH, user) for user in users]
+            stages["call_expert_system"] = measure(lambda run: call_expert_system(lisp_data[run % len(users)]),
+                                                   repeat)
+            # Sortie brute d'un worker SBCL (protocole serve : lignes JSON puis "END n"), enregistrée une fois
+            lisp_output = get_expert_system_pool().submit(
+                "RECOMMEND", lisp_data[0], {"n": DEFAULT_RECOMMENDATIONS, "window": DEFAULT_CANDIDATE_WINDOW})
+            stages["json_parse"] = measure(lambda run: list(read_recommendation_lines(io.StringIO(lisp_output))),
+                                           repeat)
+        else:
+            stages["call_expert_system"] = {"skipped": f"SBCL not found at {SBCL_EXECUTABLE}"}
+            stages["json_parse"] = {"skipped": f"SBCL not found at {SBCL_EXECUTABLE}"}
+        stages["native_engine"] = measure(
+            lambda run: native_recommend_movies(users[run % len(users)], cache_path=CACHE_PATH), repeat)
+        stages["submit_movies"] = measure(submit, repeat)
+
+    return {
+        "movies": size,
+        "engine": EXPERT_SYSTEM_ENGINE,
+        "stages": stages,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_catalogue(size: int, repeat: int, profile_count: int, seed: int, engine: str,
+                  verbose: bool) -> Dict[str, Any]:
+    """
+    Benchmarks a catalogue size in a fresh process, with its cache in a temporary directory.
+
+    :param size: Number of movies of the catalogue.
+    :param repeat: Number of timed runs per stage.
+    :param profile_count: Number of distinct user profiles.
+    :param seed: Seed of the synthetic data.
+    :param engine: The engine of /api/submit-movies ("sbcl" or "native").
+    :param verbose: If True, keep the debug output of the application.
+    :return: The results of `benchmark_catalogue`.
+    :raises Exception: If the benchmark process failed.
+    """
+    with tempfile.TemporaryDirectory(prefix="es-movies-bench-") as directory:
+        result_path = os.path.join(directory, "result.json")
+        environment = dict(os.environ, CACHE_DIR=directory, EXPERT_SYSTEM_ENGINE=engine,
+                           RECOMMENDATION_CACHE_BACKEND="none")
+        command = [sys.executable, "-m", "benchmarks.run_benchmarks", "--catalogue-worker", str(size),
+                   "--repeat", str(repeat), "--profiles", str(profile_count), "--seed", str(seed),
+                   "--result-path", result_path] + (["--verbose"] if verbose else [])
+        process = subprocess.run(command, env=environment, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if process.returncode != 0:
+            raise Exception(f"Benchmark of {size} movies failed with exit code {process.returncode}")
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def git_commit() -> Optional[str]:
+    """
+    Returns the commit of the benchmarked tree, if it is a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------------------------------------------------------------------------------
+# Comparison
+# ---------------------------------------------------------------------------------------------------
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], max_regression: float,
+                    min_delta_ms: float) -> List[str]:
+    """
+    Compares two benchmark results, stage by stage, on the median time and the allocated memory peak.
+
+    :param baseline: The reference results.
+    :param current: The results to check.
+    :param max_regression: Maximum relative increase allowed (0.2 for +20%).
+    :param min_delta_ms: Time increases below this many milliseconds are ignored (timer noise).
+    :return: The regressions found, one line each.
+    """
+    regressions = []
+    print(f"{'movies':>8} {'stage':<20} {'median ms':>21} {'peak kB':>23}", file=sys.stderr)
+    for size, result in current["results"].items():
+        reference = baseline["results"].get(size)
+        if reference is None:
+            continue
+        for stage in STAGES:
+            old, new = reference["stages"].get(stage, {}), result["stages"].get(stage, {})
+            if "median_ms" not in old or "median_ms" not in new:
+                continue
+            time_change = new["median_ms"] / old["median_ms"] - 1 if old["median_ms"] else 0.0
+            memory_change = new["peak_kb"] / old["peak_kb"] - 1 if old["peak_kb"] else 0.0
+            print(f"{size:>8} {stage:<20} {old['median_ms']:>9.2f} -> {new['median_ms']:>9.2f} "
+                  f"{old['peak_kb']:>10.0f} -> {new['peak_kb']:>10.0f}  "
+                  f"({time_change:+.0%} time, {memory_change:+.0%} memory)", file=sys.stderr)
+            if time_change > max_regression and new["median_ms"] - old["median_ms"] > min_delta_ms:
+                regressions.append(f"{size} movies, {stage}: median {old['median_ms']:.2f} ms -> "
+                                   f"{new['median_ms']:.2f} ms ({time_change:+.0%})")
+            if memory_change > max_regression:
+                regressions.append(f"{size} movies, {stage}: peak {old['peak_kb']:.0f} kB -> "
+                                   f"{new['peak_kb']:.0f} kB ({memory_change:+.0%})")
+    return regressions
+
+
+def check_regressions(baseline_path: str, current: Dict[str, Any], max_regression: float,
+                      min_delta_ms: float) -> int:
+    """
+    Compares results to a baseline file and reports the regressions on stderr.
+
+    :return: The exit code: 1 if a stage regressed, 0 otherwise.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare_results(baseline, current, max_regression, min_delta_ms)
+    for regression in regressions:
+        print(f"[REGRESSION] {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+# ---------------------------------------------------------------------------------------------------
+# Main Execution Block
+# ---------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    """
+    Benchmarks the recommendation pipeline on synthetic catalogues of 1k, 10k and 100k movies:
+        python -m benchmarks.run_benchmarks --output results.json
+    Compares the results with a baseline (exit code 1 on a regression):
+        python -m benchmarks.run_benchmarks --output results.json --baseline baseline.json
+        python -m benchmarks.run_benchmarks --compare baseline.json results.json
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation pipeline on synthetic catalogues.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="catalogue sizes")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per stage")
+    parser.add_argument("--profiles", type=int, default=20, help="distinct user profiles")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument("--engine", choices=["sbcl", "native"], default=None,
+                        help="engine of /api/submit-movies (sbcl when installed, native otherwise)")
+    parser.add_argument("--output", help="JSON file receiving the results (stdout by default)")
+    parser.add_argument("--baseline", help="JSON results to compare with after the run")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="only compare two results")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative increase")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignored time increase, in ms")
+    parser.add_argument("--verbose", action="store_true", help="keep the debug output of the application")
+    parser.add_argument("--catalogue-worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.catalogue_worker:
+        result = benchmark_catalogue(args.catalogue_worker, args.repeat, args.profiles, args.seed, args.verbose)
+        with open(args.result_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    if args.compare:
+        with open(args.compare[1], "r", encoding="utf-8") as f:
+            sys.exit(check_regressions(args.compare[0], json.load(f), args.max_regression, args.min_delta_ms))
+
+    from backend.config.constants import SBCL_EXECUTABLE
+    engine = args.engine or ("sbcl" if os.path.exists(SBCL_EXECUTABLE) else "native")
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"repeat": args.repeat, "profiles": args.profiles, "seed": args.seed, "engine": engine},
+        "results": {},
+    }
+    for catalogue_size in args.sizes:
+        print(f"[Benchmark] {catalogue_size} movies...", file=sys.stderr)
+        results["results"][str(catalogue_size)] = run_catalogue(catalogue_size, args.repeat, args.profiles,
+                                                                args.seed, engine, args.verbose)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    sys.exit(check_regressions(args.baseline, results, args.max_regression, args.min_delta_ms)
+             if args.baseline else 0)
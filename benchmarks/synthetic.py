@@ -0,0 +1,79 @@
+import random
+from typing import List, Dict
+
+# TMDB genre IDs and the original languages most present in the popular movies
+GENRE_IDS = [28, 12, 16, 35, 80, 99, 18, 10751, 14, 36, 27, 10402, 9648, 10749, 878, 10770, 53, 10752, 37]
+LANGUAGES = ["en"] * 12 + ["fr"] * 3 + ["ja", "ko", "es", "it", "de", "hi", "zh", "cn", "pt", "sv"]
+TITLE_WORDS = ["Dark", "Night", "Return", "Last", "Love", "City", "Shadow", "Star", "Lost", "War", "Dream",
+               "Blood", "Summer", "King", "Secret", "Road", "Ocean", "Fire", "Ghost", "Legend", "Winter"]
+
+
+def generate_movie(index: int, rng: random.Random) -> Dict:
+    """
+    Generates a movie shaped like a result of TMDB's /movie/popular, as stored in the cache.
+
+    Titles are unique (they end with the index), so every profile title resolves from the cache.
+
+    :param index: Position of the movie in the catalogue.
+    :param rng: The random generator.
+    :return: The movie as a dictionary.
+    """
+    title = " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 3))) + f" {index}"
+    # Popularity follows a long tail, as in TMDB
+    popularity = round(min(rng.paretovariate(1.2) * 5, 5000.0), 3)
+    has_date = rng.random() > 0.03
+    return {
+        "adult": rng.random() < 0.02,
+        "backdrop_path": f"/b{index}.jpg",
+        "genre_ids": rng.sample(GENRE_IDS, rng.choice([1, 2, 2, 3, 3, 4])),
+        "id": 10_000 + index,
+        "original_language": rng.choice(LANGUAGES),
+        "original_title": title,
+        "overview": " ".join(rng.choice(TITLE_WORDS).lower() for _ in range(rng.randint(20, 60))),
+        "popularity": popularity,
+        "poster_path": f"/p{index}.jpg" if rng.random() > 0.05 else None,
+        "release_date": f"{rng.randint(1940, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        if has_date else "",
+        "title": title,
+        "video": False,
+        "vote_average": round(rng.uniform(2.0, 9.0), 3),
+        "vote_count": rng.randint(0, 30_000),
+    }
+
+
+def generate_catalogue(size: int, seed: int = 0) -> List[Dict]:
+    """
+    Generates a synthetic catalogue, by decreasing popularity like the popular movies of the cache.
+
+    :param size: Number of movies.
+    :param seed: Seed of the random generator (the same seed gives the same catalogue).
+    :return: The movies as dictionaries.
+    """
+    rng = random.Random(seed)
+    movies = [generate_movie(index, rng) for index in range(size)]
+    movies.sort(key=lambda movie: -movie["popularity"])
+    return movies
+
+
+def generate_profiles(movies: List[Dict], count: int, seed: int = 0) -> List[Dict]:
+    """
+    Generates the profiles sent to /api/submit-movies. Their titles are taken among the movies sent to
+    the expert system (the first ones of the cache) that have a release date.
+
+    :param movies: The catalogue.
+    :param count: Number of profiles.
+    :param seed: Seed of the random generator.
+    :return: The profiles ({"name", "age", "favoriteMovies", "moodMovies"}).
+    """
+    rng = random.Random(seed)
+    titles = [movie["title"] for movie in movies[:2000] if movie["release_date"]]
+    return [
+        {
+            "name": f"user{i}",
+            "age": rng.choice([12, 16, 25, 40, 65]),
+            "favoriteMovies": rng.sample(titles, rng.randint(1, 5)),
+            "moodMovies": rng.sample(titles, rng.randint(1, 3)),
+        }
+        for i in range(count)
+    ]
+
@@ -0,0 +1,10 @@
+# Configuration de gunicorn : `gunicorn app:app -c gunicorn.conf.py`
+# GUNICORN_WORKER_CLASS=gevent sert plusieurs requêtes par worker pendant les appels à TMDB et au système expert
+from backend.config.constants import GUNICORN_WORKERS, GUNICORN_WORKER_CLASS, GUNICORN_WORKER_CONNECTIONS, \
+    GUNICORN_TIMEOUT
+
+bind = "0.0.0.0:5000"
+workers = GUNICORN_WORKERS
+worker_class = GUNICORN_WORKER_CLASS
+worker_connections = GUNICORN_WORKER_CONNECTIONS
+timeout = GUNICORN_TIMEOUT
@@ -0,0 +1,94 @@
+import json
+import os
+from typing import Any, Dict, List
+
+import pytest
+
+from backend.config.constants import SBCL_EXECUTABLE
+from backend.models.python.Movie import Movie
+from backend.models.python.User import User
+from backend.utils.cache_manager import save_cache
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name: str) -> Any:
+    """
+    Loads a JSON file of the fixtures directory.
+    """
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def make_users(movies: List[Dict], profiles: List[Dict]) -> List[User]:
+    """
+    Builds users from profiles giving the IDs of their favorite and mood movies.
+
+    :param movies: The catalogue.
+    :param profiles: The profiles ({"name", "age", "favorites", "mood"}).
+    :return: The users.
+    """
+    by_id = {}
+    for movie in movies:
+        by_id.setdefault(movie["id"], movie)
+    users = []
+    for profile in profiles:
+        user = User(profile["name"], profile["age"])
+        user.favorite_movies = [Movie.from_dict(by_id[movie_id]) for movie_id in profile["favorites"]]
+        user.mood_movies = [Movie.from_dict(by_id[movie_id]) for movie_id in profile["mood"]]
+        users.append(user)
+    return users
+
+
+def rewrite_cache(cache_path: str, movies):
+    """
+    Writes a new version of the cache (the version changes with the size and modification time).
+    """
+    save_cache(movies, cache_path)
+    stat = os.stat(cache_path)
+    os.utime(cache_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def assert_same_recommendations(actual: List[Dict], expected: List[Dict]):
+    """
+    Checks that two engines recommend the same movies in the same order, with the same scores.
+    """
+    assert [movie["ID"] for movie in actual] == [movie["ID"] for movie in expected]
+    for movie, reference in zip(actual, expected):
+        assert movie["SCORE"] == pytest.approx(reference["SCORE"], rel=1e-6, abs=1e-9)
+        assert movie["SCORE_DETAILS"] == pytest.approx(reference["SCORE_DETAILS"], rel=1e-6, abs=1e-9)
+
+
+@pytest.fixture(scope="session")
+def catalogue_movies() -> List[Dict]:
+    """
+    The fixed catalogue of the tests (ties, a duplicate ID, movies without date or genre, adult movies).
+    """
+    return load_fixture("catalogue.json")
+
+
+@pytest.fixture(scope="session")
+def fixture_users(catalogue_movies) -> List[User]:
+    """
+    The users of the fixed profiles.
+    """
+    return make_users(catalogue_movies, load_fixture("profiles.json"))
+
+
+@pytest.fixture
+def cache_path(tmp_path, catalogue_movies) -> str:
+    """
+    A movie cache holding the fixed catalogue.
+    """
+    path = str(tmp_path / "movies_cache.json")
+    save_cache(catalogue_movies, path)
+    return path
+
+
+@pytest.fixture
+def requires_sbcl():
+    """
+    Skips the test when SBCL is not installed.
+    """
+    if not os.access(SBCL_EXECUTABLE, os.X_OK):
+        pytest.skip(f"SBCL is not installed ({SBCL_EXECUTABLE})")
@@ -0,0 +1,111 @@
+"""
+A direct Python transcription of `recommend-movies` in the Lisp engine: every movie is scored one
+by one, without profile aggregates, inverted indexes, pruning nor NumPy. It records the expected
+outputs of the parity tests (tests/fixtures/expected_recommendations.json), so that the native
+engine is checked without SBCL:
+
+    python -m tests.reference_engine
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from tests.conftest import FIXTURES_DIR, load_fixture
+
+# Catalogue windows of the parity tests: (n, window)
+WINDOWS = [(5, 50), (10, 20), (3, 3), (8, 200)]
+EXPECTED_PATH = os.path.join(FIXTURES_DIR, "expected_recommendations.json")
+
+
+def movie_year(movie: Dict) -> Optional[int]:
+    """
+    `get-movie-year`: the first four characters of the release date.
+    """
+    release_date = movie.get("release_date") or ""
+    try:
+        return int(release_date[:4]) if len(release_date) >= 4 else None
+    except ValueError:
+        return None
+
+
+def genre_similarity(movie: Dict, user_movies: List[Dict]) -> float:
+    """
+    Percentage of the movie's genres found in the genres of the user's movies.
+    """
+    genres = movie.get("genre_ids") or []
+    user_genres = {genre for user_movie in user_movies for genre in user_movie.get("genre_ids") or []}
+    return 100 * sum(genre in user_genres for genre in genres) / len(genres) if genres else 0.0
+
+
+def score_details(movie: Dict, favorites: List[Dict], mood: List[Dict]) -> Dict[str, float]:
+    """
+    `score-details`: the weighted criteria of the score, whose sum is the score.
+    """
+    user_movies = mood + favorites
+    language = movie.get("original_language")
+    language_similarity = (100 * sum(m.get("original_language") == language for m in user_movies) / len(user_movies)
+                           if user_movies else 0.0)
+    mood_years = [year for year in map(movie_year, mood) if year is not None]
+    year = movie_year(movie)
+    year_penalty = 0.0
+    if mood_years and year is not None:
+        year_penalty = min(1.0, abs(year - sum(mood_years) / len(mood_years)) / 100.0)
+    return {
+        "GENRE_MOOD": 0.3 * genre_similarity(movie, mood),
+        "GENRE_FAVORITES": 0.25 * genre_similarity(movie, favorites),
+        "POPULARITY": 0.15 * (movie.get("popularity", 0.0) / 100.0),
+        "VOTE": 0.25 * (movie.get("vote_average", 0.0) * 10),
+        "LANGUAGE": 0.15 * language_similarity,
+        "YEAR": -0.1 * year_penalty,
+    }
+
+
+def recommend(movies: List[Dict], age: int, favorites: List[Dict], mood: List[Dict],
+              n: int, window: int) -> List[Dict[str, Any]]:
+    """
+    `recommend-movies`: excludes the user's movies (by title) and adult movies for minors, keeps the
+    WINDOW best scores (ties in catalogue order), then the N first movies with distinct IDs.
+    """
+    excluded = {movie.get("title") for movie in favorites + mood}
+    scored = []
+    for position, movie in enumerate(movies):
+        if (age < 18 and movie.get("adult")) or movie.get("title") in excluded:
+            continue
+        details = score_details(movie, favorites, mood)
+        score = (details["GENRE_MOOD"] + details["GENRE_FAVORITES"] + details["POPULARITY"] + details["VOTE"]
+                 + details["LANGUAGE"] + details["YEAR"])
+        scored.append((-score, position, movie, details))
+    scored.sort(key=lambda candidate: candidate[:2])
+
+    recommendations = []
+    seen_ids = set()
+    for negative_score, _, movie, details in scored[:max(window, 0)]:
+        if len(recommendations) < n and movie["id"] not in seen_ids:
+            seen_ids.add(movie["id"])
+            recommendations.append({"ID": movie["id"], "SCORE": -negative_score, "SCORE_DETAILS": details})
+    return recommendations
+
+
+def expected_recommendations(movies: List[Dict], profiles: List[Dict]) -> Dict[str, Dict[str, List]]:
+    """
+    The recommendations of every profile for every window, keyed by "n/window" then by profile name.
+    """
+    by_id = {}
+    for movie in movies:
+        by_id.setdefault(movie["id"], movie)
+    expected = {}
+    for n, window in WINDOWS:
+        expected[f"{n}/{window}"] = {
+            profile["name"]: recommend(movies, profile["age"], [by_id[i] for i in profile["favorites"]],
+                                       [by_id[i] for i in profile["mood"]], n, window)
+            for profile in profiles
+        }
+    return expected
+
+
+if __name__ == "__main__":
+    with open(EXPECTED_PATH, "w", encoding="utf-8") as f:
+        json.dump(expected_recommendations(load_fixture("catalogue.json"), load_fixture("profiles.json")), f,
+                  indent=1)
+        f.write("\n")
+    print(f"Expected recommendations written to {EXPECTED_PATH}")
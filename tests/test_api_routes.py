@@ -0,0 +1,46 @@
+import pytest
+
+from app import app
+from backend.config.constants import MAX_CANDIDATE_WINDOW, MAX_RECOMMENDATIONS
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def profile(**fields):
+    return {"name": "Alice", "age": 30, "favoriteMovies": [], "moodMovies": [], **fields}
+
+
+@pytest.mark.parametrize("limits", [
+    {"n": True},
+    {"window": True},
+    {"n": 0},
+    {"window": -1},
+    {"n": "5"},
+    {"n": MAX_RECOMMENDATIONS + 1},
+    {"window": MAX_CANDIDATE_WINDOW + 1},
+    {"window": 10 ** 12},
+])
+def test_invalid_limits_are_rejected(client, limits):
+    response = client.post("/api/submit-movies", json=profile(**limits))
+    assert response.status_code == 400
+    response = client.post("/api/recommend-batch", json={"users": [profile()], **limits})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("fields", [
+    {"age": -1},
+    {"age": True},
+    {"favoriteMovies": "Inception"},
+    {"moodMovies": None},
+    {"favoriteMovies": ["Inception", 42]},
+    {"moodMovies": [["Inception"]]},
+])
+def test_invalid_profiles_are_rejected(client, fields):
+    response = client.post("/api/submit-movies", json=profile(**fields))
+    assert response.status_code == 400
+    response = client.post("/api/recommend-batch", json={"users": [profile(), profile(**fields)]})
+    assert response.status_code == 400
+    assert response.get_json()["users"] == [1]
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from backend.models.python.User import User
+from backend.services import bulk_recommender, movie_selector, recommendation_cache
+from backend.services.bulk_recommender import recommend_chunk, read_chunks
+from backend.services.native_engine import native_recommend_movies
+
+
+@pytest.fixture
+def bulk_cache(monkeypatch, cache_path):
+    monkeypatch.setattr(bulk_recommender, "CACHE_PATH", cache_path)
+    monkeypatch.setattr(movie_selector, "EXPERT_SYSTEM_ENGINE", "native")
+    monkeypatch.setattr(recommendation_cache, "_cache", None)
+    monkeypatch.setattr(recommendation_cache, "RECOMMENDATION_CACHE_BACKEND", "none")
+    return cache_path
+
+
+def test_each_bad_profile_gets_its_own_error(bulk_cache, fixture_users):
+    titles = [movie.title for movie in fixture_users[0].favorite_movies]
+    lines = [
+        json.dumps({"id": 1, "name": "ok", "age": 30, "favoriteMovies": titles}),
+        "{not json",
+        json.dumps({"id": 2, "name": "no age", "favoriteMovies": titles}),
+        json.dumps({"id": 3, "age": -1}),
+        json.dumps({"id": 4, "age": True}),
+        json.dumps(["not", "a", "profile"]),
+        json.dumps({"id": 5, "age": 30, "favoriteMovies": titles, "moodMovies": ["Unknown title"]}),
+        json.dumps({"id": 6, "name": "minor", "age": 12, "moodMovies": titles}),
+        json.dumps({"id": 7, "age": 30, "favoriteMovies": "".join(titles)}),
+    ]
+    results = [json.loads(line) for line in recommend_chunk(lines, 5, 50)]
+
+    assert len(results) == len(lines)
+    assert [result.get("id") for result in results] == [1, None, 2, 3, 4, None, 5, 6, 7]
+    assert ["error" in result for result in results] == [False, True, True, True, True, True, True, False, True]
+    assert results[2]["error"] == "age must be a non-negative integer"
+    assert "Unknown title" in results[6]["error"]
+
+    user = User("ok", 30)
+    user.favorite_movies = fixture_users[0].favorite_movies
+    expected = native_recommend_movies(user, 5, 50, bulk_cache)
+    assert [movie["ID"] for movie in results[0]["recommendations"]] == [movie["ID"] for movie in expected]
+    assert results[7]["recommendations"]
+
+
+def test_engine_failure_is_reported_on_every_profile(bulk_cache, monkeypatch):
+    def failure(*args):
+        raise TimeoutError("engine saturated")
+
+    monkeypatch.setattr(bulk_recommender, "recommend_movies_batch", failure)
+    lines = [json.dumps({"age": 30}), json.dumps({"age": "30"}), json.dumps({"age": 40})]
+    results = [json.loads(line) for line in recommend_chunk(lines, 5, 50)]
+    assert [result["error"] for result in results] == ["engine saturated", "age must be a non-negative integer",
+                                                       "engine saturated"]
+
+
+def test_read_chunks_skips_blank_lines(tmp_path):
+    path = tmp_path / "profiles.jsonl"
+    path.write_text("a\n\nb\n  \nc\nd\ne\n", encoding="utf-8")
+    with open(path, "r", encoding="utf-8") as f:
+        assert [[line.strip() for line in chunk] for chunk in read_chunks(f, 2)] == [["a", "b"], ["c", "d"], ["e"]]
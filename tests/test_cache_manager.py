@@ -0,0 +1,87 @@
+import os
+import threading
+
+import pytest
+
+from backend.utils.cache_manager import JsonCacheBackend, SqliteCacheBackend
+
+
+def movies(ids, title="Movie"):
+    return [{"id": movie_id, "title": f"{title} {movie_id}"} for movie_id in ids]
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "json":
+        return JsonCacheBackend(str(tmp_path / "movies_cache.json"))
+    return SqliteCacheBackend(str(tmp_path / "movies_cache.sqlite3"))
+
+
+def test_save_replaces_the_cache_and_changes_the_version(backend):
+    assert not backend.exists() and backend.load() == [] and backend.version() == ""
+    backend.save(movies(range(5)))
+    first_version = backend.version()
+    backend.save(movies([7, 8]))
+    assert backend.load() == movies([7, 8])
+    assert backend.version() not in ("", first_version)
+
+
+def test_upsert_keeps_the_order_and_replaces_by_id(backend):
+    backend.save(movies([1, 2, 3]))
+    backend.upsert(movies([2], title="Changed") + movies([4]))
+    assert backend.load() == movies([1]) + movies([2], title="Changed") + movies([3, 4])
+
+
+def test_concurrent_upserts_lose_no_movie(backend):
+    backend.save([])
+    threads = [threading.Thread(target=lambda start=start: [backend.upsert(movies([start + i])) for i in range(20)])
+               for start in range(0, 160, 20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(movie["id"] for movie in backend.load()) == list(range(160))
+
+
+def test_json_writes_leave_no_temporary_file(tmp_path):
+    backend = JsonCacheBackend(str(tmp_path / "movies_cache.json"))
+    backend.save(movies(range(3)))
+    backend.upsert(movies([3]))
+    assert sorted(os.listdir(tmp_path)) == ["movies_cache.json", "movies_cache.json.lock"]
+
+
+def test_sqlite_version_counts_the_writes(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / "movies_cache.sqlite3"))
+    backend.save(movies([1]))
+    backend.upsert(movies([2]))
+    backend.upsert([])
+    assert backend.version() == "sqlite-2"
+
+
+def test_sqlite_imports_the_json_cache_once(tmp_path):
+    json_path = str(tmp_path / "movies_cache.json")
+    sqlite_path = str(tmp_path / "movies_cache.sqlite3")
+    JsonCacheBackend(json_path).save(movies([1, 2]))
+
+    backend = SqliteCacheBackend(sqlite_path, import_path=json_path)
+    assert backend.load() == movies([1, 2])
+    backend.save([])
+    # The `imported` marker keeps an emptied database from importing the JSON cache again
+    assert SqliteCacheBackend(sqlite_path, import_path=json_path).load() == []
+
+
+def test_sqlite_interrupted_import_is_done_again(tmp_path, monkeypatch):
+    json_path = str(tmp_path / "movies_cache.json")
+    sqlite_path = str(tmp_path / "movies_cache.sqlite3")
+    JsonCacheBackend(json_path).save(movies([1, 2]))
+
+    def interrupted_write(self, connection, cached_movies):
+        connection.execute("INSERT INTO movies (id, data) VALUES (1, '{}')")
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as patched:
+        patched.setattr(SqliteCacheBackend, "_write", interrupted_write)
+        with pytest.raises(KeyboardInterrupt):
+            SqliteCacheBackend(sqlite_path, import_path=json_path).load()
+
+    assert SqliteCacheBackend(sqlite_path, import_path=json_path).load() == movies([1, 2])
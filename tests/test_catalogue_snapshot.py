@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from backend.models.python.MovieTable import MovieTable
+from backend.services import movie_loader
+from backend.services.movie_loader import load_movie_table
+from backend.services.native_engine import NativeCatalogue
+from backend.utils.cache_manager import get_cache_version
+from backend.utils.catalogue_snapshot import write_snapshot, load_snapshot, verify_snapshot, build_snapshot, \
+    get_snapshot_path
+from tests.conftest import assert_same_recommendations
+
+NUMERIC_COLUMNS = ("ids", "years", "popularity", "vote_average", "adult", "language_codes", "genre_offsets",
+                   "genre_values", "genre_bitmask")
+STRING_COLUMNS = ("titles", "release_dates", "poster_paths")
+
+
+def assert_same_table(actual: MovieTable, expected: MovieTable):
+    assert len(actual) == len(expected)
+    assert actual.languages == expected.languages and actual.genres == expected.genres
+    for name in NUMERIC_COLUMNS:
+        np.testing.assert_array_equal(getattr(actual, name), getattr(expected, name))
+    for name in STRING_COLUMNS:
+        # Missing strings are stored as empty strings
+        assert [value or "" for value in getattr(actual, name)] == [value or "" for value in getattr(expected, name)]
+
+
+def test_mapped_snapshot_matches_the_table(tmp_path, catalogue_movies, fixture_users):
+    snapshot_path = str(tmp_path / "catalogue.snapshot")
+    write_snapshot(catalogue_movies, "v1", snapshot_path)
+    assert verify_snapshot(snapshot_path)
+
+    table = MovieTable(catalogue_movies)
+    mapped = load_snapshot(snapshot_path, expected_version="v1", verify=True)
+    assert_same_table(mapped, table)
+    assert_same_table(mapped.head(10), table.head(10))
+
+    mapped_catalogue, catalogue = NativeCatalogue(mapped), NativeCatalogue(table)
+    for user in fixture_users:
+        assert_same_recommendations(mapped_catalogue.recommend(user, 5, 50), catalogue.recommend(user, 5, 50))
+
+
+def test_snapshot_of_another_version_is_not_used(tmp_path, catalogue_movies):
+    snapshot_path = str(tmp_path / "catalogue.snapshot")
+    write_snapshot(catalogue_movies, "v1", snapshot_path)
+    assert load_snapshot(snapshot_path, expected_version="v2") is None
+    assert load_snapshot(str(tmp_path / "missing.snapshot")) is None
+
+
+def test_damaged_snapshot_is_rejected(tmp_path, catalogue_movies):
+    snapshot_path = str(tmp_path / "catalogue.snapshot")
+    write_snapshot(catalogue_movies, "v1", snapshot_path)
+    with open(snapshot_path, "r+b") as f:
+        f.seek(-1, 2)
+        last_byte = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last_byte[0] ^ 0xFF]))
+    assert not verify_snapshot(snapshot_path)
+    assert load_snapshot(snapshot_path, verify=True) is None
+
+    with open(snapshot_path, "wb") as f:
+        f.write(b"not a snapshot")
+    assert load_snapshot(snapshot_path) is None
+
+
+def test_stale_snapshot_falls_back_to_the_cache(monkeypatch, cache_path, catalogue_movies):
+    monkeypatch.setattr(movie_loader, "CATALOGUE_SNAPSHOT_ENABLED", True)
+    assert build_snapshot(cache_path, get_snapshot_path(cache_path))
+    table, version = load_movie_table(len(catalogue_movies), True, False, cache_path)
+    assert version == get_cache_version(cache_path) and table._buffer is not None
+
+    # A snapshot of another version of the cache is ignored: the table is built from the cache
+    write_snapshot(catalogue_movies[:10], "other version", get_snapshot_path(cache_path))
+    table, version = load_movie_table(len(catalogue_movies), True, False, cache_path)
+    assert version == get_cache_version(cache_path) and getattr(table, "_buffer", None) is None
+    assert_same_table(table, MovieTable(catalogue_movies))
+
+
+@pytest.mark.parametrize("movies", [[], [{"id": 1}]])
+def test_snapshot_of_small_catalogues(tmp_path, movies):
+    snapshot_path = str(tmp_path / "catalogue.snapshot")
+    write_snapshot(movies, "v1", snapshot_path)
+    assert len(load_snapshot(snapshot_path, verify=True)) == len(movies)
@@ -0,0 +1,82 @@
+import pytest
+
+from backend.services import catalogue_refresher, movie_selector, native_engine
+from backend.services.catalogue_refresher import warm_catalogue
+from backend.services.movie_search import get_title_index
+from backend.services.movie_selector import get_catalogue_payload, recommend_movies, resolve_titles
+from backend.utils import catalogue_store
+from backend.utils.catalogue_store import get_catalogue, watch_catalogue
+from backend.utils.lisp_encoder import movie_to_line
+from tests.conftest import rewrite_cache
+
+
+def test_payload_is_labelled_with_the_catalogue_it_renders(monkeypatch, cache_path, catalogue_movies):
+    monkeypatch.setattr(movie_selector, "EXPERT_SYSTEM_COMPACT_CATALOGUE", True)
+    old = get_catalogue(cache_path)
+    rewrite_cache(cache_path, catalogue_movies[:10])
+    new = get_catalogue(cache_path)
+    assert new.version != old.version
+
+    for catalogue in (old, new):
+        version, *lines = get_catalogue_payload(cache_path, catalogue).splitlines()
+        assert version == catalogue.version
+        assert lines == [movie_to_line(movie) for movie in catalogue.movies]
+
+
+def test_recommendation_cache_key_uses_the_engine_catalogue_version(monkeypatch, cache_path, fixture_users):
+    versions = []
+    monkeypatch.setattr(movie_selector, "EXPERT_SYSTEM_ENGINE", "native")
+    monkeypatch.setattr(movie_selector, "recommendation_cache_key",
+                        lambda user, version, n, window: versions.append(version) or version)
+    monkeypatch.setattr(movie_selector, "get_cached_recommendations", lambda key: None)
+    monkeypatch.setattr(movie_selector, "cache_recommendations", lambda key, recommendations: None)
+
+    recommend_movies(fixture_users[0], cache_path)
+    assert versions == [movie_selector.get_native_catalogue(cache_path).version]
+
+
+def test_watched_catalogue_is_only_reloaded_by_the_refresher(monkeypatch, cache_path, catalogue_movies):
+    monkeypatch.setattr(catalogue_store, "_watched", set())
+    monkeypatch.setattr(catalogue_refresher, "EXPERT_SYSTEM_ENGINE", "native")
+    watch_catalogue(cache_path)
+    old_version = warm_catalogue(cache_path)
+    rewrite_cache(cache_path, catalogue_movies[:10])
+
+    def touch_file(*args, **kwargs):
+        pytest.fail("a request read the cache file")
+
+    with monkeypatch.context() as patched:
+        for module, name in [(catalogue_store, "get_cache_version"), (catalogue_store, "load_cache"),
+                             (native_engine, "get_catalogue_version"), (native_engine, "load_movie_table")]:
+            patched.setattr(module, name, touch_file)
+        assert get_catalogue(cache_path).version == old_version
+        assert native_engine.get_native_catalogue(cache_path).version == old_version
+        assert get_title_index(cache_path).version == old_version
+
+    new_version = warm_catalogue(cache_path)
+    assert new_version != old_version
+    assert len(get_catalogue(cache_path)) == 10
+    assert native_engine.get_native_catalogue(cache_path).version == new_version
+    assert get_title_index(cache_path).version == new_version
+
+
+def test_movies_added_by_a_request_are_published(monkeypatch, cache_path, catalogue_movies):
+    monkeypatch.setattr(catalogue_store, "_watched", set())
+    monkeypatch.setattr(catalogue_refresher, "EXPERT_SYSTEM_ENGINE", "native")
+    new_movie = {**catalogue_movies[0], "id": 10 ** 6, "title": "A Movie Added By A Request"}
+    searches = []
+    monkeypatch.setattr(movie_selector, "search_movie_on_api", lambda title: searches.append(title) or new_movie)
+    watch_catalogue(cache_path)
+    refresher = catalogue_refresher.CatalogueRefresher(cache_path, interval=0)
+    assert refresher.reload_if_changed()
+
+    resolve_titles([new_movie["title"]], cache_path)
+    assert get_catalogue(cache_path).find_by_id(new_movie["id"]) is not None
+    assert get_title_index(cache_path).version == get_catalogue(cache_path).version
+    resolve_titles([new_movie["title"]], cache_path)
+    assert searches == [new_movie["title"]]
+
+    # The refresher then builds the engine structures of the new version
+    assert refresher.reload_if_changed()
+    assert native_engine.get_native_catalogue(cache_path).version == get_catalogue(cache_path).version
+    assert not refresher.reload_if_changed()
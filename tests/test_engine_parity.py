@@ -0,0 +1,57 @@
+import pytest
+
+from backend.services.data_formatter import get_data_as_lisp, get_batch_data_as_lisp
+from backend.services.movie_selector import call_expert_system
+from backend.services.native_engine import native_recommend_movies, native_recommend_movies_batch
+from tests.conftest import assert_same_recommendations, load_fixture
+from tests.reference_engine import WINDOWS
+
+
+@pytest.fixture(scope="module")
+def expected_recommendations():
+    """
+    The recommendations of the fixed profiles recorded by `tests.reference_engine`.
+    """
+    return load_fixture("expected_recommendations.json")
+
+
+@pytest.mark.parametrize("n, window", WINDOWS)
+def test_native_engine_matches_expected_outputs(cache_path, fixture_users, expected_recommendations, n, window):
+    expected = expected_recommendations[f"{n}/{window}"]
+    for user in fixture_users:
+        assert_same_recommendations(native_recommend_movies(user, n, window, cache_path), expected[user.name])
+
+
+@pytest.mark.parametrize("n, window", WINDOWS)
+def test_native_batch_matches_expected_outputs(cache_path, fixture_users, expected_recommendations, n, window):
+    expected = expected_recommendations[f"{n}/{window}"]
+    actual = native_recommend_movies_batch(fixture_users, n, window, cache_path)
+    assert len(actual) == len(fixture_users)
+    for user, user_actual in zip(fixture_users, actual):
+        assert_same_recommendations(user_actual, expected[user.name])
+
+
+@pytest.mark.parametrize("n, window", WINDOWS)
+def test_lisp_engine_matches_expected_outputs(requires_sbcl, cache_path, fixture_users, expected_recommendations,
+                                              n, window):
+    expected = expected_recommendations[f"{n}/{window}"]
+    for user in fixture_users:
+        actual = call_expert_system(get_data_as_lisp(cache_path, user), n=n, window=window)
+        assert_same_recommendations(actual, expected[user.name])
+
+
+@pytest.mark.parametrize("n, window", WINDOWS)
+def test_native_engine_matches_lisp_engine(requires_sbcl, cache_path, fixture_users, n, window):
+    for user in fixture_users:
+        expected = call_expert_system(get_data_as_lisp(cache_path, user), n=n, window=window)
+        actual = native_recommend_movies(user, n, window, cache_path)
+        assert_same_recommendations(actual, expected)
+
+
+@pytest.mark.parametrize("n, window", WINDOWS)
+def test_native_batch_matches_lisp_batch(requires_sbcl, cache_path, fixture_users, n, window):
+    expected = call_expert_system(get_batch_data_as_lisp(cache_path, fixture_users), n=n, window=window, batch=True)
+    actual = native_recommend_movies_batch(fixture_users, n, window, cache_path)
+    assert len(actual) == len(expected) == len(fixture_users)
+    for user_actual, user_expected in zip(actual, expected):
+        assert_same_recommendations(user_actual, user_expected)
@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from backend.services import movie_selector
+from backend.services.expert_system_pool import ExpertSystemWorker
+from backend.services.movie_selector import call_expert_system, read_recommendations
+
+# A stand-in for SBCL speaking the serve protocol: it answers each command with its own payload
+# ("OK" and "ERR" frames, an unframed "DIE"), and writes its stdin back in one-shot mode.
+FAKE_SBCL = '''
+import io, sys
+if "--serve" not in sys.argv:
+    sys.stdout.write(sys.stdin.read())
+    sys.exit(0)
+stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+for header in stdin:
+    command, length = header.split()[:2]
+    payload = stdin.read(int(length))
+    if command == "PING":
+        command, payload = "OK", "PONG"
+    if command == "DIE":
+        stdout.write("garbage")
+        stdout.flush()
+        sys.exit(1)
+    stdout.write(f"{command} {len(payload)}\\n{payload}")
+    stdout.flush()
+'''
+
+RESPONSE = '[{"ID": 1, "TITLE": "Amélie"}]\n[]\n[{"ID": 3, "TITLE": "漢字\\n"}]\nEND 3\n'
+
+
+@pytest.fixture
+def fake_sbcl(tmp_path):
+    path = tmp_path / "sbcl"
+    path.write_text(f"#!{sys.executable}\n{FAKE_SBCL}", encoding="utf-8")
+    os.chmod(path, 0o755)
+    return str(path)
+
+
+@pytest.fixture
+def worker(fake_sbcl):
+    worker = ExpertSystemWorker("unused.lisp", fake_sbcl)
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+def test_response_is_decoded_from_the_frame(worker):
+    assert worker.request("OK", RESPONSE, reader=read_recommendations) == [
+        [{"ID": 1, "TITLE": "Amélie"}], [], [{"ID": 3, "TITLE": "漢字\n"}]]
+    assert worker.request("OK", RESPONSE) == RESPONSE
+
+
+def test_stream_stays_in_sync_after_a_bad_response(worker):
+    # Lines after END and a wrong count: the rest of each frame is read before the next request
+    assert worker.request("OK", RESPONSE + "trailing line\n", reader=read_recommendations)[0][0]["ID"] == 1
+    with pytest.raises(json.JSONDecodeError):
+        worker.request("OK", RESPONSE.replace("END 3", "END 4") + "more\n", reader=read_recommendations)
+    with pytest.raises(json.JSONDecodeError):
+        worker.request("OK", "[]\n", reader=read_recommendations)
+    assert worker.ping()
+    assert worker.request("OK", RESPONSE, reader=read_recommendations)[2][0]["ID"] == 3
+
+
+def test_errors_and_dead_workers(worker):
+    with pytest.raises(subprocess.SubprocessError, match="Error in Lisp script: boom"):
+        worker.request("ERR", "boom", reader=read_recommendations)
+    assert worker.ping()
+    with pytest.raises(subprocess.SubprocessError, match="died"):
+        worker.request("DIE", reader=read_recommendations)
+    worker.process.wait(timeout=5)
+    assert not worker.ping()
+
+
+def test_one_shot_output_is_parsed_from_the_pipe(monkeypatch, fake_sbcl):
+    monkeypatch.setattr(movie_selector, "EXPERT_SYSTEM_USE_POOL", False)
+    monkeypatch.setattr(movie_selector, "SBCL_EXECUTABLE", fake_sbcl)
+    # The fake script writes its input back: the input is the expected output
+    assert call_expert_system(RESPONSE, batch=True)[2] == [{"ID": 3, "TITLE": "漢字\n"}]
+    assert call_expert_system(RESPONSE) == [{"ID": 1, "TITLE": "Amélie"}]
+    with pytest.raises(json.JSONDecodeError):
+        call_expert_system("[]\n" * 10 ** 5)
@@ -0,0 +1,277 @@
+import random
+import struct
+from fractions import Fraction
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from backend.models.python.User import User
+from backend.models.python.Movie import Movie
+from backend.services.movie_selector import call_expert_system, call_expert_system_for_user
+from backend.services.data_formatter import get_data_as_lisp
+from backend.utils.cache_manager import save_cache
+from backend.utils.lisp_encoder import MOVIE_DEFAULTS, movie_to_line, movie_to_lisp
+
+# Characters the titles and other string fields are drawn from: quotes, backslashes, whitespace
+# escaped by the compact format, Lisp syntax and non-ASCII characters
+ALPHABET = list('abcXYZ 019"\\\t\n\r\'()é漢😀.;|#,')
+STRING_FIELDS = ("title", "release_date", "original_language", "poster_path")
+
+
+def single_float(value: float) -> float:
+    """
+    Rounds a number to the nearest single float, as the Lisp reader and `parse-decimal` do.
+    """
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+# ---------------------------------------------------------------------------------------------------
+# Reference decoders (Python ports of `read-catalogue-lines` and of the Lisp reader)
+# ---------------------------------------------------------------------------------------------------
+
+def unescape_field(field: str) -> Optional[str]:
+    """
+    Decodes a string field of the compact format (`unescape-field`).
+    """
+    if field == "\\N":
+        return None
+    out = []
+    i = 0
+    while i < len(field):
+        if field[i] == "\\" and i + 1 < len(field):
+            out.append({"t": "\t", "n": "\n", "r": "\r"}.get(field[i + 1], field[i + 1]))
+            i += 2
+        else:
+            out.append(field[i])
+            i += 1
+    return "".join(out)
+
+
+def parse_decimal(text: str) -> Any:
+    """
+    Parses a number of the compact format (`parse-decimal`): an integer, or the nearest single float.
+    """
+    exponent_start = next((i for i, char in enumerate(text) if char in "eE"), None)
+    mantissa_end = len(text) if exponent_start is None else exponent_start
+    point = text.find(".", 0, mantissa_end)
+    if point < 0 and exponent_start is None:
+        return int(text)
+    digits_start = 1 if text[0] in "+-" else 0
+    integer_end = mantissa_end if point < 0 else point
+    integer_part = int(text[digits_start:integer_end]) if integer_end > digits_start else 0
+    fraction_digits = mantissa_end - point - 1 if point >= 0 else 0
+    fraction = int(text[point + 1:mantissa_end]) if fraction_digits > 0 else 0
+    exponent = int(text[exponent_start + 1:]) if exponent_start is not None else 0
+    value = Fraction(integer_part * 10 ** fraction_digits + fraction) * Fraction(10) ** (exponent - fraction_digits)
+    return single_float(float(-value if text[0] == "-" else value))
+
+
+def parse_line(line: str) -> Dict[str, Any]:
+    """
+    Decodes a movie line of the compact format.
+    """
+    movie_id, popularity, vote_average, adult, genre_ids, release_date, language, poster_path, title = line.split("\t")
+    movie = {
+        "id": int(movie_id),
+        "title": unescape_field(title),
+        "genre_ids": [int(genre) for genre in genre_ids.split(",")] if genre_ids else [],
+        "release_date": unescape_field(release_date),
+        "popularity": parse_decimal(popularity),
+        "vote_average": parse_decimal(vote_average),
+        "adult": adult == "1",
+        "original_language": unescape_field(language),
+    }
+    poster_path = unescape_field(poster_path)
+    if poster_path:
+        movie["poster_path"] = poster_path
+    return movie
+
+
+def read_sexp(text: str) -> Any:
+    """
+    Reads the subset of the Lisp syntax written by `movie_to_lisp`: lists, dotted pairs (returned as
+    tuples), strings, keywords, integers, floats, t and nil.
+    """
+    position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while position < len(text) and text[position] in " \t\n\r":
+            position += 1
+
+    def read():
+        nonlocal position
+        skip_whitespace()
+        char = text[position]
+        if char == "(":
+            position += 1
+            items = []
+            while True:
+                skip_whitespace()
+                if text[position] == ")":
+                    position += 1
+                    return items
+                if text[position] == "." and text[position + 1] == " ":
+                    position += 1
+                    cdr = read()
+                    skip_whitespace()
+                    assert text[position] == ")"
+                    position += 1
+                    return items[0], cdr
+                items.append(read())
+        if char == '"':
+            position += 1
+            out = []
+            while text[position] != '"':
+                if text[position] == "\\":
+                    position += 1
+                out.append(text[position])
+                position += 1
+            position += 1
+            return "".join(out)
+        start = position
+        while position < len(text) and text[position] not in " ()\t\n\r":
+            position += 1
+        token = text[start:position]
+        if token == "nil":
+            return None
+        if token == "t":
+            return True
+        if token.startswith(":"):
+            return token
+        try:
+            return int(token)
+        except ValueError:
+            return single_float(float(token))
+
+    value = read()
+    skip_whitespace()
+    assert position == len(text)
+    return value
+
+
+def parse_sexp_movie(text: str) -> Dict[str, Any]:
+    """
+    Decodes a movie written by `movie_to_lisp`.
+    """
+    movie = {}
+    for key, value in read_sexp(text):
+        if value is None:
+            value = [] if key == ":genre_ids" else False if key == ":adult" else None
+        movie[key[1:]] = value
+    return movie
+
+
+# ---------------------------------------------------------------------------------------------------
+# Random movies
+# ---------------------------------------------------------------------------------------------------
+
+def random_string(rng: random.Random) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 12)))
+
+
+def random_number(rng: random.Random) -> Any:
+    return rng.choice([rng.randint(0, 10 ** 6), rng.uniform(0, 1000), rng.uniform(0, 10), 1e-5 * rng.random(),
+                       0.0, 7.0, rng.randint(0, 10)])
+
+
+def random_movies(count: int, seed: int, missing_rate: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    Generates movies with random string fields and numbers, some fields missing.
+    """
+    rng = random.Random(seed)
+    movies = []
+    for _ in range(count):
+        movie = {
+            "id": rng.randint(1, 10 ** 7),
+            "title": random_string(rng),
+            "genre_ids": rng.sample([12, 18, 28, 35, 878], rng.randint(0, 3)),
+            "release_date": rng.choice([random_string(rng), "2010-01-02"]),
+            "popularity": random_number(rng),
+            "vote_average": random_number(rng),
+            "adult": rng.random() < 0.2,
+            "original_language": random_string(rng),
+            "poster_path": rng.choice(["", random_string(rng)]),
+        }
+        for key in list(movie):
+            if key != "id" and rng.random() < missing_rate:
+                del movie[key]
+        movies.append(movie)
+    return movies
+
+
+def decoded(movie: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The movie the expert system must read back: the defaults of `Movie.from_dict`, floats rounded to
+    single floats, and no poster path when it is empty.
+    """
+    expected = {key: movie.get(key, default) for key, default in MOVIE_DEFAULTS.items()}
+    for key in ("popularity", "vote_average"):
+        if isinstance(expected[key], float):
+            expected[key] = single_float(expected[key])
+    expected["adult"] = bool(expected["adult"])
+    if not expected["poster_path"]:
+        del expected["poster_path"]
+    return expected
+
+
+# ---------------------------------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compact_line_round_trip(seed):
+    for movie in random_movies(2000, seed):
+        line = movie_to_line(movie)
+        assert "\n" not in line and "\r" not in line
+        assert parse_line(line) == decoded(movie)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_sexp_round_trip(seed):
+    for movie in random_movies(2000, seed):
+        assert parse_sexp_movie(movie_to_lisp(movie)) == decoded(movie)
+
+
+def test_special_strings_round_trip():
+    for text in ["", "\\", "\\N", "\\\\N", '"', '\\"', "\t\n\r", "a\\tb", "漢字 😀 é", "(a . b) ; #| |#"]:
+        movie = {"id": 1, "title": text, "release_date": text, "original_language": text, "poster_path": text}
+        assert parse_line(movie_to_line(movie)) == decoded(movie)
+        assert parse_sexp_movie(movie_to_lisp(movie)) == decoded(movie)
+
+
+def recommended_fields(recommendations: List[Dict]) -> Dict[int, Dict[str, Any]]:
+    return {movie["ID"]: {key: movie[key.upper()] for key in STRING_FIELDS if key.upper() in movie}
+            for movie in recommendations}
+
+
+def fuzz_catalogue() -> List[Dict[str, Any]]:
+    """
+    Random movies with distinct IDs, every field present and at least one genre, none adult.
+    """
+    movies = random_movies(300, seed=11, missing_rate=0.0)
+    for movie_id, movie in enumerate(movies, start=1):
+        movie["id"] = movie_id
+        movie["adult"] = False
+        movie["genre_ids"] = movie["genre_ids"] or [18]
+    return movies
+
+
+def test_strings_survive_the_expert_system(requires_sbcl, tmp_path):
+    """
+    The strings sent in both formats come back unchanged in the JSON written by the expert system.
+    """
+    movies = fuzz_catalogue()
+    cache_path = str(tmp_path / "movies_cache.json")
+    save_cache(movies, cache_path)
+    user = User("fuzz", 30)
+    user.favorite_movies = [Movie.from_dict(movies[0])]
+    count = len(movies)
+
+    from_sexp = call_expert_system(get_data_as_lisp(cache_path, user), n=count, window=count)
+    from_lines = call_expert_system_for_user(user, cache_path, n=count, window=count)
+    by_id = {movie["id"]: decoded(movie) for movie in movies}
+    for recommendations in (from_sexp, from_lines):
+        assert recommendations
+        for movie_id, fields in recommended_fields(recommendations).items():
+            assert fields == {key: value for key, value in by_id[movie_id].items() if key in fields}
@@ -0,0 +1,108 @@
+import random
+
+import numpy as np
+import pytest
+
+from backend.models.python.MovieTable import MovieTable
+from backend.services.data_formatter import get_data_as_lisp
+from backend.services.movie_selector import call_expert_system
+from backend.services.native_engine import NativeCatalogue, top_k_indices
+from backend.utils.cache_manager import save_cache
+from tests.conftest import make_users, assert_same_recommendations
+
+WINDOWS = [(1, 1), (3, 2), (5, 5), (5, 10), (5, 50), (10, 200), (20, 1000)]
+
+
+def tied_catalogue(size: int, seed: int):
+    """
+    A catalogue where most movies tie: few genres, languages, years, popularities and votes.
+    """
+    rng = random.Random(seed)
+    return [
+        {
+            "id": 1000 + i // 20 * 20 + (i % 20 if i % 7 else 0),  # Quelques IDs en double
+            "title": f"Movie {i}",
+            "genre_ids": rng.sample([18, 28, 35, 99], rng.randint(0, 2)),
+            "release_date": rng.choice(["2000-01-01", "2010-06-15", ""]),
+            "popularity": rng.choice([10.0, 50.0, 100.0]),
+            "vote_average": rng.choice([5.0, 7.5]),
+            "adult": rng.random() < 0.1,
+            "original_language": rng.choice(["en", "fr", "ja"]),
+            "poster_path": None,
+        }
+        for i in range(size)
+    ]
+
+
+def random_profiles(movies, count: int, seed: int):
+    """
+    Profiles of random movies of a catalogue.
+    """
+    rng = random.Random(seed)
+    ids = sorted({movie["id"] for movie in movies})
+    return [{"name": f"user{i}", "age": rng.choice([12, 30]), "favorites": rng.sample(ids, rng.randint(1, 4)),
+             "mood": rng.sample(ids, rng.randint(0, 3))} for i in range(count)]
+
+
+def full_recommendations(catalogue: NativeCatalogue, user, n: int, window: int):
+    """
+    The recommendations when every movie of the catalogue is scored (no pruning).
+    """
+    profile = catalogue.build_profile(user)
+    return catalogue._select(profile, catalogue.score(profile), catalogue._eligible(user), n, window)
+
+
+@pytest.mark.parametrize("n, window", WINDOWS)
+def test_pruned_scoring_matches_full_scoring(catalogue_movies, fixture_users, n, window):
+    catalogue = NativeCatalogue(MovieTable(catalogue_movies))
+    for user in fixture_users:
+        assert_same_recommendations(catalogue.recommend(user, n, window),
+                                    full_recommendations(catalogue, user, n, window))
+
+
+@pytest.mark.parametrize("n, window", WINDOWS)
+def test_pruned_scoring_matches_full_scoring_with_ties(n, window):
+    movies = tied_catalogue(600, seed=window)
+    catalogue = NativeCatalogue(MovieTable(movies))
+    for user in make_users(movies, random_profiles(movies, 25, seed=n)):
+        assert_same_recommendations(catalogue.recommend(user, n, window),
+                                    full_recommendations(catalogue, user, n, window))
+
+
+def test_batch_scoring_matches_pruned_scoring():
+    movies = tied_catalogue(400, seed=1)
+    catalogue = NativeCatalogue(MovieTable(movies))
+    users = make_users(movies, random_profiles(movies, 40, seed=2))
+    pruned = [catalogue.recommend(user, 5, 20) for user in users]
+    for user_pruned, user_full in zip(pruned, catalogue.recommend_batch(users, 5, 20)):
+        assert_same_recommendations(user_pruned, user_full)
+
+
+def test_movies_without_language_are_scored():
+    movies = tied_catalogue(200, seed=3)
+    for movie in movies[::7]:
+        movie["original_language"] = None
+    catalogue = NativeCatalogue(MovieTable(movies))
+    assert "Unknown" in catalogue.languages
+    for user in make_users(movies, random_profiles(movies, 10, seed=4)):
+        assert_same_recommendations(catalogue.recommend(user, 5, 20), full_recommendations(catalogue, user, 5, 20))
+
+
+@pytest.mark.parametrize("k", [0, 1, 3, 10, 49, 50, 51, 500])
+def test_top_k_keeps_the_earliest_of_tied_scores(k):
+    rng = np.random.default_rng(k)
+    scores = rng.choice([1.0, 2.0, 3.0], size=50)
+    expected = np.argsort(-scores, kind="stable")[:k]
+    assert top_k_indices(scores, k).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("n, window", WINDOWS)
+def test_lisp_pruned_selection_matches_full_scoring(requires_sbcl, tmp_path, n, window):
+    movies = tied_catalogue(600, seed=window)
+    cache_path = str(tmp_path / "movies_cache.json")
+    save_cache(movies, cache_path)
+    catalogue = NativeCatalogue(MovieTable(movies))
+    for user in make_users(movies, random_profiles(movies, 10, seed=n)):
+        expected = full_recommendations(catalogue, user, n, window)
+        assert_same_recommendations(call_expert_system(get_data_as_lisp(cache_path, user), n=n, window=window),
+                                    expected)
@@ -0,0 +1,65 @@
+import pytest
+
+from backend.models.python.Movie import Movie
+from backend.models.python.User import User
+from backend.services import movie_selector, recommendation_cache
+from backend.services.movie_selector import recommend_movies
+from backend.services.native_engine import NativeCatalogue
+from backend.services.recommendation_cache import recommendation_cache_key
+from backend.utils.ttl_cache import TTLCache
+from tests.conftest import rewrite_cache
+
+
+def make_user(favorites, mood=(), age=30) -> User:
+    user = User("user", age)
+    user.favorite_movies = [Movie.from_dict({"id": movie_id}) for movie_id in favorites]
+    user.mood_movies = [Movie.from_dict({"id": movie_id}) for movie_id in mood]
+    return user
+
+
+def key(user: User, version: str = "v1", n: int = 5, window: int = 50, engine: str = "native") -> str:
+    return recommendation_cache_key(user, version, n, window, engine)
+
+
+def test_key_does_not_depend_on_the_order_of_the_movies():
+    assert key(make_user([1, 2, 3], [4, 5])) == key(make_user([3, 1, 2], [5, 4]))
+
+
+def test_key_counts_movies_given_twice():
+    assert key(make_user([1, 1, 2])) != key(make_user([1, 2]))
+    assert key(make_user([1, 1, 2])) == key(make_user([1, 2, 1]))
+
+
+def test_key_separates_favorite_and_mood_movies():
+    assert key(make_user([1], [2])) != key(make_user([2], [1]))
+    assert key(make_user([1, 2])) != key(make_user([1], [2]))
+
+
+def test_key_only_keeps_whether_the_user_is_a_minor():
+    assert key(make_user([1], age=20)) == key(make_user([1], age=65))
+    assert key(make_user([1], age=17)) == key(make_user([1], age=8))
+    assert key(make_user([1], age=17)) != key(make_user([1], age=18))
+
+
+@pytest.mark.parametrize("change", [{"version": "v2"}, {"n": 6}, {"window": 51}, {"engine": "sbcl"}])
+def test_key_changes_with_the_request(change):
+    assert key(make_user([1]), **change) != key(make_user([1]))
+
+
+def test_recommendations_are_recomputed_for_a_new_catalogue(monkeypatch, cache_path, catalogue_movies,
+                                                            fixture_users):
+    monkeypatch.setattr(recommendation_cache, "_cache", TTLCache(100, 3600))
+    monkeypatch.setattr(movie_selector, "EXPERT_SYSTEM_ENGINE", "native")
+    calls = []
+    recommend = NativeCatalogue.recommend
+    monkeypatch.setattr(NativeCatalogue, "recommend",
+                        lambda self, *args: calls.append(self.version) or recommend(self, *args))
+
+    user = fixture_users[0]
+    first = recommend_movies(user, cache_path)
+    assert recommend_movies(user, cache_path) == first
+    assert len(calls) == 1
+
+    rewrite_cache(cache_path, catalogue_movies[::-1])
+    recommend_movies(user, cache_path)
+    assert len(calls) == 2 and calls[0] != calls[1]
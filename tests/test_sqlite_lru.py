@@ -0,0 +1,70 @@
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from backend.utils.http_cache import HttpResponseCache
+from backend.utils.ttl_cache import SqliteTTLCache
+
+
+@pytest.fixture(params=["ttl", "http"])
+def cache(request, tmp_path):
+    if request.param == "ttl":
+        cache = SqliteTTLCache(str(tmp_path / "cache.sqlite3"), maxsize=3, ttl=3600)
+        cache.put = lambda key: cache.set(key, {"key": key})
+    else:
+        cache = HttpResponseCache(str(tmp_path / "cache.sqlite3"), maxsize=3, ttl=3600, stale_ttl=3600)
+        cache.put = lambda key: cache.set(key, '{"key": "%s"}' % key, None, None, 3600)
+    cache.touch_interval = 0
+    cache.eviction_interval = 1
+    return cache
+
+
+def keys(cache):
+    with closing(cache._connect()) as connection:
+        return sorted(key for (key,) in connection.execute(f"SELECT key FROM {cache.table}"))
+
+
+def last_used(cache, key):
+    with closing(cache._connect()) as connection:
+        return connection.execute(f"SELECT last_used FROM {cache.table} WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for key in "abc":
+        cache.put(key)
+    assert cache.get("a") is not None
+    cache.put("d")
+    assert keys(cache) == ["a", "c", "d"]
+
+
+def test_reads_only_write_the_last_use_after_the_interval(cache):
+    cache.put("a")
+    used = last_used(cache, "a")
+    cache.touch_interval = 3600
+    assert cache.get("a") is not None
+    assert last_used(cache, "a") == used
+    cache.touch_interval = 0
+    assert cache.get("a") is not None
+    assert last_used(cache, "a") > used
+
+
+def test_size_is_checked_every_eviction_interval(cache):
+    cache.eviction_interval = 4
+    for key in "abcdefg":
+        cache.put(key)
+    # Inserts 4 and 8 check the size: the cache exceeds maxsize in between
+    assert keys(cache) == list("bcdefg")
+    cache.put("h")
+    assert keys(cache) == ["f", "g", "h"]
+    cache.put("i")
+    cache.evict()
+    assert keys(cache) == ["g", "h", "i"]
+
+
+def test_existing_databases_are_opened(cache, tmp_path):
+    cache.put("a")
+    reopened = type(cache)(cache.file_path, 3, 3600, *([3600] if isinstance(cache, HttpResponseCache) else []))
+    assert reopened.get("a") is not None and reopened.size() == 1
+    with closing(sqlite3.connect(cache.file_path)) as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
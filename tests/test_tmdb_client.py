@@ -0,0 +1,250 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from backend.services import movie_loader
+from backend.services.movie_loader import fetch_movies_from_api
+from backend.utils.http_cache import HttpResponseCache, response_cache_key
+from backend.utils.tmdb_client import TmdbClient
+
+TOTAL_PAGES = 5
+
+
+class StubTmdb:
+    """
+    A local TMDB stub: `respond(path, query)` returns the status, headers and JSON body of each request.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.headers = []
+        self.respond = popular_page
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                stub.headers.append(dict(self.headers))
+                stub.requests.append((url.path, query))
+                status, headers, body = stub.respond(url.path, query)
+                data = json.dumps(body).encode() if status != 304 else b""
+                self.send_response(status)
+                for name, value in {**headers, "Content-Type": "application/json",
+                                    "Content-Length": str(len(data))}.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def pages(self):
+        return sorted(int(query["page"]) for path, query in self.requests if path == "/movie/popular")
+
+
+def popular_page(path, query):
+    page = int(query["page"])
+    results = [{"id": page * 100 + i, "title": f"Movie {page}-{i}"} for i in range(20)]
+    return 200, {}, {"page": page, "total_pages": TOTAL_PAGES, "results": results}
+
+
+def scripted(*statuses, then=popular_page):
+    """
+    Answers the first requests with the given statuses (status, or (status, headers)), then with `then`.
+    """
+    remaining = list(statuses)
+
+    def respond(path, query):
+        if remaining:
+            status, headers = (remaining.pop(0), {}) if isinstance(remaining[0], int) else remaining.pop(0)
+            return status, headers, {"status_message": "stub error"}
+        return then(path, query)
+    return respond
+
+
+@pytest.fixture
+def stub():
+    stub = StubTmdb()
+    thread = threading.Thread(target=stub.server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def make_client(stub, **kwargs):
+    options = {"api_key": "test", "rate_limit": 1000, "rate_burst": 100, "backoff": 0.01, "response_cache": None}
+    return TmdbClient(base_url=stub.url, **{**options, **kwargs})
+
+
+# ---------------------------------------------------------------------------------------------------
+# Retries
+# ---------------------------------------------------------------------------------------------------
+
+def test_retry_after_is_honoured(stub):
+    # Without Retry-After the retry would wait the 10 seconds of the backoff
+    stub.respond = scripted((429, {"Retry-After": "0"}))
+    started = time.monotonic()
+    data = make_client(stub, backoff=10).get("/movie/popular", {"page": 1})
+    assert data["page"] == 1
+    assert time.monotonic() - started < 5
+    assert len(stub.requests) == 2
+    assert stub.requests[0][1]["api_key"] == "test"
+
+
+def test_server_errors_are_retried(stub):
+    stub.respond = scripted(503, 502, 500)
+    assert make_client(stub).get("/movie/popular", {"page": 2})["page"] == 2
+    assert len(stub.requests) == 4
+
+
+def test_error_after_the_last_retry(stub):
+    stub.respond = scripted(*[503] * 10)
+    with pytest.raises(Exception, match="503"):
+        make_client(stub, max_retries=2).get("/movie/popular", {"page": 1})
+    assert len(stub.requests) == 3
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.respond = scripted(404)
+    with pytest.raises(Exception, match="404"):
+        make_client(stub).get("/movie/popular", {"page": 1})
+    assert len(stub.requests) == 1
+
+
+# ---------------------------------------------------------------------------------------------------
+# Shared response cache
+# ---------------------------------------------------------------------------------------------------
+
+@pytest.fixture
+def response_cache(tmp_path):
+    return HttpResponseCache(str(tmp_path / "responses.sqlite3"), maxsize=100, ttl=3600, stale_ttl=3600)
+
+
+def etag_page(stub, etag, cache_control="max-age=3600"):
+    """
+    Answers with a page carrying an ETag, or 304 without a body when the request sends that ETag.
+    """
+    def respond(path, query):
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if stub.headers[-1].get("If-None-Match") == etag:
+            return 304, headers, {}
+        return 200, headers, popular_page(path, query)[2]
+    return respond
+
+
+def page_key(stub, page):
+    return response_cache_key(f"{stub.url}/movie/popular", {"page": page})
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.01)
+
+
+def test_fresh_response_is_served_without_a_request(stub, response_cache):
+    stub.respond = etag_page(stub, '"v1"')
+    client = make_client(stub, response_cache=response_cache)
+    assert client.get("/movie/popular", {"page": 1}) == client.get("/movie/popular", {"page": 1})
+    assert len(stub.requests) == 1
+
+
+def test_not_modified_response_is_revalidated(stub, response_cache):
+    stub.respond = etag_page(stub, '"v1"')
+    client = make_client(stub, response_cache=response_cache)
+    body = client.get("/movie/popular", {"page": 1})
+    validated = response_cache.get(page_key(stub, 1)).validated
+
+    # max_age=0 asks the server: it answers 304 to the conditional request, the cached body is kept
+    assert client.get("/movie/popular", {"page": 1}, max_age=0) == body
+    assert len(stub.requests) == 2 and stub.headers[1]["If-None-Match"] == '"v1"'
+    assert response_cache.get(page_key(stub, 1)).validated > validated
+
+
+def test_stale_response_is_served_while_revalidated(stub, response_cache):
+    stub.respond = etag_page(stub, '"v1"', cache_control="no-cache")
+    client = make_client(stub, response_cache=response_cache)
+    body = client.get("/movie/popular", {"page": 1})
+    validated = response_cache.get(page_key(stub, 1)).validated
+
+    # Expired at once (no-cache): served stale, and revalidated in the background
+    assert client.get("/movie/popular", {"page": 1}) == body
+    wait_for(lambda: response_cache.get(page_key(stub, 1)).validated > validated)
+    assert len(stub.requests) == 2 and stub.headers[1]["If-None-Match"] == '"v1"'
+
+
+def test_no_store_response_is_not_kept(stub, response_cache):
+    stub.respond = etag_page(stub, '"v1"')
+    client = make_client(stub, response_cache=response_cache)
+    client.get("/movie/popular", {"page": 1})
+    assert response_cache.size() == 1
+
+    # A response the server asks not to store removes the cached one
+    stub.respond = etag_page(stub, '"v2"', cache_control="no-store")
+    client.get("/movie/popular", {"page": 1}, max_age=0)
+    assert response_cache.size() == 0
+    client.get("/movie/popular", {"page": 1})
+    assert len(stub.requests) == 3 and response_cache.size() == 0
+
+
+def test_stale_response_is_served_when_the_server_fails(stub, response_cache):
+    stub.respond = etag_page(stub, '"v1"')
+    client = make_client(stub, response_cache=response_cache, max_retries=1)
+    body = client.get("/movie/popular", {"page": 1})
+
+    stub.respond = scripted(*[503] * 10)
+    assert client.get("/movie/popular", {"page": 1}, max_age=0) == body
+    assert len(stub.requests) == 3
+    with pytest.raises(Exception, match="503"):
+        client.get("/movie/popular", {"page": 2})
+
+
+# ---------------------------------------------------------------------------------------------------
+# Checkpoint
+# ---------------------------------------------------------------------------------------------------
+
+@pytest.fixture
+def interrupted_fetch(stub, tmp_path, monkeypatch):
+    """
+    A fetch of 5 pages interrupted by a failing page 4: the other pages are left in the checkpoint.
+    """
+    monkeypatch.setattr(movie_loader, "POPULAR_MOVIES_URL", f"{stub.url}/movie/popular")
+    checkpoint_path = str(tmp_path / "popular_checkpoint.jsonl")
+
+    def page_4_fails(path, query):
+        return (500, {}, {}) if query["page"] == "4" else popular_page(path, query)
+
+    stub.respond = page_4_fails
+    with pytest.raises(Exception, match="500"):
+        fetch_movies_from_api(100, make_client(stub, max_retries=0), checkpoint_path)
+    assert stub.pages() == [1, 2, 3, 4, 5]
+    stub.requests.clear()
+    stub.respond = popular_page
+    return checkpoint_path
+
+
+def test_interrupted_fetch_resumes_from_the_checkpoint(stub, interrupted_fetch):
+    movies = fetch_movies_from_api(100, make_client(stub), interrupted_fetch)
+    assert stub.pages() == [4]
+    assert [movie["id"] for movie in movies] == [page * 100 + i for page in range(1, 6) for i in range(20)]
+
+
+@pytest.mark.parametrize("change", ["language", "age"])
+def test_checkpoint_of_another_fetch_is_discarded(stub, interrupted_fetch, monkeypatch, change):
+    options = {}
+    if change == "language":
+        monkeypatch.setattr(movie_loader, "DEFAULT_LANGUAGE", "en-US")
+    else:
+        options["checkpoint_max_age"] = 0
+    fetch_movies_from_api(100, make_client(stub), interrupted_fetch, **options)
+    assert stub.pages() == [1, 2, 3, 4, 5]